@@ -1,3 +1,11 @@
 from .gpt import GPT
 from .gptbox import GPTBox
 from .chat import ChatAPIError
+from .client import HTTPClient
+from .ratelimit import RequestScheduler
+from .keypool import KeyPool
+from .token import Tokener
+from .store import ConversationStore, SQLiteStore
+from .schedulepool import SchedulePool
+from .memory import RetrievalMemory, HashingEmbedder
+from .schedule import Schedule, CronExpression
@@ -1,10 +1,17 @@
-import aiohttp
+import asyncio
 import logging
 import json
-import httpx
+from typing import Hashable
 from httpx._models import Response
-from .message import MessageBox
+from .client import HTTPClient
+from .keypool import APIKey, KeyPool
+from .ratelimit import RequestScheduler
+from .sse import SSEDecoder
+from .function import FunctionManager
+from .message import BaseMessage, MessageBox
+from .serializer import dumps
 from .setting import Setting
+from .token import Tokener
 from typing import AsyncIterator
 
 logger = logging.getLogger(__name__)
@@ -15,107 +22,224 @@ class ChatAPIError(Exception):
 
 
 class Chat:
-    def __init__(self, api_key: str):
-        self.header = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        }
+    URL = "https://api.openai.com/v1/chat/completions"
+
+    def __init__(
+        self,
+        api_key: str | KeyPool,
+        channel_id: Hashable = None,
+        scheduler: RequestScheduler | None = None,
+    ):
+        self.key_pool = api_key if isinstance(api_key, KeyPool) else KeyPool([api_key])
+        self.channel_id = channel_id
+        self.scheduler = scheduler if scheduler else RequestScheduler.default()
+        self.window: list[BaseMessage | dict[str, str]] = []
+        self.header: tuple[dict, dict[str, bytes]] | None = None
+        self.prefix: bytes = b""
+        self.raw: dict[str, bytes] = {}  # 미리 직렬화해 둔 필드
 
     async def run(
-        self, messages: list[dict[str, str]] | MessageBox, setting: Setting
+        self,
+        messages: list[BaseMessage] | list[dict[str, str]] | MessageBox,
+        setting: Setting,
     ) -> str:
         self.data = self.make_data(messages=messages, setting=setting)
+        self.body = self.make_body()
         return await self.chat_request()
 
     async def chat_request(self) -> str:
-        async with httpx.AsyncClient(timeout=None) as session:
+        session = HTTPClient.get_client()
+        token = await self.estimate_tokens()
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(self.channel_id, token)
+            # 기다리는 동안 제외된 키를 쓰지 않도록 차례가 온 뒤에 고름
+            key = self.key_pool.acquire()
             response = await session.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=self.header,
-                json=self.data,
+                self.URL,
+                headers=key.make_header(),
+                content=self.body,
             )
-            resp = response.json()
-            if "error" in resp:
-                raise ChatAPIError(resp.get("error"))
-            return resp.get("choices")[0].get("message").get("content")
-
-    def make_data(self, messages: list[dict[str, str]] | MessageBox, setting: Setting):
+            delay = self.retry_delay(key, response, attempt)
+            if delay is None:
+                break
+            attempt += 1
+            await asyncio.sleep(delay)
+        resp = response.json()
+        if "error" in resp:
+            raise ChatAPIError(resp.get("error"))
+        return resp.get("choices")[0].get("message").get("content")
+
+    def make_data(
+        self,
+        messages: list[BaseMessage] | list[dict[str, str]] | MessageBox,
+        setting: Setting,
+    ):
         if isinstance(messages, MessageBox):
-            messages = messages.make_messages(setting=setting)
+            messages = messages.make_window(setting=setting)
+        self.window = list(messages)
         return {
             "model": setting.model,
-            "messages": messages,
+            "messages": [
+                message.make_message() if isinstance(message, BaseMessage) else message
+                for message in self.window
+            ],
             "temperature": setting.temperature,
             "top_p": setting.top_p,
         }
 
+    def make_body(self) -> bytes:
+        # 메시지는 캐시해 둔 JSON 조각을 이어 붙이고 나머지 필드는 바뀔 때만 직렬화
+        header = {
+            key: value
+            for key, value in self.data.items()
+            if key != "messages" and key not in self.raw
+        }
+        if (header, self.raw) != self.header:
+            self.header = (header, dict(self.raw))
+            prefix = dumps(header)[:-1]
+            for key, fragment in self.raw.items():
+                prefix += b',"' + key.encode("utf-8") + b'":' + fragment
+            self.prefix = prefix + b',"messages":['
+        fragments = b",".join(
+            (
+                message.make_fragment()
+                if isinstance(message, BaseMessage)
+                else dumps(message)
+            )
+            for message in self.window
+        )
+        return self.prefix + fragments + b"]}"
+
+    def retry_delay(
+        self, key: APIKey, response: Response, attempt: int
+    ) -> float | None:
+        self.key_pool.report(key, response.status_code, response.headers)
+        self.scheduler.update_from_headers(self.key_pool.rate_limit_headers())
+        if (
+            response.status_code in KeyPool.BENCH_STATUS
+            and attempt < self.scheduler.max_retries
+            and self.key_pool.has_available()
+        ):
+            return 0.0  # 다른 키로 바로 재시도
+        return self.scheduler.retry_delay(
+            response.status_code, response.headers, attempt
+        )
+
+    async def estimate_tokens(self) -> int:
+        # MessageBox 가 창을 만들면서 센 토큰 수를 쓰고, 세지 않은 메시지만 셈
+        model = self.data["model"]
+        token = 2  # 답변은 <im_start>assistant로 시작함
+        pending = []
+        for message, data in zip(self.window, self.data["messages"]):
+            if isinstance(message, BaseMessage) and message.token_model == model:
+                token += message.token
+            else:
+                pending.append(data)
+        if pending:
+            counts = await Tokener.async_num_tokens_of_messages(pending, model=model)
+            token += sum(counts)
+        return token
+
 
 class ChatStream(Chat):
-    def __init__(self, api_key: str):
-        super().__init__(api_key=api_key)
-
     async def run(
-        self, messages: list[dict[str, str]], setting: Setting
+        self,
+        messages: list[BaseMessage] | list[dict[str, str]],
+        setting: Setting,
     ) -> AsyncIterator[dict[str, str | dict[str, str]]]:
         self.data = self.make_data(messages=messages, setting=setting)
-        async with httpx.AsyncClient(timeout=None) as session:
+        self.body = self.make_body()
+        session = HTTPClient.get_client()
+        token = await self.estimate_tokens()
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(self.channel_id, token)
+            # 기다리는 동안 제외된 키를 쓰지 않도록 차례가 온 뒤에 고름
+            key = self.key_pool.acquire()
             async with session.stream(
                 "POST",
-                "https://api.openai.com/v1/chat/completions",
-                headers=self.header,
-                json=self.data,
+                self.URL,
+                headers=key.make_header(),
+                content=self.body,
             ) as response:
-                if response.status_code == 400:
-                    await self.bad_request(response=response)
-                async for resp in self.process_stream_request(resp=response):
-                    yield resp
-
-    async def process_stream_request(self, resp: Response) -> AsyncIterator[str]:
+                delay = self.retry_delay(key, response, attempt)
+                if delay is None:
+                    if response.status_code != 200:
+                        await self.bad_request(response=response)
+                    async for resp in self.process_stream_request(resp=response):
+                        yield resp
+                    return
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def process_stream_request(self, resp: Response) -> AsyncIterator[dict]:
+        decoder = SSEDecoder()
         async for chunk in resp.aiter_bytes():
-            chunk_str = chunk.decode("utf-8")
-            async for resp in self.get_data_from_chunk(chunk_str=chunk_str):
-                yield resp
-
-    async def get_data_from_chunk(self, chunk_str: str) -> AsyncIterator[str]:
-        response_data = chunk_str.split("\n\n")
-        for data in response_data:
-            if data.startswith("data: "):
-                data = data[6:]
-                if data == "[DONE]":
-                    break
-                data_dict = json.loads(data)
-                try:
-                    response = data_dict["choices"][0]
-                except KeyError as e:
-                    logger.error(data_dict)
-                    raise KeyError(e)
-                yield response  # {"index":0,"delta":{"role":"assistant","content":""},"finish_reason":"stop"}
+            for data in decoder.feed(chunk):
+                yield self.get_data_from_event(data)
+            if decoder.done:
+                return
+        for data in decoder.flush():
+            yield self.get_data_from_event(data)
+
+    def get_data_from_event(self, data: str) -> dict:
+        data_dict = json.loads(data)
+        try:
+            response = data_dict["choices"][0]
+        except KeyError as e:
+            logger.error(data_dict)
+            raise KeyError(e)
+        return response  # {"index":0,"delta":{"role":"assistant","content":""},"finish_reason":"stop"}
 
     async def bad_request(self, response: Response):
         resp = await response.aread()
         text_data = resp.decode("utf-8")
-        data = json.loads(text_data)
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            data = {"error": {"message": text_data, "code": response.status_code}}
         raise ChatAPIError(data.get("error"))
 
-    def make_data(self, messages: list[dict[str, str]], setting: Setting):
+    def make_data(
+        self, messages: list[BaseMessage] | list[dict[str, str]], setting: Setting
+    ):
         data = super().make_data(messages=messages, setting=setting)
         data["stream"] = True
         return data
 
 
 class ChatStreamFunction(ChatStream):
-    def __init__(self, api_key: str):
-        super().__init__(api_key=api_key)
-
     async def run(
-        self, messages: list[dict[str, str]], function: list, setting: Setting
+        self,
+        messages: list[BaseMessage] | list[dict[str, str]],
+        function: list | FunctionManager,
+        setting: Setting,
     ) -> AsyncIterator[dict[str, str | dict[str, str]]]:
         self.function = function
         async for message in super().run(messages=messages, setting=setting):
             yield message
 
-    def make_data(self, messages: list[dict[str, str]], setting: Setting):
+    def make_data(
+        self, messages: list[BaseMessage] | list[dict[str, str]], setting: Setting
+    ):
         data = super().make_data(messages=messages, setting=setting)
-        data["functions"] = self.function
+        self.raw = {}
+        if setting.use_tools():
+            if isinstance(self.function, FunctionManager):
+                data["tools"] = self.function.make_tools()
+                self.raw = {"tools": self.function.make_tools_fragment()}
+            else:
+                data["tools"] = [
+                    {"type": "function", "function": function}
+                    for function in self.function
+                ]
+            data["tool_choice"] = "auto"
+            return data
+        if isinstance(self.function, FunctionManager):
+            data["functions"] = self.function.make_dict()
+            self.raw = {"functions": self.function.make_fragment()}
+        else:
+            data["functions"] = self.function
         data["function_call"] = "auto"
         return data
@@ -0,0 +1,59 @@
+import asyncio
+import importlib.util
+import logging
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClient:
+    _client: httpx.AsyncClient | None = None
+    _loop: asyncio.AbstractEventLoop | None = None
+    http2: bool = True
+    limits: httpx.Limits = httpx.Limits(
+        max_connections=100,
+        max_keepalive_connections=20,
+        keepalive_expiry=60,
+    )
+
+    @classmethod
+    def configure(
+        cls,
+        max_connections: int | None = 100,
+        max_keepalive_connections: int | None = 20,
+        keepalive_expiry: float | None = 60,
+        http2: bool = True,
+    ) -> None:
+        cls.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        cls.http2 = http2
+
+    @classmethod
+    def get_client(cls) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if cls._client is None or cls._client.is_closed or cls._loop is not loop:
+            # 이전 루프에 묶인 커넥션은 재사용할 수 없음
+            cls._client = cls.make_client()
+            cls._loop = loop
+        return cls._client
+
+    @classmethod
+    def make_client(cls) -> httpx.AsyncClient:
+        http2 = cls.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("h2 package is not installed, fall back to HTTP/1.1")
+            http2 = False
+        return httpx.AsyncClient(timeout=None, limits=cls.limits, http2=http2)
+
+    @classmethod
+    async def close(cls) -> None:
+        client, cls._client = cls._client, None
+        loop, cls._loop = cls._loop, None
+        if client is None or client.is_closed:
+            return
+        if loop is asyncio.get_running_loop():
+            await client.aclose()
+        logger.info("http client closed")
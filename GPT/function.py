@@ -1,6 +1,30 @@
+import asyncio
+import inspect
+import math
 import sqlite3
 import json
-from GPT.message import AssistanceMessage, FunctionMessage
+import time
+import types
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import (
+    Annotated,
+    Any,
+    Awaitable,
+    Callable,
+    Hashable,
+    Literal,
+    Mapping,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
+from GPT.message import AssistanceMessage, FunctionMessage, ToolMessage
+from GPT.serializer import dumps
+from GPT.schedule import Schedule
+from GPT.schedulepool import SchedulePool
 
 
 class ParameterType:
@@ -10,7 +34,66 @@ class ParameterType:
     boolean = "boolean"
 
 
+def short_repr(value: Any, limit: int = 40) -> str:
+    text = repr(value)
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def to_string(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError
+
+
+def to_integer(value: Any) -> int:
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, str):
+        # 모델이 숫자를 문자열로 보내는 경우가 많아서 숫자 문자열은 변환함
+        value = value.strip()
+        try:
+            return int(value)
+        except ValueError:
+            value = float(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, int):
+        return value
+    raise ValueError
+
+
+def to_number(value: Any) -> int | float:
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, str):
+        value = value.strip()
+        try:
+            return int(value)
+        except ValueError:
+            value = float(value)
+    if isinstance(value, (int, float)) and math.isfinite(value):
+        return value
+    raise ValueError
+
+
+def to_boolean(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    raise ValueError
+
+
 class Parameter:
+    CONVERTERS: dict[str, Callable[[Any], Any]] = {
+        ParameterType.string: to_string,
+        ParameterType.integer: to_integer,
+        ParameterType.number: to_number,
+        ParameterType.boolean: to_boolean,
+    }
+
     def __init__(
         self,
         name: str,
@@ -34,11 +117,34 @@ class Parameter:
             detail["enum"] = self.enum
         return {self.name: detail}
 
+    def make_validator(self) -> Callable[[Any], Any]:
+        name = self.name
+        parameter_type = self.parameter_type
+        convert = self.CONVERTERS.get(parameter_type)
+        if convert is None:
+            raise ValueError(f"{parameter_type} is not a supported parameter type")
+        enum = tuple(self.enum) if self.enum else None
+
+        def validate(value: Any) -> Any:
+            try:
+                value = convert(value)
+            except ValueError:
+                raise ValueError(
+                    f"{name} must be {parameter_type}, got {short_repr(value)}"
+                ) from None
+            if enum is not None and value not in enum:
+                raise ValueError(f"{name} must be one of {list(enum)}")
+            return value
+
+        return validate
+
 
 class ParameterManager:
     def __init__(self):
-        self.properties: dict[str, Parameter] = {}
-        self.required_names: list[str] = []
+        self.properties: Mapping[str, Parameter] = {}
+        self.required_names: list[str] | tuple[str, ...] = []
+        self.frozen: bool = False
+        self.validator: Callable[[dict], dict] | None = None
 
     def __repr__(self) -> str:
         return f"<ParameterManager {self.properties}>"
@@ -51,6 +157,8 @@ class ParameterManager:
         enum: list | None = None,
         required: bool = False,
     ):
+        if self.frozen:
+            raise ValueError("parameters are frozen")
         parameter = Parameter(
             name=name,
             parameter_type=parameter_type,
@@ -61,10 +169,47 @@ class ParameterManager:
         if required:
             self.required_names.append(name)
 
-    def type_check(self, parameters: dict[str, str]):
-        for required_parameter in self.required_names:
-            if required_parameter not in parameters:
-                raise ValueError(f"{required_parameter} is required")
+    def type_check(self, parameters: dict[str, Any]) -> dict[str, Any]:
+        # 검사를 통과한 인자를 변환된 값으로 돌려줌
+        validator = self.validator if self.frozen else self.compile()
+        return validator(parameters)
+
+    def compile(self) -> Callable[[dict], dict]:
+        validators = {
+            name: parameter.make_validator()
+            for name, parameter in self.properties.items()
+        }
+        required_names = tuple(self.required_names)
+        expected = ", ".join(validators) or "no arguments"
+
+        def validate(parameters: dict[str, Any]) -> dict[str, Any]:
+            if not isinstance(parameters, dict):
+                raise ValueError("arguments must be a JSON object")
+            arguments = {}
+            errors = []
+            unknown = False
+            for name, value in parameters.items():
+                validator = validators.get(name)
+                if validator is None:
+                    errors.append(f"unknown argument {short_repr(name)}")
+                    unknown = True
+                elif value is not None:
+                    # 선택 인자에 null 을 보내면 생략한 것으로 봄
+                    try:
+                        arguments[name] = validator(value)
+                    except ValueError as e:
+                        errors.append(str(e))
+            for name in required_names:
+                if parameters.get(name) is None:
+                    errors.append(f"{name} is required")
+            if errors:
+                # 모델이 한 번에 고칠 수 있도록 모든 오류를 짧게 모아서 알려줌
+                if unknown:
+                    errors.append(f"expected: {expected}")
+                raise ValueError("; ".join(errors))
+            return arguments
+
+        return validate
 
     def make_dict(self):
         properties = {}
@@ -76,36 +221,196 @@ class ParameterManager:
             "properties": properties,
         }
         if self.required_names:
-            parameters["required"] = self.required_names
+            parameters["required"] = list(self.required_names)
         return parameters
 
+    def freeze(self) -> "ParameterManager":
+        # 등록이 끝난 파라미터는 모든 채널이 공유하므로 더 이상 바꿀 수 없게 함
+        self.properties = MappingProxyType(dict(self.properties))
+        self.required_names = tuple(self.required_names)
+        self.validator = self.compile()
+        self.frozen = True
+        return self
+
+
+class FunctionSpec:
+    # 함수 정의에서 만든 스키마와 JSON 조각, 읽기 전용으로 모든 채널이 공유함
+    def __init__(self, name: str, description: str, parameters: ParameterManager):
+        if not name:
+            raise ValueError("name is not set")
+        self.name = name
+        self.description = description
+        self.parameters = parameters.freeze()
+        schema = {
+            "name": name,
+            "parameters": parameters.make_dict(),
+        }
+        if description:
+            schema["description"] = description
+        self.schema: dict = schema
+        self.fragment: bytes = dumps(schema)
+
+
+class FunctionRegistry:
+    # 프로세스 전체에서 함수 클래스마다 한 번만 스키마를 만듦
+    specs: dict[str, tuple[type["Function"], FunctionSpec]] = {}
+    instances: dict[type["Function"], "Function"] = {}
+
+    @classmethod
+    def register(cls, function_type: type["Function"]) -> FunctionSpec:
+        registered = cls.specs.get(function_type.name)
+        if registered is not None:
+            if registered[0] is not function_type:
+                raise ValueError(f"{function_type.name} is already registered")
+            return registered[1]
+        parameters = ParameterManager()
+        function_type.set_parameter(parameters)
+        spec = FunctionSpec(function_type.name, function_type.description, parameters)
+        cls.specs[function_type.name] = (function_type, spec)
+        return spec
+
+    @classmethod
+    def get_function(cls, function_type: type["Function"]) -> "Function":
+        # 상태가 없는 함수는 모든 채널이 하나의 인스턴스를 같이 사용
+        if not function_type.shared:
+            return function_type()
+        if function_type not in cls.instances:
+            cls.instances[function_type] = function_type()
+        return cls.instances[function_type]
+
 
 class Function:
     name: str
     description: str
+    shared: bool = True  # 채널별 상태가 있으면 False
+    channel_id: Hashable = None  # shared 가 False 인 함수가 속한 채널
+    max_concurrency: int = 4  # 인스턴스마다 동시에 실행할 수 있는 호출 수
+    timeout: float = 10.0  # 호출 하나에 허용하는 초
+    # 같은 인자의 결과를 재사용할 초, None 이면 캐시하지 않음
+    cache_ttl: float | None = None
 
     def __init__(self):
-        self.parameters = ParameterManager()
+        self.spec = FunctionRegistry.register(type(self))
+        self.parameters = self.spec.parameters
+        self.semaphore: asyncio.Semaphore | None = None
+
+    def get_semaphore(self) -> asyncio.Semaphore:
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.semaphore
 
     def __repr__(self) -> str:
         return f"<{self.__class__.__name__} name={self.name} description={self.description} >"
 
-    def set_parameter(self):
+    @classmethod
+    def set_parameter(cls, parameters: ParameterManager):
         raise NotImplementedError
 
     async def run(self, **kwargs):
         raise NotImplementedError
 
-    def make_dict(self):
-        if not self.name:
-            ValueError("name is not set")
-        func = {
-            "name": self.name,
-            "parameters": self.parameters.make_dict(),
-        }
-        if self.description:
-            func["description"] = self.description
-        return func
+    def memory_size(self) -> int:
+        return 0
+
+    def close(self) -> None:
+        pass
+
+    def make_dict(self) -> dict:
+        # 캐시된 dict 를 그대로 돌려주므로 호출한 쪽에서 수정하면 안 됨
+        return self.spec.schema
+
+    def make_fragment(self) -> bytes:
+        return self.spec.fragment
+
+    def make_cache_key(self, arguments: dict) -> Hashable:
+        # 키 순서와 공백이 달라도 같은 호출이면 같은 키가 되도록 정규화
+        key = json.dumps(
+            arguments, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+        )
+        if self.shared:
+            return (self.name, key)
+        # 채널별 상태가 있는 함수는 다른 채널의 결과를 쓰면 안 됨
+        # id(self) 는 인스턴스가 정리된 뒤 다른 채널의 인스턴스가 다시 쓸 수 있음
+        return (self.name, self.channel_id, key)
+
+
+HINT_TYPES: dict[type, str] = {
+    str: ParameterType.string,
+    int: ParameterType.integer,
+    float: ParameterType.number,
+    bool: ParameterType.boolean,
+}
+
+
+def make_parameter(name: str, hint: Any) -> dict[str, Any]:
+    # Annotated[str, "설명"], Optional[int], Literal["a", "b"] 형태를 파라미터로 바꿈
+    description = ""
+    if get_origin(hint) is Annotated:
+        hint, *extras = get_args(hint)
+        description = next((extra for extra in extras if isinstance(extra, str)), "")
+    if get_origin(hint) in (Union, types.UnionType):
+        arguments = [
+            argument for argument in get_args(hint) if argument is not type(None)
+        ]
+        if len(arguments) == 1:
+            hint = arguments[0]
+    enum = None
+    if get_origin(hint) is Literal:
+        enum = list(get_args(hint))
+        hint = type(enum[0])
+    if hint not in HINT_TYPES:
+        raise TypeError(f"{name} has unsupported type hint {hint!r}")
+    return {
+        "name": name,
+        "parameter_type": HINT_TYPES[hint],
+        "description": description,
+        "enum": enum,
+    }
+
+
+def define_function(
+    description: str = "", name: str | None = None, **attributes
+) -> Callable[[Callable[..., Awaitable]], type[Function]]:
+    # async 함수의 타입 힌트로 스키마를 만들어 상태가 없는 Function 클래스로 등록
+    def decorator(run: Callable[..., Awaitable]) -> type[Function]:
+        if not inspect.iscoroutinefunction(run):
+            raise TypeError(f"{run.__name__} must be an async function")
+        hints = get_type_hints(run, include_extras=True)
+        parameters = []
+        for parameter in inspect.signature(run).parameters.values():
+            if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+                raise TypeError(f"{run.__name__} must not take *args or **kwargs")
+            if parameter.name not in hints:
+                raise TypeError(f"{parameter.name} has no type hint")
+            parameter_dict = make_parameter(parameter.name, hints[parameter.name])
+            parameter_dict["required"] = parameter.default is parameter.empty
+            parameters.append(parameter_dict)
+
+        @classmethod
+        def set_parameter(cls, manager: ParameterManager):
+            for parameter_dict in parameters:
+                manager.add_parameter(**parameter_dict)
+
+        async def call(self, **arguments):
+            return await run(**arguments)
+
+        function_type = type(
+            run.__name__,
+            (Function,),
+            {
+                "__module__": run.__module__,
+                "__qualname__": run.__qualname__,
+                "name": name or run.__name__,
+                "description": description or inspect.getdoc(run) or "",
+                "set_parameter": set_parameter,
+                "run": call,
+                **attributes,
+            },
+        )
+        FunctionRegistry.register(function_type)
+        return function_type
+
+    return decorator
 
 
 class ScheduleFunction(Function):
@@ -115,13 +420,31 @@ SQLite Query Executor for Schedule Management The result of this function is the
 You can find the necessary table, and if there isn't one, you can create it yourself.
 All results, except for 'error' are considered valid results.
     """
-
-    def __init__(self):
+    shared = False
+    TIME_LIMIT: float = 2.0  # 쿼리 하나에 허용하는 초
+    MAX_ROWS: int = 100  # 결과로 돌려줄 최대 행 수
+    FETCH_SIZE: int = 20
+    PROGRESS_STEPS: int = 1000  # 시간 확인 간격, SQLite 가상 머신 명령 수
+    executor: ThreadPoolExecutor | None = None
+
+    def __init__(self, channel_id: Hashable = None, pool: SchedulePool | None = None):
         super().__init__()
-        self.con = sqlite3.connect(":memory:")
-
-    def set_parameter(self):
-        self.parameters.add_parameter(
+        self.channel_id = channel_id
+        # 저장소를 정하지 않으면 이전처럼 채널 전용 메모리 DB 를 사용
+        self.pool = pool if pool else SchedulePool(directory=None)
+
+    @classmethod
+    def get_executor(cls) -> ThreadPoolExecutor:
+        # 모델이 만든 쿼리는 이벤트 루프를 막지 않도록 전용 스레드에서 실행
+        if cls.executor is None:
+            cls.executor = ThreadPoolExecutor(
+                max_workers=4, thread_name_prefix="schedule"
+            )
+        return cls.executor
+
+    @classmethod
+    def set_parameter(cls, parameters: ParameterManager):
+        parameters.add_parameter(
             name="query",
             parameter_type=ParameterType.string,
             description="""
@@ -134,49 +457,299 @@ The query should be returned in plain text, not in JSON
         )
 
     async def run(self, query: str):
-        cur = self.con.cursor()
-        cur.execute(query)
-        return cur.fetchall()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.get_executor(), self.execute, query)
+
+    def execute(self, query: str) -> str:
+        deadline = time.monotonic() + self.TIME_LIMIT
+        with self.pool.connection(self.channel_id) as con:
+            # 0 이 아닌 값을 돌려주면 SQLite 가 실행 중인 쿼리를 중단함
+            con.set_progress_handler(
+                lambda: time.monotonic() > deadline, self.PROGRESS_STEPS
+            )
+            try:
+                cur = con.cursor()
+                cur.execute(query)
+                rows = []
+                while len(rows) <= self.MAX_ROWS:
+                    chunk = cur.fetchmany(self.FETCH_SIZE)
+                    if not chunk:
+                        break
+                    rows.extend(chunk)
+                cur.close()
+            except sqlite3.OperationalError as e:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(
+                        f"query took longer than {self.TIME_LIMIT} seconds"
+                    ) from e
+                raise
+            finally:
+                con.set_progress_handler(None, 0)
+                # BEGIN 만 보내고 끝난 트랜잭션이 연결을 잡고 있지 않게 함
+                if con.in_transaction:
+                    con.commit()
+        if len(rows) > self.MAX_ROWS:
+            shown = rows[: self.MAX_ROWS]
+            return f"{shown} ... only the first {self.MAX_ROWS} rows are shown"
+        return str(rows)
+
+    def memory_size(self) -> int:
+        return self.pool.memory_size(self.channel_id)
+
+    def close(self) -> None:
+        self.pool.release(self.channel_id)
+
+
+class ReminderFunction(Function):
+    name = "reminder_management"
+    description = """
+Reminder manager for this channel. A reminder posts its description to the channel whenever its cron expression matches.
+Use it when the user asks to be notified or reminded at a certain time, repeatedly or not.
+    """
+    shared = False
+    ACTIONS: list[str] = ["create", "update", "delete", "list"]
+
+    def __init__(self, channel_id: Hashable, schedule: Schedule):
+        super().__init__()
+        self.channel_id = channel_id
+        self.schedule = schedule
+
+    @classmethod
+    def set_parameter(cls, parameters: ParameterManager):
+        parameters.add_parameter(
+            name="action",
+            parameter_type=ParameterType.string,
+            enum=cls.ACTIONS,
+            required=True,
+        )
+        parameters.add_parameter(
+            name="name",
+            parameter_type=ParameterType.string,
+            description="Unique name of the reminder, required except for list",
+        )
+        parameters.add_parameter(
+            name="description",
+            parameter_type=ParameterType.string,
+            description="The message to post when the reminder fires",
+        )
+        parameters.add_parameter(
+            name="cron",
+            parameter_type=ParameterType.string,
+            description="5 field cron expression in server local time: minute hour day month weekday, e.g. '30 9 * * mon-fri'",
+        )
+
+    async def run(
+        self, action: str, name: str = "", description: str = "", cron: str = ""
+    ):
+        if action == "list":
+            return self.schedule.list_schedule(self.channel_id)
+        if action == "delete":
+            self.schedule.delete_schedule(name, self.channel_id)
+            return f"{name} deleted"
+        if action == "create":
+            entry = self.schedule.create_schedule(
+                name, description, cron, self.channel_id
+            )
+        elif action == "update":
+            entry = self.schedule.update_schedule(
+                name, description, cron, self.channel_id
+            )
+        else:
+            raise ValueError(f"action must be one of {self.ACTIONS}")
+        return {name: entry.to_dict()}
 
 
 class TestFunction(Function):
     name = "get_current_weather"
     description = "Get the current weather in a given location"
+    cache_ttl = 60.0
 
-    def set_parameter(self):
-        self.parameters.add_parameter(
+    @classmethod
+    def set_parameter(cls, parameters: ParameterManager):
+        parameters.add_parameter(
             name="location",
             parameter_type=ParameterType.string,
             description="The city and state, e.g. San Francisco, CA",
             required=True,
         )
-        self.parameters.add_parameter(
+        parameters.add_parameter(
             name="unit",
             parameter_type=ParameterType.string,
             enum=["celsius", "fahrenheit"],
         )
 
+    def make_cache_key(self, arguments: dict) -> Hashable:
+        location = " ".join(arguments.get("location", "").split()).casefold()
+        return (self.name, location, arguments.get("unit", "none"))
+
     async def run(self, location: str, unit: str = "none"):
         return {"whether": "sunny"}
 
 
+class ResultCache:
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.cache: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.inflight: dict[Hashable, asyncio.Future] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+        self.deduplicated: int = 0
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def __repr__(self) -> str:
+        return f"<ResultCache {self.stats()}>"
+
+    def get(self, key: Hashable, now: float | None = None) -> tuple[bool, Any]:
+        now = time.monotonic() if now is None else now
+        entry = self.cache.get(key)
+        if entry is None:
+            return False, None
+        expires, result = entry
+        if expires <= now:
+            del self.cache[key]
+            return False, None
+        self.cache.move_to_end(key)
+        return True, result
+
+    def put(self, key: Hashable, result: Any, ttl: float) -> None:
+        self.cache[key] = (time.monotonic() + ttl, result)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    async def get_or_run(
+        self, key: Hashable, ttl: float, run: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        found, result = self.get(key)
+        if found:
+            self.hits += 1
+            return result
+        future = self.inflight.get(key)
+        if future is not None:
+            # 같은 호출이 실행 중이면 끝날 때까지 기다렸다가 결과를 같이 사용
+            self.deduplicated += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            # 먼저 실행하던 쪽이 취소되었으면 다시 실행
+            return await self.get_or_run(key, ttl, run)
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            result = await run()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            # 실패한 결과는 저장하지 않고 기다리던 호출에만 전달
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            self.put(key, result, ttl)
+            return result
+        finally:
+            del self.inflight[key]
+
+    def clear(self) -> None:
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+
+    def stats(self) -> dict[str, int | float]:
+        total = self.hits + self.deduplicated + self.misses
+        return {
+            "size": len(self.cache),
+            "hits": self.hits,
+            "deduplicated": self.deduplicated,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.deduplicated) / total if total else 0.0,
+        }
+
+
 class FunctionManager:
+    MAX_RESULT_CHARS: int = 4000  # 함수 결과를 프롬프트에 넣기 전에 자르는 길이
+    cache: ResultCache = ResultCache()  # 모든 채널이 같이 사용하는 결과 캐시
+
     def __init__(self):
         self.function_list: dict[str, Function] = {}
-
-    def add_function(self, function: Function):
+        self.schemas: list[dict] | None = None
+        self.fragment: bytes | None = None
+        self.tools: list[dict] | None = None
+        self.tools_fragment: bytes | None = None
+
+    def add_function(self, function: Function | type[Function]):
+        if isinstance(function, type) and issubclass(function, Function):
+            function = FunctionRegistry.get_function(function)
         if isinstance(function, Function):
-            if function not in self.function_list:
-                function.set_parameter()
+            if function.name not in self.function_list:
                 self.function_list.update({function.name: function})
+                self.schemas = None
+                self.fragment = None
+                self.tools = None
+                self.tools_fragment = None
         else:
             raise TypeError("function must be Function type")
 
-    def make_dict(self):
-        functions = []
-        for function in self.function_list.values():
-            functions.append(function.make_dict())
-        return functions
+    def get_own_functions(self) -> list[Function]:
+        # 공유하는 인스턴스는 채널이 정리될 때 닫지 않음
+        return [
+            function
+            for function in self.function_list.values()
+            if FunctionRegistry.instances.get(type(function)) is not function
+        ]
+
+    def memory_size(self) -> int:
+        return sum(function.memory_size() for function in self.get_own_functions())
+
+    def close(self) -> None:
+        for function in self.get_own_functions():
+            function.close()
+
+    def make_dict(self) -> list[dict]:
+        if self.schemas is None:
+            self.schemas = [
+                function.make_dict() for function in self.function_list.values()
+            ]
+        return self.schemas
+
+    def make_fragment(self) -> bytes:
+        if self.fragment is None:
+            self.fragment = (
+                b"["
+                + b",".join(
+                    function.make_fragment() for function in self.function_list.values()
+                )
+                + b"]"
+            )
+        return self.fragment
+
+    def make_tools(self) -> list[dict]:
+        # 병렬 호출을 지원하는 모델은 functions 대신 tools 형식을 사용
+        if self.tools is None:
+            self.tools = [
+                {"type": "function", "function": schema} for schema in self.make_dict()
+            ]
+        return self.tools
+
+    def make_tools_fragment(self) -> bytes:
+        if self.tools_fragment is None:
+            self.tools_fragment = (
+                b"["
+                + b",".join(
+                    b'{"type":"function","function":' + function.make_fragment() + b"}"
+                    for function in self.function_list.values()
+                )
+                + b"]"
+            )
+        return self.tools_fragment
 
     async def run(self, message: AssistanceMessage):
         if not isinstance(message, AssistanceMessage):
@@ -188,13 +761,67 @@ class FunctionManager:
         if arguments:
             arguments = json.loads(arguments)
         result = await self.type_check_and_run(name, arguments)
-        result_message = FunctionMessage(name=name, content=result)
+        result_message = FunctionMessage(name=name, content=self.truncate(result))
         return result_message
 
+    def truncate(self, result) -> str:
+        result = str(result)
+        if len(result) <= self.MAX_RESULT_CHARS:
+            return result
+        return (
+            result[: self.MAX_RESULT_CHARS]
+            + f" ... truncated {len(result) - self.MAX_RESULT_CHARS} characters"
+        )
+
+    async def run_tool_calls(self, message: AssistanceMessage) -> list[ToolMessage]:
+        # 한 번에 요청된 호출은 동시에 실행하고, 결과는 요청한 순서대로 돌려줌
+        if not isinstance(message, AssistanceMessage):
+            raise TypeError("message must be AssistanceMessage type")
+        results = await asyncio.gather(
+            *(self.run_tool_call(tool_call) for tool_call in message.tool_calls)
+        )
+        return [
+            ToolMessage(
+                name=tool_call["function"].get("name", ""),
+                content=self.truncate(result),
+                tool_call_id=tool_call["id"],
+            )
+            for tool_call, result in zip(message.tool_calls, results)
+        ]
+
+    async def run_tool_call(self, tool_call: dict):
+        # 잘못된 호출도 결과로 돌려줘야 모델이 다음 요청에서 고칠 수 있음
+        function = tool_call.get("function", {})
+        name = function.get("name", "")
+        if name not in self.function_list:
+            return ValueError(f"{name} is not found")
+        try:
+            arguments = json.loads(function.get("arguments") or "{}")
+        except json.JSONDecodeError as e:
+            return e
+        return await self.type_check_and_run(name, arguments)
+
     async def type_check_and_run(self, name: str, arguments: dict[str, str]):
         try:
             function = self.function_list[name]
-            function.parameters.type_check(arguments)
-            return await function.run(**arguments)
+            arguments = function.parameters.type_check(arguments)
+            if function.cache_ttl:
+                return await self.cache.get_or_run(
+                    function.make_cache_key(arguments),
+                    function.cache_ttl,
+                    lambda: self.call(function, arguments),
+                )
+            return await self.call(function, arguments)
         except Exception as e:
+            if isinstance(e, asyncio.TimeoutError) and not str(e):
+                return TimeoutError(
+                    f"{name} took longer than {function.timeout} seconds"
+                )
             return e
+
+    @staticmethod
+    async def call(function: Function, arguments: dict[str, str]):
+        async with function.get_semaphore():
+            return await asyncio.wait_for(
+                function.run(**arguments), timeout=function.timeout
+            )
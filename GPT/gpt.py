@@ -1,83 +1,212 @@
+import asyncio
 import time
 import logging
 import os
-import aiohttp
 import datetime
 import io
 from typing import AsyncIterator
 from .setting import Setting
 from .chat import Chat, ChatStream, ChatStreamFunction
+from .client import HTTPClient
 from .message import (
     BaseMessage,
     SystemMessage,
     UserMessage,
     AssistanceMessage,
+    AssistanceStream,
     FunctionMessage,
     MessageBox,
 )
-from .function import FunctionManager, TestFunction, ScheduleFunction
+from .function import (
+    FunctionManager,
+    ReminderFunction,
+    TestFunction,
+    ScheduleFunction,
+)
 from .token import Tokener
+from .keypool import KeyPool
+from .ratelimit import RequestScheduler
+from .schedule import Schedule
+from .schedulepool import SchedulePool
+from .store import ConversationStore
+from .memory import RetrievalMemory
 
 logger = logging.getLogger(__name__)
 
 
 class GPT:
-    def __init__(self, api_key: str, setting_file: str = "setting.json"):
+    SUMMARY_PROMPT: str = (
+        "다음은 사용자와 AI의 이전 대화입니다. 이후 대화에 필요한 사실, 결정, 요청 사항을 "
+        "빠짐없이 짧게 요약해 주세요."
+    )
+
+    def __init__(
+        self,
+        api_key: str | KeyPool,
+        setting_file: str = "setting.json",
+        channel_id: int | None = None,
+        scheduler: RequestScheduler | None = None,
+        store: ConversationStore | None = None,
+        memory: RetrievalMemory | None = None,
+        schedule_pool: SchedulePool | None = None,
+        schedule: Schedule | None = None,
+        history_limit: int | None = None,
+    ):
         self.setting = Setting(setting_file)
         self.api_key = api_key
-        self.message_box = MessageBox()
+        self.key_pool = api_key if isinstance(api_key, KeyPool) else KeyPool([api_key])
+        self.channel_id = channel_id
+        self.scheduler = scheduler
+        self.message_box = MessageBox(store=store, channel_id=channel_id)
+        self.memory = memory
+        self.memory_tasks: set[asyncio.Task] = set()
+        if memory:
+            self.message_box.evicted = []
+        self.schedule_pool = schedule_pool
+        self.schedule = schedule
+        # 저장된 대화는 첫 요청에서 불러옴, None 이면 불러올 것이 없음
+        self.history_limit = history_limit if store else None
+        self.history_task: asyncio.Task | None = None
         self.function_manager = FunctionManager()
         self.lastRequestTime = time.time()
+        self.active: int = 0  # 응답을 생성 중인 요청 수, GPTBox 가 정리하지 않음
+        self.summary_task: asyncio.Task | None = None
         if not os.path.isdir("./img"):
             os.mkdir("img")
-        self.clear_history()
         self.set_function()
 
     def set_function(self):
-        self.function_manager.add_function(TestFunction())
-        self.function_manager.add_function(ScheduleFunction())
+        self.function_manager.add_function(TestFunction)
+        # 채널이 없으면 파일을 나눠 쓰지 않도록 메모리 DB 를 사용
+        schedule_pool = self.schedule_pool if self.channel_id is not None else None
+        self.function_manager.add_function(
+            ScheduleFunction(self.channel_id, schedule_pool)
+        )
+        if self.schedule:
+            self.function_manager.add_function(
+                ReminderFunction(self.channel_id, self.schedule)
+            )
 
     async def get_stream_chat(self, _message: str) -> AsyncIterator[AssistanceMessage]:
+        self.active += 1
+        try:
+            async for message in self.stream_chat(_message):
+                yield message
+        finally:
+            self.active -= 1
+
+    async def stream_chat(self, _message: str) -> AsyncIterator[AssistanceMessage]:
+        await self.load_history()
         self.is_timeout()
+        memory_message = await self.recall(_message)
         self.message_box.add_message(UserMessage(content=_message))
-        messages = self.message_box.make_messages(setting=self.setting)
-        chat_api = ChatStream(api_key=self.api_key)
+        messages = await self.make_messages(memory_message)
+        chat_api = ChatStream(
+            api_key=self.key_pool, channel_id=self.channel_id, scheduler=self.scheduler
+        )
         logger.info(f"message: {messages}")
 
-        collected_messages = AssistanceMessage()
-        # async for data in self.get_chat_stream_data(messages):
+        stream = AssistanceStream()
         async for data in chat_api.run(messages, setting=self.setting):
-            collected_messages += AssistanceMessage(data=data)
-            yield collected_messages
+            stream.add(data)
+            yield AssistanceMessage(data=data)
 
+        collected_messages = stream.to_message()
         logger.info(f"request: {collected_messages}")
         self.message_box.add_message(collected_messages)
+        self.start_summary()
 
     async def get_stream_chat_with_function(self, _message: str) -> AsyncIterator[str]:
+        self.active += 1
+        try:
+            async for content in self.stream_chat_with_function(_message):
+                yield content
+        finally:
+            self.active -= 1
+
+    async def stream_chat_with_function(self, _message: str) -> AsyncIterator[str]:
+        await self.load_history()
         self.is_timeout()
+        memory_message = await self.recall(_message)
         self.message_box.add_message(UserMessage(content=_message))
-        function_data = self.function_manager.make_dict()
-        chat_api = ChatStreamFunction(api_key=self.api_key)
+        chat_api = ChatStreamFunction(
+            api_key=self.key_pool, channel_id=self.channel_id, scheduler=self.scheduler
+        )
         call_functions = []
 
         while True:
-            collected_messages = AssistanceMessage()
-            messages = self.message_box.make_messages(setting=self.setting)
+            stream = AssistanceStream()
+            messages = await self.make_messages(memory_message)
             logger.info(f"message: {messages}")
             async for data in chat_api.run(
-                messages, function=function_data, setting=self.setting
+                messages, function=self.function_manager, setting=self.setting
             ):
-                temp_messages = AssistanceMessage(data=data)
-                yield temp_messages.content
-                collected_messages += temp_messages
+                yield stream.add(data)
+            collected_messages = stream.to_message()
             logger.info(f"request: {collected_messages}")
-            self.message_box.add_message(collected_messages)
+            if collected_messages.tool_calls:
+                calls = [
+                    tool_call["function"] for tool_call in collected_messages.tool_calls
+                ]
+                yield f"call function: {calls} \n"
+                tool_messages = await self.function_manager.run_tool_calls(
+                    collected_messages
+                )
+                collected_messages.content = (
+                    ", ".join(message.name for message in tool_messages) + "\n"
+                )
+                self.message_box.add_message(collected_messages)
+                for tool_message in tool_messages:
+                    self.message_box.add_message(tool_message)
+                continue
             if collected_messages.finish_reason != AssistanceMessage.FUNCTION_CALL:
+                self.message_box.add_message(collected_messages)
+                self.start_summary()
                 break
             yield f"call function: {collected_messages.function_call} \n"
             function_message = await self.function_manager.run(collected_messages)
-            self.message_box.add_message(function_message)
+            # 토큰 수가 캐시되므로 메시지를 넣기 전에 내용을 확정함
             collected_messages.content = function_message.name + "\n"
+            self.message_box.add_message(collected_messages)
+            self.message_box.add_message(function_message)
+
+    async def recall(self, query: str) -> SystemMessage | None:
+        # 대화 기록에서 잘려나간 메시지 중 관련된 것을 찾아 프롬프트에 넣음
+        if not self.memory:
+            return None
+        snippets = await asyncio.to_thread(self.memory.recall, self.channel_id, query)
+        if not snippets:
+            return None
+        memory_message = SystemMessage(
+            content="관련된 이전 대화:\n" + "\n".join(snippets)
+        )
+        memory_message.token = Tokener.num_tokens_of_message(
+            memory_message.make_message(), self.setting.model
+        )
+        memory_message.token_model = self.setting.model
+        return memory_message
+
+    async def make_messages(
+        self, memory_message: SystemMessage | None = None
+    ) -> list[BaseMessage]:
+        reserved_token = memory_message.token if memory_message else 0
+        messages = await self.message_box.async_make_window(
+            setting=self.setting, reserved_token=reserved_token
+        )
+        self.remember_evicted()
+        if memory_message:
+            messages.insert(1 if self.setting.system_text else 0, memory_message)
+        return messages
+
+    def remember_evicted(self) -> None:
+        evicted = self.message_box.take_evicted()
+        if not self.memory or not evicted:
+            return
+        task = asyncio.get_running_loop().create_task(
+            asyncio.to_thread(self.memory.remember, self.channel_id, evicted)
+        )
+        self.memory_tasks.add(task)
+        task.add_done_callback(self.memory_tasks.discard)
 
     async def short_chat(self, message: str, system: str | None = None) -> str:
         messages: list[BaseMessage] = []
@@ -85,7 +214,9 @@ class GPT:
             messages.append(SystemMessage(content=system))
         messages.append(UserMessage(content=message))
         messages = [message.make_message() for message in messages]
-        chat_api = Chat(api_key=self.api_key)
+        chat_api = Chat(
+            api_key=self.key_pool, channel_id=self.channel_id, scheduler=self.scheduler
+        )
         logger.info(f"message: {messages}")
 
         result = await chat_api.run(messages, self.setting)
@@ -93,46 +224,121 @@ class GPT:
         logger.info(f"request: {result}")
         return result
 
+    def start_summary(self) -> None:
+        # 다음 요청이 요약을 기다리지 않도록 백그라운드에서 실행
+        if self.setting.history_mode != Setting.SUMMARY:
+            return
+        if self.summary_task and not self.summary_task.done():
+            return
+        self.summary_task = asyncio.get_running_loop().create_task(
+            self.summarize_history()
+        )
+
+    async def summarize_history(self) -> None:
+        try:
+            await self.message_box.async_count_tokens(self.setting)
+            if not self.message_box.need_summary(self.setting):
+                return
+            span = self.message_box.get_summary_span(self.setting)
+            if not span:
+                return
+            history = "\n".join(
+                f"{message.role}: {message.content}" for message in span
+            )
+            summary = await self.short_chat(history, system=self.SUMMARY_PROMPT)
+            self.message_box.replace_with_summary(
+                span, f"이전 대화 요약:\n{summary}", self.setting.model
+            )
+            logger.info(f"{len(span)} messages summarized")
+        except Exception:
+            logger.exception("failed to summarize history")
+
     async def create_image(self, prompt: str):
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}",
-        }
+        key = self.key_pool.acquire()
         data = {
             "prompt": prompt,
             "n": 1,
             "size": "1024x1024",
         }
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.openai.com/v1/images/generations",
-                headers=headers,
-                json=data,
-            ) as resp:
-                if resp.status != 200:
-                    logger.error(resp)
-                    raise Exception("API 요청 에러")
-                result = await resp.json()
-                logger.info(result)
-                url = result["data"][0]["url"]
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.read()
-                    with open(
-                        f"./img/{datetime.datetime.now().strftime('%m%d%H%M%S')}.png",
-                        "wb",
-                    ) as f:
-                        f.write(data)
-                    image_data = io.BytesIO(data)
-                    return image_data
-                else:
-                    raise Exception("이미지 다운 에러")
+        session = HTTPClient.get_client()
+        resp = await session.post(
+            "https://api.openai.com/v1/images/generations",
+            headers=key.make_header(),
+            json=data,
+        )
+        self.key_pool.report(key, resp.status_code, resp.headers)
+        if resp.status_code != 200:
+            logger.error(resp)
+            raise Exception("API 요청 에러")
+        result = resp.json()
+        logger.info(result)
+        url = result["data"][0]["url"]
+        response = await session.get(url)
+        if response.status_code == 200:
+            data = response.content
+            with open(
+                f"./img/{datetime.datetime.now().strftime('%m%d%H%M%S')}.png",
+                "wb",
+            ) as f:
+                f.write(data)
+            image_data = io.BytesIO(data)
+            return image_data
+        else:
+            raise Exception("이미지 다운 에러")
 
     def clear_history(self):
         logger.info("history cleared")
+        self.history_limit = None
         self.message_box.clear()
+        if self.memory:
+            self.memory.forget(self.channel_id)
+
+    async def load_history(self) -> None:
+        # 같은 채널의 요청이 동시에 들어와도 한 번만 읽고, 모두 읽기가 끝날 때까지 기다림
+        if self.history_limit is None:
+            return
+        if self.history_task is None:
+            self.history_task = asyncio.ensure_future(
+                self.read_history(self.history_limit)
+            )
+        await asyncio.shield(self.history_task)
+
+    async def read_history(self, limit: int) -> None:
+        try:
+            messages, last_time = await self.message_box.store.async_load(
+                self.channel_id, limit
+            )
+        except Exception:
+            logger.exception("failed to load conversation history")
+            return
+        finally:
+            self.history_limit = None
+        for message in messages:
+            self.message_box.add_message(message, save=False)
+        if messages:
+            # 마지막 대화 시각 기준으로 keep_min 이 지나면 다음 요청에서 초기화됨
+            self.lastRequestTime = last_time
+            logger.info(f"{len(messages)} messages loaded")
+
+    def is_expired(self, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        return now - self.lastRequestTime > self.setting.keep_min * 60
+
+    def memory_size(self) -> int:
+        size = self.message_box.memory_size + self.function_manager.memory_size()
+        if self.memory:
+            size += self.memory.memory_size(self.channel_id)
+        return size
+
+    def close(self) -> None:
+        if self.summary_task:
+            self.summary_task.cancel()
+        self.message_box.unload()
+        self.function_manager.close()
+        if self.memory:
+            self.memory.release(self.channel_id)
 
     def is_timeout(self):
-        if time.time() - self.lastRequestTime > self.setting.keep_min * 60:
+        if self.is_expired():
             self.clear_history()
         self.lastRequestTime = time.time()
@@ -1,18 +1,189 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from .function import FunctionManager
 from .gpt import GPT
+from .client import HTTPClient
+from .keypool import KeyPool
+from .memory import RetrievalMemory
+from .message import MessageBox
+from .ratelimit import RequestScheduler
+from .schedule import Schedule
+from .setting import Setting
+from .schedulepool import SchedulePool
+from .store import ConversationStore
+from .token import Tokener
+
+logger = logging.getLogger(__name__)
 
 
 class GPTBox:
-    def __init__(self, apk_key: str):
+    def __init__(
+        self,
+        apk_key: str | list[str] | KeyPool,
+        scheduler: RequestScheduler | None = None,
+        max_channels: int = 1000,
+        memory_budget: int | None = None,
+        sweep_seconds: float = 60.0,
+        store: ConversationStore | None = None,
+        history_limit: int = 100,
+        compact_seconds: float | None = 300.0,
+        memory: RetrievalMemory | None = None,
+        schedule_pool: SchedulePool | None = None,
+        schedule: Schedule | None = None,
+    ):
         self.api_key = apk_key
-        self.gpt_container = {}
+        if isinstance(apk_key, KeyPool):
+            self.key_pool = apk_key
+        elif isinstance(apk_key, str):
+            self.key_pool = KeyPool.from_string(apk_key)
+        else:
+            self.key_pool = KeyPool(apk_key)
+        self.scheduler = scheduler if scheduler else RequestScheduler.default()
+        self.max_channels = max_channels
+        self.memory_budget = memory_budget  # 바이트 단위, None 이면 제한 없음
+        self.sweep_seconds = sweep_seconds
+        self.store = store
+        self.history_limit = history_limit  # 다시 불러올 최근 메시지 수
+        self.compact_seconds = compact_seconds  # None 이면 압축하지 않음
+        self.memory = memory
+        self.schedule_pool = schedule_pool
+        self.schedule = schedule
+        self.gpt_container: OrderedDict[int, GPT] = OrderedDict()
+        # 정리된 채널의 설정, 기본값과 다른 채널만 최근 max_channels 개까지 남김
+        self.settings: OrderedDict[int, dict] = OrderedDict()
+        self.default_setting: dict = Setting().setting_value
+        # 채널별로 마지막에 잰 메모리 크기와 그 합
+        self.sizes: dict[int, int] = {}
+        self.total_size: int = 0
+        self.sweeper: asyncio.Task | None = None
 
     # get gpt by channel id
     def get_gpt(self, channel_id: int, api_key: str | None = None) -> GPT:
+        self.start_sweeper()
         if channel_id in self.gpt_container:
+            self.gpt_container.move_to_end(channel_id)
+            self.update_size(channel_id)
             return self.gpt_container[channel_id]
         else:
-            self.gpt_container[channel_id] = GPT(api_key if api_key else self.api_key)
+            self.gpt_container[channel_id] = GPT(
+                api_key if api_key else self.key_pool,
+                channel_id=channel_id,
+                scheduler=self.scheduler,
+                store=self.store,
+                memory=self.memory,
+                schedule_pool=self.schedule_pool,
+                schedule=self.schedule,
+                history_limit=self.history_limit,
+            )
+            gpt = self.gpt_container[channel_id]
+            if channel_id in self.settings:
+                gpt.setting.load_from_dict(self.settings.pop(channel_id))
+                gpt.setting.sync_setting()
+            self.update_size(channel_id)
+            self.evict(keep=channel_id)
             return self.gpt_container[channel_id]
 
+    def start_sweeper(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if (
+            self.sweeper is None
+            or self.sweeper.done()
+            or self.sweeper.get_loop() is not loop
+        ):
+            self.sweeper = loop.create_task(self.sweep_loop())
+
+    async def sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_seconds)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("failed to sweep gpt container")
+
+    def sweep(self, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        expired = [
+            channel_id
+            for channel_id, gpt in self.gpt_container.items()
+            if not gpt.active and gpt.is_expired(now)
+        ]
+        for channel_id in expired:
+            self.remove_gpt(channel_id)
+        if expired:
+            logger.info(f"{len(expired)} idle channels expired")
+        if self.compact_seconds is not None:
+            for gpt in self.gpt_container.values():
+                if not gpt.active and now - gpt.lastRequestTime > self.compact_seconds:
+                    gpt.message_box.compact()
+        # 요청 사이에 바뀐 크기를 주기적으로 다시 맞춤
+        for channel_id in self.gpt_container:
+            self.update_size(channel_id)
+        self.evict()
+
+    def evict(self, keep: int | None = None) -> None:
+        # 오래 사용하지 않은 채널부터 정리, 응답 중인 채널은 건너뜀
+        over_count = len(self.gpt_container) - self.max_channels
+        over_memory = 0
+        if self.memory_budget is not None:
+            over_memory = self.total_size - self.memory_budget
+        if over_count <= 0 and over_memory <= 0:
+            return
+        for channel_id, gpt in list(self.gpt_container.items()):
+            if over_count <= 0 and over_memory <= 0:
+                break
+            if channel_id == keep or gpt.active:
+                continue
+            over_memory -= self.sizes.get(channel_id, 0)
+            over_count -= 1
+            self.remove_gpt(channel_id)
+            logger.info(f"channel {channel_id} evicted")
+
+    def remove_gpt(self, channel_id: int) -> None:
+        gpt = self.gpt_container.pop(channel_id)
+        self.total_size -= self.sizes.pop(channel_id, 0)
+        # 역할이나 모델 같은 설정은 채널을 다시 만들 때 되돌림
+        if gpt.setting.setting_value != self.default_setting:
+            self.settings[channel_id] = dict(gpt.setting.setting_value)
+            while len(self.settings) > self.max_channels:
+                self.settings.popitem(last=False)
+        gpt.close()
+
+    def update_size(self, channel_id: int) -> None:
+        if self.memory_budget is None:
+            return
+        size = self.gpt_container[channel_id].memory_size()
+        self.total_size += size - self.sizes.get(channel_id, 0)
+        self.sizes[channel_id] = size
+
+    def memory_size(self) -> int:
+        return sum(gpt.memory_size() for gpt in self.gpt_container.values())
+
+    async def close(self):
+        if self.sweeper is not None:
+            self.sweeper.cancel()
+            self.sweeper = None
+        for channel_id in list(self.gpt_container):
+            self.remove_gpt(channel_id)
+        if self.store:
+            await self.store.close()
+        if self.memory:
+            self.memory.close()
+        if self.schedule_pool:
+            self.schedule_pool.close()
+        if self.schedule:
+            await self.schedule.close()
+        logger.info(f"token cache: {Tokener.cache.stats()}")
+        logger.info(f"cold storage: {MessageBox.cold_stats.stats()}")
+        logger.info(f"function cache: {FunctionManager.cache.stats()}")
+        await HTTPClient.close()
+
+    def __len__(self) -> int:
+        return len(self.gpt_container)
+
     def __str__(self) -> str:
         return f"< GPTBox : {self.gpt_container.keys()} >"
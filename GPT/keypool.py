@@ -0,0 +1,152 @@
+from __future__ import annotations
+import logging
+import time
+from collections import deque
+from typing import Mapping
+from .ratelimit import parse_reset
+
+logger = logging.getLogger(__name__)
+
+
+class APIKey:
+    def __init__(self, key: str, organization: str | None = None):
+        self.key = key
+        self.organization = organization
+        self.limit: dict[str, float] = {}
+        self.remaining: dict[str, float] = {}
+        self.reset_at: dict[str, float] = {}
+        self.results: deque[bool] = deque(maxlen=20)
+        self.benched_until: float = 0.0
+        self.last_used: float = 0.0
+
+    def __repr__(self) -> str:
+        return f"<APIKey key=...{self.key[-4:]} organization={self.organization} >"
+
+    def make_header(self) -> dict[str, str]:
+        header = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.key}",
+        }
+        if self.organization:
+            header["OpenAI-Organization"] = self.organization
+        return header
+
+    def is_available(self, now: float) -> bool:
+        return self.benched_until <= now
+
+    def error_rate(self) -> float:
+        if not self.results:
+            return 0.0
+        return self.results.count(False) / len(self.results)
+
+    def quota(self, now: float) -> float:
+        quota = 1.0
+        for name, limit in self.limit.items():
+            if name not in self.remaining or self.reset_at.get(name, 0) <= now:
+                continue
+            quota = min(quota, self.remaining[name] / limit if limit else 0.0)
+        return quota
+
+    def score(self, now: float) -> float:
+        return self.quota(now) * (1 - self.error_rate())
+
+    def update_from_headers(self, headers: Mapping[str, str], now: float) -> None:
+        for name in ("requests", "tokens"):
+            try:
+                if f"x-ratelimit-limit-{name}" in headers:
+                    self.limit[name] = float(headers[f"x-ratelimit-limit-{name}"])
+                if f"x-ratelimit-remaining-{name}" in headers:
+                    self.remaining[name] = float(
+                        headers[f"x-ratelimit-remaining-{name}"]
+                    )
+                    reset = parse_reset(headers.get(f"x-ratelimit-reset-{name}", ""))
+                    self.reset_at[name] = now + max(reset, 1.0)
+            except ValueError:
+                logger.warning(f"invalid rate limit header of {self}")
+
+
+class KeyPool:
+    BENCH_STATUS = (401, 429)
+    ERROR_STATUS = (401, 403, 429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        keys: list[str | APIKey],
+        bench_seconds: float = 60.0,
+        unauthorized_bench_seconds: float = 600.0,
+    ):
+        if not keys:
+            raise ValueError("at least one api key is required")
+        self.keys = [key if isinstance(key, APIKey) else APIKey(key) for key in keys]
+        self.bench_seconds = bench_seconds
+        self.unauthorized_bench_seconds = unauthorized_bench_seconds
+
+    @classmethod
+    def from_string(cls, value: str, **kwargs) -> KeyPool:
+        # "key1,key2:org-id" 형태, 조직이 있으면 키 뒤에 ':' 로 구분
+        keys = []
+        for item in value.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            key, _, organization = item.partition(":")
+            keys.append(APIKey(key, organization or None))
+        return cls(keys, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __repr__(self) -> str:
+        return f"<KeyPool {self.keys}>"
+
+    def acquire(self) -> APIKey:
+        now = time.monotonic()
+        available = [key for key in self.keys if key.is_available(now)]
+        if not available:
+            return min(self.keys, key=lambda key: key.benched_until)
+        key = max(available, key=lambda key: (key.score(now), -key.last_used))
+        key.last_used = now
+        return key
+
+    def has_available(self) -> bool:
+        now = time.monotonic()
+        return any(key.is_available(now) for key in self.keys)
+
+    def report(self, key: APIKey, status_code: int, headers: Mapping[str, str]) -> None:
+        now = time.monotonic()
+        key.update_from_headers(headers, now)
+        key.results.append(status_code not in self.ERROR_STATUS)
+        if status_code == 401:
+            key.benched_until = now + self.unauthorized_bench_seconds
+            logger.warning(f"{key} is unauthorized, benched")
+        elif status_code == 429:
+            bench = self.bench_seconds
+            retry_after = headers.get("retry-after")
+            if retry_after is not None:
+                try:
+                    bench = float(retry_after)
+                except ValueError:
+                    pass
+            key.benched_until = now + bench
+            logger.warning(f"{key} is rate limited, benched for {bench:.1f}s")
+
+    def rate_limit_headers(self) -> dict[str, str]:
+        # 사용 가능한 키들의 한도를 합쳐서 스케줄러의 전체 처리량으로 사용
+        now = time.monotonic()
+        available = [key for key in self.keys if key.is_available(now)]
+        headers = {}
+        for name in ("requests", "tokens"):
+            if not available or any(name not in key.limit for key in available):
+                continue
+            limit = sum(key.limit[name] for key in available)
+            remaining = sum(
+                (
+                    key.remaining[name]
+                    if key.reset_at.get(name, 0) > now
+                    else key.limit[name]
+                )
+                for key in available
+            )
+            headers[f"x-ratelimit-limit-{name}"] = str(limit)
+            headers[f"x-ratelimit-remaining-{name}"] = str(remaining)
+        return headers
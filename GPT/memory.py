@@ -0,0 +1,247 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter, OrderedDict
+import numpy as np
+from .message import BaseMessage, UserMessage, AssistanceMessage
+
+logger = logging.getLogger(__name__)
+
+
+class Embedder:
+    dimension: int
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        # (len(texts), dimension) 크기의 L2 정규화된 float32 배열
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    # 외부 모델 없이 단어와 글자 n-gram 을 해싱해서 만드는 임베딩
+    WORD = re.compile(r"\w+")
+
+    def __init__(self, dimension: int = 1024, ngram: int = 2):
+        self.dimension = dimension
+        self.ngram = ngram
+
+    def features(self, text: str) -> list[str]:
+        features = []
+        for word in self.WORD.findall(text.lower()):
+            features.append(word)
+            # 한국어는 조사가 붙어 있어서 글자 단위로도 나눔
+            for start in range(len(word) - self.ngram + 1):
+                features.append("#" + word[start : start + self.ngram])
+        return features
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in Counter(self.features(text)).items():
+                digest = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                vectors[row, digest % self.dimension] += sign * (1 + math.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class VectorIndex:
+    INITIAL_CAPACITY: int = 64
+
+    def __init__(self, dimension: int, path: str | None = None):
+        # path 가 있으면 벡터는 path.vec 에 memmap 으로, 문장은 path.jsonl 에 저장
+        self.dimension = dimension
+        self.path = path
+        self.texts: list[str] = []
+        if path and os.path.isfile(path + ".jsonl"):
+            with open(path + ".jsonl", "r", encoding="utf-8") as f:
+                self.texts = [json.loads(line) for line in f]
+        # 다시 불러온 대화가 잘릴 때 같은 문장을 또 저장하지 않도록 해시로 구분
+        self.digests: set[bytes] = {self.make_digest(text) for text in self.texts}
+        self.vectors = self.open_vectors(
+            max(self.INITIAL_CAPACITY, len(self.texts)), None
+        )
+
+    def open_vectors(self, capacity: int, old: np.ndarray | None) -> np.ndarray:
+        if self.path is None:
+            vectors = np.zeros((capacity, self.dimension), dtype=np.float32)
+            if old is not None:
+                vectors[: len(old)] = old
+            return vectors
+        if old is not None:
+            old.flush()
+        file_name = self.path + ".vec"
+        size = capacity * self.dimension * 4
+        with open(file_name, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+            else:
+                capacity = f.tell() // (self.dimension * 4)
+        return np.memmap(
+            file_name, dtype=np.float32, mode="r+", shape=(capacity, self.dimension)
+        )
+
+    @staticmethod
+    def make_digest(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def unseen(self, texts: list[str]) -> list[int]:
+        # 아직 저장하지 않은 문장의 위치, 같은 목록 안의 중복도 하나만 남김
+        digests = set()
+        indexes = []
+        for i, text in enumerate(texts):
+            digest = self.make_digest(text)
+            if digest not in self.digests and digest not in digests:
+                digests.add(digest)
+                indexes.append(i)
+        return indexes
+
+    def add(self, texts: list[str], vectors: np.ndarray) -> None:
+        indexes = self.unseen(texts)
+        if len(indexes) < len(texts):
+            texts = [texts[i] for i in indexes]
+            vectors = vectors[indexes]
+        if not texts:
+            return
+        count = len(self.texts)
+        if count + len(texts) > len(self.vectors):
+            capacity = max(len(self.vectors) * 2, count + len(texts))
+            self.vectors = self.open_vectors(capacity, self.vectors)
+        self.vectors[count : count + len(texts)] = vectors
+        if self.path:
+            # 벡터를 먼저 기록하고 문장을 추가해야 중간에 멈춰도 개수가 맞음
+            self.vectors.flush()
+            with open(self.path + ".jsonl", "a", encoding="utf-8") as f:
+                f.writelines(
+                    json.dumps(text, ensure_ascii=False) + "\n" for text in texts
+                )
+        self.texts.extend(texts)
+        self.digests.update(self.make_digest(text) for text in texts)
+
+    def search(self, vector: np.ndarray, k: int) -> list[tuple[float, str]]:
+        count = len(self.texts)
+        if not count or k <= 0:
+            return []
+        scores = self.vectors[:count] @ vector
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[index]), self.texts[index]) for index in top]
+
+    def close(self) -> None:
+        if isinstance(self.vectors, np.memmap):
+            self.vectors.flush()
+
+    def remove(self) -> None:
+        self.vectors = None
+        self.texts = []
+        self.digests = set()
+        if self.path:
+            self.remove_files(self.path)
+
+    @staticmethod
+    def remove_files(path: str) -> None:
+        for suffix in (".vec", ".jsonl"):
+            if os.path.isfile(path + suffix):
+                os.remove(path + suffix)
+
+
+class RetrievalMemory:
+    ROLES: tuple[str, ...] = (UserMessage.role, AssistanceMessage.role)
+
+    def __init__(
+        self,
+        embedder: Embedder | None = None,
+        directory: str | None = None,
+        top_k: int = 3,
+        min_score: float = 0.2,
+        snippet_chars: int = 300,
+        max_open: int = 64,
+    ):
+        self.embedder = embedder if embedder else HashingEmbedder()
+        self.directory = directory
+        self.top_k = top_k
+        self.min_score = min_score
+        self.snippet_chars = snippet_chars
+        self.max_open = max_open  # 색인을 들고 있을 채널 수
+        self.indexes: OrderedDict[int, VectorIndex] = OrderedDict()
+        self.lock = threading.Lock()
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get_index(self, channel_id: int, create: bool = True) -> VectorIndex | None:
+        if channel_id in self.indexes:
+            self.indexes.move_to_end(channel_id)
+            return self.indexes[channel_id]
+        path = os.path.join(self.directory, str(channel_id)) if self.directory else None
+        if not create and not (path and os.path.isfile(path + ".jsonl")):
+            return None
+        index = VectorIndex(self.embedder.dimension, path)
+        self.indexes[channel_id] = index
+        if len(self.indexes) > self.max_open:
+            # 파일이 없는 색인은 버려지므로 오래 쓰지 않은 채널의 기억은 사라짐
+            _, old_index = self.indexes.popitem(last=False)
+            old_index.close()
+        return index
+
+    def make_snippet(self, message: BaseMessage) -> str:
+        return f"{message.role}: {message.content[: self.snippet_chars]}"
+
+    def remember(self, channel_id: int, messages: list[BaseMessage]) -> None:
+        texts = [
+            self.make_snippet(message)
+            for message in messages
+            if message.role in self.ROLES and message.content.strip()
+        ]
+        with self.lock:
+            index = self.get_index(channel_id)
+            texts = [texts[i] for i in index.unseen(texts)]
+        if not texts:
+            return
+        vectors = self.embedder.embed(texts)
+        with self.lock:
+            self.get_index(channel_id).add(texts, vectors)
+
+    def recall(self, channel_id: int, query: str, k: int | None = None) -> list[str]:
+        with self.lock:
+            if self.get_index(channel_id, create=False) is None:
+                return []
+        vector = self.embedder.embed([query])[0]
+        with self.lock:
+            index = self.get_index(channel_id)
+            results = index.search(vector, self.top_k if k is None else k)
+        return [text for score, text in results if score >= self.min_score]
+
+    def memory_size(self, channel_id: int) -> int:
+        # 파일에 매핑된 벡터는 운영체제가 관리하므로 메모리 색인만 셈
+        with self.lock:
+            index = self.indexes.get(channel_id)
+            if index is None or index.path is not None:
+                return 0
+            return index.vectors.nbytes
+
+    def release(self, channel_id: int) -> None:
+        # 채널이 정리될 때 색인을 닫음, 파일은 남겨서 다시 열 수 있게 함
+        with self.lock:
+            index = self.indexes.pop(channel_id, None)
+            if index is not None:
+                index.close()
+
+    def forget(self, channel_id: int) -> None:
+        with self.lock:
+            index = self.indexes.pop(channel_id, None)
+            if index is not None:
+                index.remove()
+            elif self.directory:
+                VectorIndex.remove_files(os.path.join(self.directory, str(channel_id)))
+
+    def close(self) -> None:
+        with self.lock:
+            for index in self.indexes.values():
+                index.close()
+            self.indexes.clear()
@@ -1,19 +1,70 @@
 from __future__ import annotations
 import logging
 import copy
-from typing import Any
+import itertools
+import json
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from types import MappingProxyType
+from typing import Any, Mapping, TYPE_CHECKING
 from .token import Tokener
 from .setting import Setting
+from .serializer import dumps
+
+if TYPE_CHECKING:
+    from .store import ConversationStore
 
 logger = logging.getLogger(__name__)
 
 
+# 비어 있는 function_call 은 모든 메시지가 같은 읽기 전용 객체를 공유함
+EMPTY_FUNCTION_CALL: Mapping[str, str] = MappingProxyType({})
+EMPTY_TOOL_CALLS: tuple = ()
+
+
 class BaseMessage:
+    __slots__ = (
+        "_content",
+        "token",
+        "token_model",
+        "fragment",
+    )
+    role: str = ""
+
     def __init__(self, content: str):
-        self.role: str = ""
-        self.content: str = content if content else ""
+        self._content: str = content if content else ""
+        self.reset_message()
+
+    # 값이 바뀌면 make_fragment 캐시와 토큰 수를 비움
+    @property
+    def content(self) -> str:
+        return self._content
+
+    @content.setter
+    def content(self, value: str) -> None:
+        self._content = value
+        self.reset_message()
+
+    def reset_message(self) -> None:
+        self.fragment: bytes | None = None
+        # copy.copy 로 만든 메시지가 이전 내용의 토큰 수를 갖고 있지 않게 함
+        self.token: int = 0
+        self.token_model: str = ""
 
     def make_message(self) -> dict[str, str]:
+        # 메시지마다 dict 를 들고 있으면 힙이 커지므로 매번 새로 만듦
+        return self.build_message()
+
+    def make_fragment(self) -> bytes:
+        # 요청 본문에 그대로 이어 붙이는 JSON 조각, 메시지가 캐시하는 유일한 값
+        if self.fragment is None:
+            self.fragment = dumps(self.build_message())
+        return self.fragment
+
+    def build_message(self) -> dict[str, str]:
         return {"role": self.role, "content": self.content}
 
     def __str__(self) -> str:
@@ -21,68 +72,192 @@ class BaseMessage:
             f"< {self.__class__.__name__} role: {self.role}, content: {self.content} >"
         )
 
+    def __repr__(self) -> str:
+        return str(self)
+
     def __add__(self, other: BaseMessage) -> BaseMessage:
-        temp = copy.deepcopy(self)
+        temp = copy.copy(self)
         temp.content += other.content
         return temp
 
 
 class SystemMessage(BaseMessage):
-    def __init__(self, content: str):
-        super().__init__(content=content)
-        self.role = "system"
+    __slots__ = ()
+    role = sys.intern("system")
 
 
 class UserMessage(BaseMessage):
-    def __init__(self, content: str):
-        super().__init__(content=content)
-        self.role = "user"
+    __slots__ = ()
+    role = sys.intern("user")
 
 
 class AssistanceMessage(BaseMessage):
+    __slots__ = ("_function_call", "_tool_calls", "finish_reason")
+    role = sys.intern("assistant")
+
     NULL: str = "null"
     STOP: str = "stop"
     LENGHT: str = "length"
     FUNCTION_CALL: str = "function_call"
+    TOOL_CALLS: str = "tool_calls"
     CONTENT_FILTER: str = "content_filter"
 
-    def __init__(self, data: dict[str, dict[str, str] | str] = {}):
+    def __init__(self, data: dict[str, dict[str, str] | str] | None = None):
+        data = data if data else {}
         delta = data.get("delta", {})
         super().__init__(content=delta.get("content"))
-        self.function_call = delta.get("function_call", {})
+        self._function_call: Mapping[str, str] = (
+            delta.get("function_call") or EMPTY_FUNCTION_CALL
+        )
+        self._tool_calls: tuple[dict, ...] = tuple(
+            delta.get("tool_calls") or EMPTY_TOOL_CALLS
+        )
         self.finish_reason = data.get("finish_reason", "null")
-        self.role = "assistant"
 
-    def make_message(self) -> dict[str, str]:
-        message = super().make_message()
+    @property
+    def function_call(self) -> Mapping[str, str]:
+        return self._function_call
+
+    @function_call.setter
+    def function_call(self, value: Mapping[str, str]) -> None:
+        self._function_call = value if value else EMPTY_FUNCTION_CALL
+        self.reset_message()
+
+    # 병렬 호출 형식, {"id", "type", "function": {"name", "arguments"}} 의 목록
+    @property
+    def tool_calls(self) -> tuple[dict, ...]:
+        return self._tool_calls
+
+    @tool_calls.setter
+    def tool_calls(self, value: list[dict] | tuple[dict, ...]) -> None:
+        self._tool_calls = tuple(value) if value else EMPTY_TOOL_CALLS
+        self.reset_message()
+
+    def build_message(self) -> dict[str, str]:
+        message = super().build_message()
         if self.function_call:
             message["function_call"] = self.function_call
+        if self.tool_calls:
+            message["tool_calls"] = list(self.tool_calls)
         return message
 
     def __str__(self) -> str:
         return f"< {self.__class__.__name__} role: {self.role}, content: {self.content}, function_call: {self.function_call} finish_reason: {self.finish_reason} >"
 
     def __add__(self, other: AssistanceMessage) -> AssistanceMessage:
-        temp = copy.deepcopy(self)
+        temp = copy.copy(self)
         temp.content += other.content
         if other.finish_reason != self.NULL:
             temp.finish_reason = other.finish_reason
-        for key, value in other.function_call.items():
-            if key in temp.function_call:
-                temp.function_call[key] += value
-            else:
-                temp.function_call[key] = value
+        if other.function_call:
+            function_call = dict(temp.function_call)
+            for key, value in other.function_call.items():
+                function_call[key] = function_call.get(key, "") + value
+            temp.function_call = function_call
+        if other.tool_calls:
+            temp.tool_calls = merge_tool_calls(temp.tool_calls, other.tool_calls)
         return temp
 
 
+def merge_tool_calls(tool_calls: tuple[dict, ...], deltas: tuple[dict, ...]) -> list:
+    # 스트림 조각은 index 로 구분되고 name, arguments 는 나눠서 들어옴
+    merged = dict(enumerate(tool_calls))
+    for delta in deltas:
+        index = delta.get("index", len(merged))
+        call = merged.get(index)
+        if call is None:
+            call = {"id": "", "type": "function", "function": {}}
+        else:
+            call = dict(call, function=dict(call.get("function", {})))
+        for key in ("id", "type"):
+            if delta.get(key):
+                call[key] = delta[key]
+        for key, value in delta.get("function", {}).items():
+            call["function"][key] = call["function"].get(key, "") + value
+        merged[index] = call
+    return [merged[index] for index in sorted(merged)]
+
+
+class AssistanceStream:
+    def __init__(self):
+        self.content_parts: list[str] = []
+        self.function_call_parts: dict[str, list[str]] = {}
+        # index 별 id 와 name, arguments 조각
+        self.tool_call_parts: dict[int, dict[str, str | list[str]]] = {}
+        self.finish_reason: str = AssistanceMessage.NULL
+        self.message: AssistanceMessage | None = None
+
+    def add(self, data: dict[str, dict[str, str] | str]) -> str:
+        delta = data.get("delta", {})
+        content = delta.get("content")
+        if content:
+            self.content_parts.append(content)
+        function_call = delta.get("function_call")
+        if function_call:
+            for key, value in function_call.items():
+                self.function_call_parts.setdefault(key, []).append(value)
+        for tool_call in delta.get("tool_calls") or ():
+            parts = self.tool_call_parts.setdefault(
+                tool_call.get("index", len(self.tool_call_parts)),
+                {"id": "", "name": [], "arguments": []},
+            )
+            if tool_call.get("id"):
+                parts["id"] = tool_call["id"]
+            function = tool_call.get("function", {})
+            for key in ("name", "arguments"):
+                if function.get(key):
+                    parts[key].append(function[key])
+        finish_reason = data.get("finish_reason")
+        if finish_reason and finish_reason != AssistanceMessage.NULL:
+            self.finish_reason = finish_reason
+        self.message = None
+        return content or ""
+
+    def to_message(self) -> AssistanceMessage:
+        if self.message is None:
+            message = AssistanceMessage()
+            message.content = "".join(self.content_parts)
+            message.function_call = {
+                key: "".join(value) for key, value in self.function_call_parts.items()
+            }
+            message.tool_calls = [
+                {
+                    "id": parts["id"],
+                    "type": "function",
+                    "function": {
+                        "name": "".join(parts["name"]),
+                        "arguments": "".join(parts["arguments"]),
+                    },
+                }
+                for _, parts in sorted(self.tool_call_parts.items())
+            ]
+            message.finish_reason = self.finish_reason
+            self.message = message
+        return self.message
+
+    def __str__(self) -> str:
+        return str(self.to_message())
+
+
 class FunctionMessage(BaseMessage):
+    __slots__ = ("_name",)
+    role = sys.intern("function")
+
     def __init__(self, name: str, content: Any):
         super().__init__(content=str(content))
-        self.role = "function"
-        self.name = name
+        self._name = name
 
-    def make_message(self) -> dict[str, str]:
-        message = super().make_message()
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, value: str) -> None:
+        self._name = value
+        self.reset_message()
+
+    def build_message(self) -> dict[str, str]:
+        message = super().build_message()
         message["name"] = self.name
         return message
 
@@ -90,58 +265,358 @@ class FunctionMessage(BaseMessage):
         return f"< {self.__class__.__name__} role: {self.role}, content: {self.content} name: {self.name} >"
 
     def __add__(self, other: FunctionMessage) -> FunctionMessage:
-        temp = copy.deepcopy(self)
+        temp = copy.copy(self)
         temp.content += other.content
         temp.name = other.name
         return temp
 
 
-class MessageBox:
+class ToolMessage(FunctionMessage):
+    # 병렬 호출 결과, tool_call_id 로 어떤 호출의 결과인지 구분함
+    __slots__ = ("tool_call_id",)
+    role = sys.intern("tool")
+
+    def __init__(self, name: str, content: Any, tool_call_id: str):
+        super().__init__(name=name, content=content)
+        self.tool_call_id = tool_call_id
+
+    def build_message(self) -> dict[str, str]:
+        message = BaseMessage.build_message(self)
+        message["tool_call_id"] = self.tool_call_id
+        return message
+
+    def __str__(self):
+        return f"< {self.__class__.__name__} role: {self.role}, content: {self.content} name: {self.name} tool_call_id: {self.tool_call_id} >"
+
+
+class ColdStorageStats:
     def __init__(self):
-        self.messaes: list[BaseMessage] = []
+        self.lock = threading.Lock()
+        self.compactions: int = 0
+        self.inflations: int = 0
+        self.memory_bytes: int = 0
+        self.compressed_bytes: int = 0
+        self.inflate_seconds: float = 0.0
+        self.max_inflate_seconds: float = 0.0
+
+    def add_compaction(self, memory_bytes: int, compressed_bytes: int) -> None:
+        with self.lock:
+            self.compactions += 1
+            self.memory_bytes += memory_bytes
+            self.compressed_bytes += compressed_bytes
+
+    def add_inflation(self, seconds: float) -> None:
+        with self.lock:
+            self.inflations += 1
+            self.inflate_seconds += seconds
+            self.max_inflate_seconds = max(self.max_inflate_seconds, seconds)
+
+    def stats(self) -> dict[str, int | float]:
+        with self.lock:
+            return {
+                "compactions": self.compactions,
+                "inflations": self.inflations,
+                "ratio": (
+                    self.memory_bytes / self.compressed_bytes
+                    if self.compressed_bytes
+                    else 0.0
+                ),
+                "avg_inflate_ms": (
+                    self.inflate_seconds / self.inflations * 1000
+                    if self.inflations
+                    else 0.0
+                ),
+                "max_inflate_ms": self.max_inflate_seconds * 1000,
+            }
+
 
-    def add_message(self, message: BaseMessage):
+class MessageBox:
+    REPLY_TOKEN: int = 2  # 답변은 <im_start>assistant로 시작함
+    cold_stats: ColdStorageStats = ColdStorageStats()
+    # max_token 대비 비율, 요약 모드에서 HIGH_WATER 를 넘으면 오래된 SPAN 만큼을 요약
+    SUMMARY_HIGH_WATER: float = 0.75
+    SUMMARY_SPAN: float = 0.5
+    SUMMARY_KEEP: int = 4  # 요약하지 않고 남겨둘 최근 메시지 수
+    RESULT_ROLES: tuple[str, ...] = ("function", "tool")
+
+    def __init__(
+        self, store: ConversationStore | None = None, channel_id: int | None = None
+    ):
+        self.store = store
+        self.channel_id = channel_id
+        self.messaes: deque[BaseMessage] = deque()
+        self.token_model: str = Tokener.DEFAULT_MODEL
+        self.total_token: int = 0
+        self.uncounted: int = 0  # 아직 토큰을 세지 않은 마지막 메시지 수
+        self.memory_size: int = 0  # 메시지가 차지하는 대략적인 바이트 수
+        self.cold: bytes | None = None  # 압축해 둔 메시지, 토큰 수도 같이 보관
+        self.cold_count: int = 0
+        # 잘려나간 메시지를 모아둘 목록, 검색 메모리를 쓸 때만 사용
+        self.evicted: list[BaseMessage] | None = None
+        self.system_message: SystemMessage | None = None
+
+    def add_message(self, message: BaseMessage, save: bool = True):
+        self.inflate()
+        if save and self.store:
+            self.store.append(self.channel_id, message)
         self.messaes.append(message)
+        self.memory_size += self.get_message_size(message)
+        self.uncounted += 1
 
-    def make_messages(self, setting: Setting | None = None) -> list[dict[str, str]]:
+    def make_messages(
+        self, setting: Setting | None = None, reserved_token: int = 0
+    ) -> list[dict[str, str]]:
+        return self.convert_messages(self.make_window(setting, reserved_token))
+
+    def make_window(
+        self, setting: Setting | None = None, reserved_token: int = 0
+    ) -> list[BaseMessage]:
+        # reserved_token 은 대화 기록 외에 프롬프트에 추가로 넣을 토큰 수
         messages = []
+        self.inflate()
         if not setting:
-            return [message.make_message() for message in self.messaes]
-        while self.get_token(setting) > setting.max_token:
-            self.messaes = self.messaes[1:]
+            return list(self.messaes)
+        max_token = setting.max_token - reserved_token
+        while self.messaes and self.get_token(setting) > max_token:
+            self.pop_message()
+        # 호출 메시지가 잘려나간 병렬 호출 결과는 API 가 받지 않음
+        while self.messaes and self.messaes[0].role == ToolMessage.role:
+            self.pop_message()
         if setting.system_text:
-            messages = [
-                SystemMessage(content=setting.system_text),
-            ]
+            messages = [self.get_system_message(setting.system_text)]
         messages.extend(self.messaes)
-        return self.convert_messages(messages)
+        return messages
+
+    def get_system_message(self, system_text: str) -> SystemMessage:
+        # 같은 객체를 재사용해야 직렬화한 조각도 재사용됨
+        if self.system_message is None or self.system_message.content != system_text:
+            self.system_message = SystemMessage(content=system_text)
+        return self.system_message
+
+    def pop_message(self) -> BaseMessage:
+        message = self.messaes.popleft()
+        if self.evicted is not None:
+            self.evicted.append(message)
+        self.memory_size -= self.get_message_size(message)
+        if len(self.messaes) < self.uncounted:
+            self.uncounted -= 1
+        else:
+            self.total_token -= message.token
+        return message
 
     def get_token(self, setting: Setting | None = None) -> int:
-        if not setting.system_text:
-            return Tokener.num_tokens_from_messages(
-                messages=self.convert_messages(messages=self.messaes),
-            )
-        return Tokener.num_tokens_from_messages(
-            messages=self.convert_messages(
-                messages=[
-                    SystemMessage(content=setting.system_text),
-                    *self.messaes,
-                ]
-            ),
-            model=setting.model,
+        model = setting.model if setting else Tokener.DEFAULT_MODEL
+        self.inflate()
+        self.count_tokens(model)
+        num_tokens = self.total_token + self.REPLY_TOKEN
+        if setting and setting.system_text:
+            num_tokens += self.get_system_token(setting.system_text, model)
+        return num_tokens
+
+    def count_tokens(self, model: str) -> None:
+        if model != self.token_model:
+            self.token_model = model
+            self.total_token = 0
+            self.uncounted = len(self.messaes)
+        if not self.uncounted:
+            return
+        for message in itertools.islice(reversed(self.messaes), self.uncounted):
+            if message.token_model != model:
+                message.token = Tokener.num_tokens_of_message(
+                    message.make_message(), model=model
+                )
+                message.token_model = model
+            self.total_token += message.token
+        self.uncounted = 0
+
+    async def async_count_tokens(self, setting: Setting) -> None:
+        # 큰 메시지는 스레드에서 미리 세어두고, 합계 갱신은 count_tokens 에서 처리
+        self.inflate()
+        model = setting.model
+        uncounted = self.uncounted if model == self.token_model else len(self.messaes)
+        pending = [
+            message
+            for message in itertools.islice(reversed(self.messaes), uncounted)
+            if message.token_model != model
+        ]
+        if setting.system_text:
+            system_message = self.get_system_message(setting.system_text)
+            if system_message.token_model != model:
+                pending.append(system_message)
+        if not pending:
+            return
+        counts = await Tokener.async_num_tokens_of_messages(
+            [message.make_message() for message in pending], model=model
+        )
+        for message, token in zip(pending, counts):
+            message.token = token
+            message.token_model = model
+
+    async def async_make_messages(
+        self, setting: Setting, reserved_token: int = 0
+    ) -> list[dict[str, str]]:
+        return self.convert_messages(
+            await self.async_make_window(setting, reserved_token)
         )
 
+    async def async_make_window(
+        self, setting: Setting, reserved_token: int = 0
+    ) -> list[BaseMessage]:
+        await self.async_count_tokens(setting)
+        return self.make_window(setting=setting, reserved_token=reserved_token)
+
+    def get_system_token(self, system_text: str, model: str) -> int:
+        system_message = self.get_system_message(system_text)
+        if system_message.token_model != model:
+            system_message.token = Tokener.num_tokens_of_message(
+                system_message.make_message(), model=model
+            )
+            system_message.token_model = model
+        return system_message.token
+
     def convert_messages(self, messages: list[BaseMessage]) -> list[dict[str, str]]:
         return [message.make_message() for message in messages]
 
+    @staticmethod
+    def get_message_size(message: BaseMessage) -> int:
+        size = sys.getsizeof(message) + sys.getsizeof(message.content)
+        for value in getattr(message, "function_call", {}).values():
+            size += sys.getsizeof(value)
+        for tool_call in getattr(message, "tool_calls", EMPTY_TOOL_CALLS):
+            size += sys.getsizeof(tool_call["function"].get("arguments", ""))
+        return size
+
+    def take_evicted(self) -> list[BaseMessage]:
+        evicted = self.evicted if self.evicted else []
+        if self.evicted is not None:
+            self.evicted = []
+        return evicted
+
+    def need_summary(self, setting: Setting) -> bool:
+        if setting.history_mode != Setting.SUMMARY:
+            return False
+        if len(self) <= self.SUMMARY_KEEP:
+            return False
+        return self.get_token(setting) >= setting.max_token * self.SUMMARY_HIGH_WATER
+
+    def get_summary_span(self, setting: Setting) -> list[BaseMessage]:
+        self.inflate()
+        self.count_tokens(setting.model)
+        target = setting.max_token * self.SUMMARY_SPAN
+        span = []
+        token = 0
+        for message in itertools.islice(
+            self.messaes, max(len(self.messaes) - self.SUMMARY_KEEP, 0)
+        ):
+            # 함수 결과는 호출한 메시지와 같이 요약함
+            if token >= target and message.role not in self.RESULT_ROLES:
+                break
+            span.append(message)
+            token += message.token
+        return span
+
+    def replace_with_summary(
+        self, span: list[BaseMessage], content: str, model: str
+    ) -> SystemMessage | None:
+        # 요약하는 동안 잘려나간 메시지는 건너뛰고, 남은 부분만 요약으로 바꿈
+        self.inflate()
+        span_ids = {id(message) for message in span}
+        removed = 0
+        while self.messaes and id(self.messaes[0]) in span_ids:
+            self.pop_message()
+            removed += 1
+        if not removed:
+            return None
+        self.count_tokens(model)
+        summary = SystemMessage(content=content)
+        summary.token = Tokener.num_tokens_of_message(summary.make_message(), model)
+        summary.token_model = model
+        self.messaes.appendleft(summary)
+        self.memory_size += self.get_message_size(summary)
+        self.total_token += summary.token
+        return summary
+
+    def compact(self) -> None:
+        # 한동안 쓰지 않은 대화를 하나의 zlib 블록으로 압축해서 보관
+        if self.cold is not None or not self.messaes:
+            return
+        rows = [self.dump_message(message) for message in self.messaes]
+        data = json.dumps(rows, ensure_ascii=False, separators=(",", ":"))
+        self.cold = zlib.compress(data.encode("utf-8"))
+        self.cold_count = len(self.messaes)
+        self.cold_stats.add_compaction(self.memory_size, sys.getsizeof(self.cold))
+        self.messaes = deque()
+        self.memory_size = sys.getsizeof(self.cold)
+
+    def inflate(self) -> None:
+        if self.cold is None:
+            return
+        start = time.perf_counter()
+        rows = json.loads(zlib.decompress(self.cold))
+        self.messaes = deque(self.load_message(row) for row in rows)
+        self.memory_size = sum(map(self.get_message_size, self.messaes))
+        self.cold = None
+        self.cold_count = 0
+        self.cold_stats.add_inflation(time.perf_counter() - start)
+
+    @staticmethod
+    def dump_message(message: BaseMessage) -> list:
+        return [
+            message.role,
+            message.content,
+            getattr(message, "name", None),
+            dict(getattr(message, "function_call", EMPTY_FUNCTION_CALL)),
+            getattr(message, "finish_reason", None),
+            message.token,
+            message.token_model,
+            list(getattr(message, "tool_calls", EMPTY_TOOL_CALLS)),
+            getattr(message, "tool_call_id", None),
+        ]
+
+    @staticmethod
+    def load_message(row: list) -> BaseMessage:
+        role, content, name, function_call, finish_reason = row[:5]
+        if role == AssistanceMessage.role:
+            message = AssistanceMessage()
+            message.content = content
+            message.function_call = function_call
+            message.tool_calls = row[7]
+            message.finish_reason = finish_reason
+        elif role == ToolMessage.role:
+            message = ToolMessage(name=name, content=content, tool_call_id=row[8])
+        elif role == FunctionMessage.role:
+            message = FunctionMessage(name=name, content=content)
+        elif role == SystemMessage.role:
+            message = SystemMessage(content=content)
+        else:
+            message = UserMessage(content=content)
+        message.token, message.token_model = row[5:7]
+        return message
+
     def clear(self):
+        if self.store:
+            self.store.clear(self.channel_id)
+        self.unload()
+
+    def unload(self):
+        # 저장소의 기록은 남기고 메모리에서만 비움
         self.messaes.clear()
+        self.cold = None
+        self.cold_count = 0
+        if self.evicted is not None:
+            self.evicted = []
+        self.memory_size = 0
+        self.total_token = 0
+        self.uncounted = 0
 
     def __len__(self):
-        return len(self.messaes)
+        return len(self.messaes) + self.cold_count
 
-    def __getitem__(self, idx) -> BaseMessage:
+    def __getitem__(self, idx) -> BaseMessage | list[BaseMessage]:
+        self.inflate()
+        if isinstance(idx, slice):
+            return list(self.messaes)[idx]
         return self.messaes[idx]
 
     def __str__(self):
-        return f"< MessageBox-{len(self.messaes)} >"
+        return f"< MessageBox-{len(self)} >"
@@ -0,0 +1,180 @@
+from __future__ import annotations
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import deque
+from typing import Hashable, Mapping
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, per_seconds: float = 60.0):
+        self.per_seconds = per_seconds
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float | None = None) -> None:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float | None = None) -> float:
+        self.refill(now)
+        amount = min(amount, self.capacity)  # 용량보다 큰 요청은 가득 찼을 때 통과
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+    def set_capacity(self, capacity: float) -> None:
+        if capacity > 0 and capacity != self.capacity:
+            self.refill()
+            self.capacity = capacity
+            self.rate = capacity / self.per_seconds
+            self.tokens = min(self.tokens, capacity)
+
+    def sync(self, remaining: float) -> None:
+        self.refill()
+        self.tokens = min(self.tokens, remaining)
+
+
+def parse_reset(value: str) -> float:
+    # "1s", "6m0s", "20ms" 형태의 x-ratelimit-reset-* 값을 초 단위로 변환
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    seconds = 0.0
+    for number, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value):
+        seconds += float(number) * units[unit]
+    return seconds
+
+
+class RequestScheduler:
+    _default: RequestScheduler | None = None
+
+    def __init__(
+        self,
+        requests_per_minute: int = 3500,
+        tokens_per_minute: int = 90000,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.blocked_until: float = 0.0
+        self.queues: dict[Hashable, deque[tuple[asyncio.Future, int]]] = {}
+        self.order: deque[Hashable] = deque()
+        self.wakeup: asyncio.Event | None = None
+        self.task: asyncio.Task | None = None
+
+    @classmethod
+    def default(cls) -> RequestScheduler:
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    async def acquire(self, channel_id: Hashable, tokens: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        if channel_id not in self.queues:
+            self.queues[channel_id] = deque()
+            self.order.append(channel_id)
+        self.queues[channel_id].append((future, tokens))
+        self.start()
+        await future
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.wakeup = asyncio.Event()
+            self.task = loop.create_task(self.dispatch())
+        else:
+            self.wakeup.set()
+
+    async def dispatch(self) -> None:
+        while self.order:
+            wait = self.next_ticket()
+            if wait is None:
+                continue
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def next_ticket(self) -> float | None:
+        # 채널마다 한 요청씩 돌아가며 처리해서 한 채널이 다른 채널을 굶기지 않게 함
+        channel_id = self.order[0]
+        queue = self.queues[channel_id]
+        future, tokens = queue[0]
+        if future.done():
+            self.pop_ticket(channel_id)
+            return None
+        now = time.monotonic()
+        wait = max(
+            self.blocked_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(tokens, now),
+        )
+        if wait > 0:
+            return wait
+        self.requests.consume(1)
+        self.tokens.consume(tokens)
+        future.set_result(None)
+        self.pop_ticket(channel_id)
+        return None
+
+    def pop_ticket(self, channel_id: Hashable) -> None:
+        queue = self.queues[channel_id]
+        queue.popleft()
+        if queue:
+            self.order.rotate(-1)
+        else:
+            self.order.popleft()
+            del self.queues[channel_id]
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        for bucket, name in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = headers.get(f"x-ratelimit-limit-{name}")
+            remaining = headers.get(f"x-ratelimit-remaining-{name}")
+            try:
+                if limit is not None:
+                    bucket.set_capacity(float(limit))
+                if remaining is not None:
+                    bucket.sync(float(remaining))
+            except ValueError:
+                logger.warning(f"invalid rate limit header: {limit}, {remaining}")
+
+    def retry_delay(
+        self, status_code: int, headers: Mapping[str, str], attempt: int
+    ) -> float | None:
+        if status_code not in RETRY_STATUS or attempt >= self.max_retries:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        retry_after = headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                delay += float(retry_after)
+            except ValueError:
+                pass
+        elif status_code == 429:
+            reset = max(
+                parse_reset(headers.get("x-ratelimit-reset-requests", "")),
+                parse_reset(headers.get("x-ratelimit-reset-tokens", "")),
+            )
+            delay += reset
+        if status_code == 429:
+            # 조직 단위 제한이므로 대기 중인 모든 요청을 같이 멈춤
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        logger.warning(f"request failed with {status_code}, retry after {delay:.2f}s")
+        return delay
@@ -1,15 +1,441 @@
+import asyncio
+import bisect
+import datetime
+import heapq
+import itertools
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class CronExpression:
+    # 분 시 일 월 요일, 요일은 0(일요일)부터 6까지이고 7도 일요일로 처리
+    ALIASES: dict[str, str] = {
+        "@hourly": "0 * * * *",
+        "@daily": "0 0 * * *",
+        "@weekly": "0 0 * * 0",
+        "@monthly": "0 0 1 * *",
+        "@yearly": "0 0 1 1 *",
+    }
+    MONTHS: list[str] = "jan feb mar apr may jun jul aug sep oct nov dec".split()
+    WEEKDAYS: list[str] = "sun mon tue wed thu fri sat".split()
+    SEARCH_YEARS: int = 5  # 이 기간 안에 맞는 시각이 없으면 잘못된 표현식으로 봄
+    cache: dict[str, "CronExpression"] = {}
+
+    def __init__(self, text: str):
+        self.text = text
+        fields = self.ALIASES.get(text.strip().lower(), text).split()
+        if len(fields) != 5:
+            raise ValueError(f"cron needs 5 fields: {text}")
+        self.minutes = self.parse_field(fields[0], 0, 59)
+        self.hours = self.parse_field(fields[1], 0, 23)
+        self.days = self.parse_field(fields[2], 1, 31)
+        self.months = self.parse_field(fields[3], 1, 12, self.MONTHS)
+        weekdays = self.parse_field(fields[4], 0, 7, self.WEEKDAYS)
+        self.weekdays = sorted({weekday % 7 for weekday in weekdays})
+        # 일과 요일이 둘 다 지정되면 둘 중 하나만 맞아도 실행됨
+        self.any_day = fields[2].startswith("*")
+        self.any_weekday = fields[4].startswith("*")
+        # 같은 표현식의 일정은 보통 같은 분에 다음 시각을 구하므로 마지막 결과를 재사용
+        self.last: tuple[int, float] = (-1, 0.0)
+
+    @classmethod
+    def parse(cls, text: str) -> "CronExpression":
+        # 같은 표현식을 쓰는 일정은 하나의 객체를 공유함
+        expression = cls.cache.get(text)
+        if expression is None:
+            expression = cls(text)
+            if len(cls.cache) < 4096:
+                cls.cache[text] = expression
+        return expression
+
+    @staticmethod
+    def parse_field(
+        field: str, low: int, high: int, names: list[str] | None = None
+    ) -> list[int]:
+        values = set()
+        for part in field.lower().split(","):
+            value_range, _, step_text = part.partition("/")
+            step = int(step_text) if step_text else 1
+            if value_range == "*":
+                start, end = low, high
+            else:
+                start_text, _, end_text = value_range.partition("-")
+                start = CronExpression.parse_value(start_text, low, names)
+                if end_text:
+                    end = CronExpression.parse_value(end_text, low, names)
+                else:
+                    end = high if step_text else start
+            if not low <= start <= end <= high or step < 1:
+                raise ValueError(f"invalid cron field: {field}")
+            values.update(range(start, end + 1, step))
+        return sorted(values)
+
+    @staticmethod
+    def parse_value(text: str, low: int, names: list[str] | None) -> int:
+        if names and text in names:
+            return names.index(text) + low
+        return int(text)
+
+    def match_day(self, day: datetime.datetime) -> bool:
+        in_days = day.day in self.days
+        # datetime 은 월요일이 0 이므로 cron 기준으로 바꿈
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_time(self, after: float) -> float:
+        # after 이후 처음으로 맞는 시각, 지역 시간 기준
+        minute = int(after // 60)
+        if self.last[0] == minute:
+            return self.last[1]
+        result = self.find_next_time(after)
+        self.last = (minute, result)
+        return result
+
+    def find_next_time(self, after: float) -> float:
+        t = datetime.datetime.fromtimestamp(after).replace(second=0, microsecond=0)
+        t += datetime.timedelta(minutes=1)
+        end_year = t.year + self.SEARCH_YEARS
+        while t.year <= end_year:
+            if t.month not in self.months:
+                t = (t.replace(day=1) + datetime.timedelta(days=32)).replace(
+                    day=1, hour=0, minute=0
+                )
+                continue
+            if not self.match_day(t):
+                t = (t + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            index = bisect.bisect_left(self.hours, t.hour)
+            if index == len(self.hours):
+                t = (t + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if self.hours[index] != t.hour:
+                t = t.replace(hour=self.hours[index], minute=0)
+            index = bisect.bisect_left(self.minutes, t.minute)
+            if index == len(self.minutes):
+                t = (t + datetime.timedelta(hours=1)).replace(minute=0)
+                continue
+            return t.replace(minute=self.minutes[index]).timestamp()
+        raise ValueError(f"cron never matches: {self.text}")
+
+    def __str__(self) -> str:
+        return self.text
+
+
+class ScheduleEntry:
+    __slots__ = ("channel_id", "name", "description", "cron", "next_time", "version")
+
+    def __init__(
+        self,
+        channel_id: Hashable,
+        name: str,
+        description: str,
+        cron: CronExpression,
+        next_time: float,
+    ):
+        self.channel_id = channel_id
+        self.name = name
+        self.description = description
+        self.cron = cron
+        self.next_time = next_time
+        self.version: int = 0  # 힙에 남은 이전 항목을 구분하기 위한 값
+
+    def to_dict(self) -> dict[str, str | float]:
+        return {
+            "description": self.description,
+            "cron": str(self.cron),
+            "next_time": datetime.datetime.fromtimestamp(self.next_time).isoformat(
+                sep=" ", timespec="minutes"
+            ),
+        }
+
+    def __str__(self) -> str:
+        return f"< ScheduleEntry channel: {self.channel_id}, name: {self.name}, cron: {self.cron} >"
+
+
+Dispatch = Callable[[ScheduleEntry, float], Awaitable[None]]
+
+
 class Schedule:
-    def __init__(self):
-        self.schedule = {}
+    # 모든 채널의 일정을 하나의 최소 힙에 두고, 태스크 하나가 가장 이른 시각까지 잠듦
+    MAX_SLEEP: float = 60.0  # 시스템 시간이 바뀌어도 이 간격으로 다시 확인
+
+    def __init__(
+        self,
+        path: str | None = None,
+        dispatch: Dispatch | None = None,
+        catch_up_seconds: float = 3600.0,
+        max_per_channel: int = 25,
+    ):
+        self.path = path  # None 이면 저장하지 않음
+        self.dispatch = dispatch
+        # 재시작 후 이 시간 안에 놓친 일정은 한 번 실행
+        self.catch_up_seconds = catch_up_seconds
+        # 모델이 일정을 끝없이 만들지 못하게 채널마다 개수를 제한
+        self.max_per_channel = max_per_channel
+        self.schedule: dict[tuple[Hashable, str], ScheduleEntry] = {}
+        # 채널별 일정, 목록과 개수 확인이 전체 일정 수에 비례하지 않게 함
+        self.channels: dict[Hashable, dict[str, ScheduleEntry]] = {}
+        self.heap: list[tuple[float, int, int, ScheduleEntry]] = []
+        self.counter = itertools.count()
+        self.task: asyncio.Task | None = None
+        self.wakeup: asyncio.Event | None = None
+        self.dispatching: set[asyncio.Task] = set()
+        self.con: sqlite3.Connection | None = None
+        # 쓰기 작업은 순서대로 쌓아두고 스레드에서 기록함, deque 는 스레드 간에 안전함
+        self.pending: deque[tuple[str, list[tuple]]] = deque()
+        self.lock = threading.Lock()
+        self.writer: asyncio.Task | None = None
+        if path:
+            self.con = sqlite3.connect(path, check_same_thread=False)
+            self.con.execute("PRAGMA journal_mode=WAL")
+            self.con.execute(
+                "CREATE TABLE IF NOT EXISTS schedules ("
+                "channel_id INTEGER NOT NULL, name TEXT NOT NULL,"
+                " description TEXT NOT NULL, cron TEXT NOT NULL,"
+                " next_time REAL NOT NULL, PRIMARY KEY (channel_id, name))"
+            )
+            self.con.commit()
+            self.load()
+
+    def load(self, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        rows = self.con.execute(
+            "SELECT channel_id, name, description, cron, next_time FROM schedules"
+        ).fetchall()
+        skipped = 0
+        for channel_id, name, description, cron, next_time in rows:
+            expression = CronExpression.parse(cron)
+            # 너무 오래전에 놓친 일정은 건너뛰고 다음 시각으로 옮김
+            if next_time < now - self.catch_up_seconds:
+                next_time = expression.next_time(now)
+                skipped += 1
+            entry = ScheduleEntry(channel_id, name, description, expression, next_time)
+            self.schedule[(channel_id, name)] = entry
+            self.channels.setdefault(channel_id, {})[name] = entry
+            self.push(entry)
+        if rows:
+            logger.info(
+                f"{len(rows)} schedules loaded, {skipped} missed schedules skipped"
+            )
+
+    def push(self, entry: ScheduleEntry) -> None:
+        heapq.heappush(
+            self.heap, (entry.next_time, next(self.counter), entry.version, entry)
+        )
+        # 힙에 버려진 항목이 너무 많이 쌓이면 다시 만듦
+        if len(self.heap) > 2 * len(self.schedule) + 64:
+            self.heap = [
+                (entry.next_time, next(self.counter), entry.version, entry)
+                for entry in self.schedule.values()
+            ]
+            heapq.heapify(self.heap)
+        if self.wakeup is not None and self.heap[0][3] is entry:
+            self.wakeup.set()
+
+    def save(self, entries: list[ScheduleEntry]) -> None:
+        self.write(
+            "INSERT OR REPLACE INTO schedules"
+            " (channel_id, name, description, cron, next_time)"
+            " VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    entry.channel_id,
+                    entry.name,
+                    entry.description,
+                    str(entry.cron),
+                    entry.next_time,
+                )
+                for entry in entries
+            ],
+        )
+
+    def write(self, sql: str, rows: list[tuple]) -> None:
+        # 여러 채널의 일정이 같은 시각에 실행되어도 이벤트 루프를 막지 않음
+        if self.con is None or not rows:
+            return
+        self.pending.append((sql, rows))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if (
+            self.writer is None
+            or self.writer.done()
+            or self.writer.get_loop() is not loop
+        ):
+            self.writer = loop.create_task(self.write_loop())
+
+    async def write_loop(self) -> None:
+        while self.pending:
+            try:
+                await asyncio.to_thread(self.flush)
+            except sqlite3.Error:
+                logger.exception("failed to write schedules")
+
+    def flush(self) -> None:
+        with self.lock:
+            operations = []
+            while self.pending:
+                operations.append(self.pending.popleft())
+            if not operations or self.con is None:
+                return
+            with self.con:
+                for sql, rows in operations:
+                    self.con.executemany(sql, rows)
+
+    def create_schedule(
+        self,
+        name: str,
+        description: str,
+        cron: str,
+        channel_id: Hashable = None,
+        now: float | None = None,
+    ) -> ScheduleEntry:
+        if (channel_id, name) in self.schedule:
+            raise ValueError(f"{name} already exists")
+        if len(self.channels.get(channel_id, ())) >= self.max_per_channel:
+            raise ValueError(
+                f"a channel can have at most {self.max_per_channel} schedules"
+            )
+        return self.set_schedule(name, description, cron, channel_id, now)
+
+    def read_schedule(self, name: str, channel_id: Hashable = None):
+        return self.get_entry(name, channel_id).to_dict()
+
+    def update_schedule(
+        self,
+        name: str,
+        description: str,
+        cron: str,
+        channel_id: Hashable = None,
+        now: float | None = None,
+    ) -> ScheduleEntry:
+        self.get_entry(name, channel_id)
+        return self.set_schedule(name, description, cron, channel_id, now)
+
+    def delete_schedule(self, name: str, channel_id: Hashable = None):
+        entry = self.get_entry(name, channel_id)
+        del self.schedule[(channel_id, name)]
+        entries = self.channels[channel_id]
+        del entries[name]
+        if not entries:
+            del self.channels[channel_id]
+        entry.version += 1
+        self.write(
+            "DELETE FROM schedules WHERE channel_id = ? AND name = ?",
+            [(channel_id, name)],
+        )
+
+    def list_schedule(self, channel_id: Hashable = None) -> dict[str, dict]:
+        return {
+            name: entry.to_dict()
+            for name, entry in self.channels.get(channel_id, {}).items()
+        }
+
+    def get_entry(self, name: str, channel_id: Hashable = None) -> ScheduleEntry:
+        entry = self.schedule.get((channel_id, name))
+        if entry is None:
+            raise KeyError(f"{name} is not found")
+        return entry
+
+    def set_schedule(
+        self,
+        name: str,
+        description: str,
+        cron: str,
+        channel_id: Hashable,
+        now: float | None,
+    ) -> ScheduleEntry:
+        expression = CronExpression.parse(cron)
+        now = time.time() if now is None else now
+        old_entry = self.schedule.get((channel_id, name))
+        entry = ScheduleEntry(
+            channel_id, name, description, expression, expression.next_time(now)
+        )
+        if old_entry is not None:
+            old_entry.version += 1
+        self.schedule[(channel_id, name)] = entry
+        self.channels.setdefault(channel_id, {})[name] = entry
+        self.push(entry)
+        self.save([entry])
+        return entry
+
+    def pop_due(self, now: float) -> list[tuple[ScheduleEntry, float]]:
+        # 시각이 지난 일정을 꺼내고 다음 실행 시각으로 다시 넣음
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            fire_time, _, version, entry = heapq.heappop(self.heap)
+            if version != entry.version:
+                continue
+            due.append((entry, fire_time))
+            # 여러 번 놓쳤더라도 한 번만 실행하고 현재 이후로 옮김
+            entry.next_time = entry.cron.next_time(max(now, fire_time))
+            self.push(entry)
+        self.save([entry for entry, _ in due])
+        return due
+
+    def get_delay(self, now: float) -> float:
+        while self.heap:
+            _, _, version, entry = self.heap[0]
+            if version == entry.version:
+                return min(max(self.heap[0][0] - now, 0.0), self.MAX_SLEEP)
+            heapq.heappop(self.heap)
+        return self.MAX_SLEEP
+
+    def start(self, dispatch: Dispatch | None = None) -> None:
+        if dispatch is not None:
+            self.dispatch = dispatch
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.wakeup = asyncio.Event()
+            self.task = loop.create_task(self.run_loop())
+
+    async def run_loop(self) -> None:
+        while True:
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(
+                    self.wakeup.wait(), timeout=self.get_delay(time.time())
+                )
+            except asyncio.TimeoutError:
+                pass
+            for entry, fire_time in self.pop_due(time.time()):
+                self.fire(entry, fire_time)
 
-    def create_schedule(self, name: str, description: str, cron: str):
-        self.schedule[name] = {"description": description, "cron": cron}
+    def fire(self, entry: ScheduleEntry, fire_time: float) -> None:
+        if self.dispatch is None:
+            logger.warning(f"no dispatcher for {entry}")
+            return
+        task = asyncio.get_running_loop().create_task(self.dispatch(entry, fire_time))
+        self.dispatching.add(task)
+        task.add_done_callback(self.dispatch_done)
 
-    def read_schedule(self, name: str):
-        return self.schedule[name]
+    def dispatch_done(self, task: asyncio.Task) -> None:
+        self.dispatching.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("failed to dispatch schedule", exc_info=task.exception())
 
-    def update_schedule(self, name: str, description: str, cron: str):
-        self.schedule[name] = {"description": description, "cron": cron}
+    async def close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.writer is not None and not self.writer.done():
+            self.writer.cancel()
+        self.writer = None
+        self.flush()
+        with self.lock:
+            if self.con is not None:
+                self.con.close()
+                self.con = None
 
-    def delete_schedule(self, name: str):
-        del self.schedule[name]
+    def __len__(self) -> int:
+        return len(self.schedule)
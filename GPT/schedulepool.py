@@ -0,0 +1,143 @@
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Hashable, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulePool:
+    # 일정 함수가 쓰는 채널별 SQLite 파일, 열어둔 연결 수는 max_open 으로 제한
+    def __init__(
+        self,
+        directory: str | None = "schedule",
+        max_open: int = 64,
+    ):
+        self.directory = directory  # None 이면 채널마다 메모리 DB 를 사용
+        self.max_open = max_open
+        self.connections: OrderedDict[Hashable, sqlite3.Connection] = OrderedDict()
+        self.locks: dict[Hashable, threading.Lock] = {}
+        self.busy: set[Hashable] = set()
+        self.lock = threading.Lock()
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get_path(self, channel_id: Hashable) -> str:
+        if self.directory is None:
+            return ":memory:"
+        return os.path.join(self.directory, f"{channel_id}.db")
+
+    def open(self, channel_id: Hashable) -> sqlite3.Connection:
+        # 모델이 보낸 쿼리가 바로 기록되도록 autocommit 으로 엶
+        con = sqlite3.connect(
+            self.get_path(channel_id),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        if self.directory is not None:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+        # 모델이 보낸 쿼리로 다른 채널의 파일을 붙이거나 새 파일을 만들지 못하게 함
+        con.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 0)
+        con.set_authorizer(self.authorize)
+        return con
+
+    @staticmethod
+    def authorize(
+        action: int,
+        arg1: str | None,
+        arg2: str | None,
+        db_name: str | None,
+        source: str | None,
+    ) -> int:
+        # VACUUM 과 VACUUM INTO 도 ATTACH 로 검사됨
+        if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH):
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+
+    def lock_channel(self, channel_id: Hashable) -> threading.Lock:
+        # 기다리는 동안 정리된 잠금을 잡았으면 새 잠금으로 다시 시도
+        while True:
+            with self.lock:
+                channel_lock = self.locks.setdefault(channel_id, threading.Lock())
+            channel_lock.acquire()
+            with self.lock:
+                if self.locks.get(channel_id) is channel_lock:
+                    self.busy.add(channel_id)
+                    return channel_lock
+            channel_lock.release()
+
+    def unlock_channel(self, channel_id: Hashable, channel_lock: threading.Lock):
+        with self.lock:
+            self.busy.discard(channel_id)
+        channel_lock.release()
+
+    @contextlib.contextmanager
+    def connection(self, channel_id: Hashable) -> Iterator[sqlite3.Connection]:
+        # 같은 채널의 쿼리는 순서대로 실행하고, 사용 중인 연결은 닫지 않음
+        if channel_id is None and self.directory is not None:
+            # 채널이 없는 GPT 끼리 같은 파일을 나눠 쓰지 않게 함
+            raise ValueError("channel_id is required for a file schedule pool")
+        channel_lock = self.lock_channel(channel_id)
+        try:
+            with self.lock:
+                con = self.connections.get(channel_id)
+                if con is None:
+                    con = self.open(channel_id)
+                    self.connections[channel_id] = con
+                self.connections.move_to_end(channel_id)
+                self.close_idle()
+            yield con
+        finally:
+            self.unlock_channel(channel_id, channel_lock)
+
+    def close_idle(self) -> None:
+        # 메모리 DB 는 닫으면 내용이 사라지므로 파일을 쓸 때만 정리
+        if self.directory is None:
+            return
+        over = len(self.connections) - self.max_open
+        for channel_id in list(self.connections):
+            if over <= 0:
+                break
+            if channel_id in self.busy:
+                continue
+            self.connections.pop(channel_id).close()
+            self.locks.pop(channel_id, None)
+            over -= 1
+
+    def memory_size(self, channel_id: Hashable) -> int:
+        if self.directory is not None or channel_id not in self.connections:
+            return 0
+        with self.connection(channel_id) as con:
+            page_count = con.execute("PRAGMA page_count").fetchone()[0]
+            page_size = con.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+    def release(self, channel_id: Hashable) -> None:
+        with self.lock:
+            con = self.connections.get(channel_id)
+            if con is None:
+                if channel_id not in self.busy:
+                    self.locks.pop(channel_id, None)
+                return
+        con.interrupt()
+        channel_lock = self.lock_channel(channel_id)
+        try:
+            with self.lock:
+                if self.connections.get(channel_id) is con:
+                    del self.connections[channel_id]
+                    con.close()
+                # 채널이 정리되면 잠금도 지워서 채널 수만큼 쌓이지 않게 함
+                del self.locks[channel_id]
+        finally:
+            self.unlock_channel(channel_id, channel_lock)
+
+    def close(self) -> None:
+        with self.lock:
+            for channel_id, con in self.connections.items():
+                con.interrupt()
+                con.close()
+            self.connections.clear()
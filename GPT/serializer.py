@@ -0,0 +1,13 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # orjson 이 없으면 표준 json 모듈을 사용
+    orjson = None
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
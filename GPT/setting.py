@@ -3,6 +3,11 @@ import json
 
 
 class Setting:
+    DROP: str = "drop"
+    SUMMARY: str = "summary"
+    # 병렬 호출(tools)을 지원하지 않는 이전 스냅샷
+    LEGACY_FUNCTION_SUFFIXES: tuple[str, ...] = ("-0301", "-0314", "-0613")
+
     def __init__(self, file_name: str = "setting.json"):
         self.file_name = file_name
         self.setting_type = {
@@ -12,6 +17,7 @@ class Setting:
             "temperature": float,
             "top_p": float,
             "keep_min": int,
+            "history_mode": str,
         }
         self.setting_value = {
             "model": "gpt-3.5-turbo-0613",
@@ -20,6 +26,7 @@ class Setting:
             "temperature": 1.0,
             "top_p": 1.0,
             "keep_min": 10,
+            "history_mode": self.DROP,
         }
         # self.load_from_json() # TODO database 화 하기
         self.sync_setting()
@@ -50,3 +57,7 @@ class Setting:
         self.temperature = self.setting_value["temperature"]
         self.top_p = self.setting_value["top_p"]
         self.keep_min = self.setting_value["keep_min"]
+        self.history_mode = self.setting_value["history_mode"]
+
+    def use_tools(self) -> bool:
+        return not self.model.endswith(self.LEGACY_FUNCTION_SUFFIXES)
@@ -0,0 +1,64 @@
+class SSEDecoder:
+    DONE: str = "[DONE]"
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.scan_from: int = 0
+        self.data_lines: list[str] = []
+        self.done: bool = False
+
+    def feed(self, chunk: bytes) -> list[str]:
+        if self.done:
+            return []
+        buffer = self.buffer
+        buffer += chunk
+        events: list[str] = []
+        start = 0
+        # 이전 청크에서 이미 확인한 부분은 다시 탐색하지 않음
+        end = buffer.find(b"\n", self.scan_from)
+        while end != -1:
+            self.process_line(buffer, start, end, events)
+            start = end + 1
+            if self.done:
+                break
+            end = buffer.find(b"\n", start)
+        del buffer[:start]
+        self.scan_from = len(buffer)
+        return events
+
+    def flush(self) -> list[str]:
+        events: list[str] = []
+        if not self.done:
+            if self.buffer:
+                self.process_line(self.buffer, 0, len(self.buffer), events)
+            self.dispatch(events)
+        self.buffer.clear()
+        self.scan_from = 0
+        return events
+
+    def process_line(
+        self, buffer: bytearray, start: int, end: int, events: list[str]
+    ) -> None:
+        if end > start and buffer[end - 1] == 0x0D:  # \r\n
+            end -= 1
+        if start == end:
+            self.dispatch(events)
+            return
+        if buffer[start] == 0x3A:  # ":" 로 시작하는 줄은 주석/keep-alive
+            return
+        if not buffer.startswith(b"data:", start, end):
+            return  # event, id, retry 필드는 사용하지 않음
+        value_start = start + 5
+        if value_start < end and buffer[value_start] == 0x20:
+            value_start += 1
+        self.data_lines.append(buffer[value_start:end].decode("utf-8"))
+
+    def dispatch(self, events: list[str]) -> None:
+        if not self.data_lines:
+            return
+        data = "\n".join(self.data_lines)
+        self.data_lines = []
+        if data == self.DONE:
+            self.done = True
+            return
+        events.append(data)
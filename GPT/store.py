@@ -0,0 +1,219 @@
+import asyncio
+import itertools
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from .message import (
+    BaseMessage,
+    SystemMessage,
+    UserMessage,
+    AssistanceMessage,
+    FunctionMessage,
+    ToolMessage,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationStore:
+    def append(self, channel_id: int, message: BaseMessage) -> None:
+        raise NotImplementedError
+
+    def clear(self, channel_id: int) -> None:
+        raise NotImplementedError
+
+    def load(self, channel_id: int, limit: int) -> tuple[list[BaseMessage], float]:
+        # (오래된 순서의 최근 메시지, 마지막 메시지 시각)
+        raise NotImplementedError
+
+    async def async_load(
+        self, channel_id: int, limit: int
+    ) -> tuple[list[BaseMessage], float]:
+        return self.load(channel_id, limit)
+
+    async def close(self) -> None:
+        pass
+
+    @staticmethod
+    def make_row(
+        message: BaseMessage,
+    ) -> tuple[str, str, str | None, str | None, str | None]:
+        # 병렬 호출은 function_call 칸에 목록으로 저장함
+        function_call = getattr(message, "tool_calls", None) or getattr(
+            message, "function_call", None
+        )
+        return (
+            message.role,
+            message.content,
+            getattr(message, "name", None),
+            json.dumps(function_call, ensure_ascii=False) if function_call else None,
+            getattr(message, "tool_call_id", None),
+        )
+
+    @staticmethod
+    def make_message(
+        role: str,
+        content: str,
+        name: str | None,
+        function_call: str | None,
+        tool_call_id: str | None = None,
+    ) -> BaseMessage:
+        if role == "user":
+            return UserMessage(content=content)
+        if role == "system":
+            return SystemMessage(content=content)
+        if role == "function":
+            return FunctionMessage(name=name, content=content)
+        if role == "tool":
+            return ToolMessage(name=name, content=content, tool_call_id=tool_call_id)
+        message = AssistanceMessage()
+        message.content = content
+        function_call = json.loads(function_call) if function_call else None
+        if isinstance(function_call, list):
+            message.tool_calls = function_call
+            message.finish_reason = AssistanceMessage.TOOL_CALLS
+        elif function_call:
+            message.function_call = function_call
+            message.finish_reason = AssistanceMessage.FUNCTION_CALL
+        else:
+            message.finish_reason = AssistanceMessage.STOP
+        return message
+
+
+class SQLiteStore(ConversationStore):
+    INSERT: str = (
+        "INSERT INTO messages"
+        " (channel_id, role, content, name, function_call, tool_call_id, created)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)"
+    )
+    DELETE: str = "DELETE FROM messages WHERE channel_id = ?"
+    # 채널의 최근 keep 개보다 오래된 메시지를 지움
+    PRUNE: str = (
+        "DELETE FROM messages WHERE channel_id = ? AND id <= ("
+        "SELECT id FROM messages WHERE channel_id = ?"
+        " ORDER BY id DESC LIMIT 1 OFFSET ?)"
+    )
+
+    def __init__(
+        self,
+        path: str = "history.db",
+        batch_size: int = 100,
+        flush_seconds: float = 1.0,
+        keep: int | None = 100,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        # 채널마다 남길 최근 메시지 수, 다시 불러오는 개수보다 적으면 안 됨
+        self.keep = keep  # None 이면 지우지 않음
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, channel_id INTEGER NOT NULL,"
+            " role TEXT NOT NULL, content TEXT NOT NULL, name TEXT,"
+            " function_call TEXT, created REAL NOT NULL, tool_call_id TEXT)"
+        )
+        columns = [row[1] for row in self.con.execute("PRAGMA table_info(messages)")]
+        if "tool_call_id" not in columns:
+            # 병렬 호출 지원 전에 만든 DB
+            self.con.execute("ALTER TABLE messages ADD COLUMN tool_call_id TEXT")
+        self.con.execute(
+            "CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel_id, id)"
+        )
+        self.con.commit()
+        # 쓰기 작업은 순서대로 쌓아두고 한 번에 기록함, deque 는 스레드 간에 안전함
+        self.pending: deque[tuple[str, tuple]] = deque()
+        self.lock = threading.Lock()
+        self.wakeup: asyncio.Event | None = None
+        self.task: asyncio.Task | None = None
+
+    def append(self, channel_id: int, message: BaseMessage) -> None:
+        row = (channel_id, *self.make_row(message), time.time())
+        self.pending.append((self.INSERT, row))
+        self.schedule()
+
+    def clear(self, channel_id: int) -> None:
+        self.pending.append((self.DELETE, (channel_id,)))
+        self.schedule()
+
+    def schedule(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.wakeup = asyncio.Event()
+            self.task = loop.create_task(self.write_loop())
+        if len(self.pending) >= self.batch_size:
+            self.wakeup.set()
+
+    async def write_loop(self) -> None:
+        while self.pending:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except sqlite3.Error:
+                logger.exception("failed to write conversation history")
+
+    def flush(self) -> None:
+        with self.lock:
+            operations = []
+            while self.pending:
+                operations.append(self.pending.popleft())
+            if not operations:
+                return
+            with self.con:
+                # 같은 쿼리가 이어지면 executemany 로 묶음
+                for sql, group in itertools.groupby(
+                    operations, key=lambda operation: operation[0]
+                ):
+                    self.con.executemany(sql, [params for _, params in group])
+                if self.keep is not None:
+                    channels = {
+                        params[0] for sql, params in operations if sql == self.INSERT
+                    }
+                    self.con.executemany(
+                        self.PRUNE,
+                        [
+                            (channel_id, channel_id, self.keep)
+                            for channel_id in channels
+                        ],
+                    )
+
+    def load(self, channel_id: int, limit: int) -> tuple[list[BaseMessage], float]:
+        self.flush()
+        with self.lock:
+            rows = self.con.execute(
+                "SELECT role, content, name, function_call, tool_call_id, created"
+                " FROM messages"
+                " WHERE channel_id = ? ORDER BY id DESC LIMIT ?",
+                (channel_id, limit),
+            ).fetchall()
+        if not rows:
+            return [], 0.0
+        messages = [self.make_message(*row[:5]) for row in reversed(rows)]
+        return messages, rows[0][5]
+
+    async def async_load(
+        self, channel_id: int, limit: int
+    ) -> tuple[list[BaseMessage], float]:
+        # flush 와 SELECT 가 이벤트 루프를 막지 않도록 스레드에서 실행
+        return await asyncio.to_thread(self.load, channel_id, limit)
+
+    async def close(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+        self.task = None
+        self.flush()
+        self.con.close()
+        logger.info("conversation store closed")
@@ -1,35 +1,202 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
 import tiktoken
 
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    def __init__(self, max_size: int = 8192):
+        self.max_size = max_size
+        self.cache: OrderedDict[tuple[str, bytes], int] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def __repr__(self) -> str:
+        return f"<TokenCache {self.stats()}>"
+
+    @staticmethod
+    def make_key(encoding_name: str, value: str) -> tuple[str, bytes]:
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        return (encoding_name, digest)
+
+    def get(self, key: tuple[str, bytes]) -> int | None:
+        with self.lock:
+            num_tokens = self.cache.get(key)
+            if num_tokens is None:
+                self.misses += 1
+                return None
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return num_tokens
+
+    def put(self, key: tuple[str, bytes], num_tokens: int) -> None:
+        with self.lock:
+            self.cache[key] = num_tokens
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int | float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
 
 class Tokener:
-    encoding: tiktoken.Encoding
+    DEFAULT_MODEL: str = "gpt-3.5-turbo-0613"
+    DEFAULT_ENCODING: str = "cl100k_base"
+    encodings: dict[str, tiktoken.Encoding] = {}
+    lock = threading.Lock()
+    cache = TokenCache()
+    BATCH_THRESHOLD: int = 8192  # 이 글자 수를 넘으면 이벤트 루프 밖에서 토큰화
+    BATCH_THREADS: int = 4
+    executor = ThreadPoolExecutor(
+        max_workers=BATCH_THREADS, thread_name_prefix="tokener"
+    )
 
     @classmethod
-    def num_tokens_from_messages(
-        self, messages: list, model: str = "gpt-3.5-turbo-0613"
-    ) -> int:
+    def set_cache_dir(self, cache_dir: str) -> None:
+        # tiktoken은 TIKTOKEN_CACHE_DIR 에 BPE 파일이 있으면 다운로드하지 않음
+        os.makedirs(cache_dir, exist_ok=True)
+        os.environ["TIKTOKEN_CACHE_DIR"] = os.path.abspath(cache_dir)
+
+    @classmethod
+    def preload(self, models: Iterable[str] = (DEFAULT_MODEL,)) -> None:
+        for model in models:
+            encoding = self.get_encoding(model)
+            logger.info(f"encoding loaded: {model} - {encoding.name}")
+
+    @classmethod
+    def get_encoding(self, model: str = DEFAULT_MODEL) -> tiktoken.Encoding:
+        encoding = self.encodings.get(model)
+        if encoding is None:
+            with self.lock:
+                encoding = self.encodings.get(model)
+                if encoding is None:
+                    encoding = self.load_encoding(model)
+                    self.encodings[model] = encoding
+        return encoding
+
+    @classmethod
+    def load_encoding(self, model: str) -> tiktoken.Encoding:
         try:
-            self.encoding = tiktoken.encoding_for_model(model)
+            return tiktoken.encoding_for_model(model)
         except KeyError:
-            self.encoding = tiktoken.get_encoding("cl100k_base")
+            return tiktoken.get_encoding(self.DEFAULT_ENCODING)
+
+    @classmethod
+    def num_tokens_from_messages(
+        self, messages: list, model: str = DEFAULT_MODEL
+    ) -> int:
         # 이전 메시지 리스트에서 사용된 토큰 수를 계산합니다.
         num_tokens = 0
         for message in messages:
-            num_tokens += self.num_tokens_of_message(message)
+            num_tokens += self.num_tokens_of_message(message, model=model)
         num_tokens += 2  # 답변은 <im_start>assistant로 시작함
         return num_tokens
 
     @classmethod
-    def num_tokens_of_message(self, message: dict) -> int:
+    def num_tokens_of_message(self, message: dict, model: str = DEFAULT_MODEL) -> int:
+        encoding = self.get_encoding(model)
         num_tokens = 4  # <im_start>, role/name, \n, content, <im_end>, \n
         for key, value in message.items():
             value = str(value)
-            num_tokens += self.num_tokens_of_key_and_value(key, value)
+            num_tokens += self.num_tokens_of_key_and_value(key, value, encoding)
         return num_tokens
 
     @classmethod
-    def num_tokens_of_key_and_value(self, key: str, value: str) -> int:
-        num_tokens = len(self.encoding.encode(value))
+    def num_tokens_of_key_and_value(
+        self, key: str, value: str, encoding: tiktoken.Encoding
+    ) -> int:
+        num_tokens = self.num_tokens_of_text(value, encoding)
         if key == "name":  # 이름이 있는 경우, 역할은 필요하지 않음
             num_tokens += -1  # 역할은 항상 필요하며, 1개의 토큰을 차지함
         return num_tokens
+
+    @classmethod
+    def num_tokens_of_text(self, value: str, encoding: tiktoken.Encoding) -> int:
+        # 같은 문자열은 채널이 달라도 같은 토큰 수를 가지므로 프로세스 전체에서 공유
+        key = self.cache.make_key(encoding.name, value)
+        num_tokens = self.cache.get(key)
+        if num_tokens is None:
+            num_tokens = len(encoding.encode_ordinary(value))
+            self.cache.put(key, num_tokens)
+        return num_tokens
+
+    @classmethod
+    def num_tokens_of_texts(
+        self, values: list[str], encoding: tiktoken.Encoding
+    ) -> list[int]:
+        keys = [self.cache.make_key(encoding.name, value) for value in values]
+        counts = [self.cache.get(key) for key in keys]
+        missing = [i for i, num_tokens in enumerate(counts) if num_tokens is None]
+        if missing:
+            # tiktoken 은 인코딩 중 GIL 을 풀기 때문에 여러 스레드로 나눠서 처리
+            encoded = encoding.encode_ordinary_batch(
+                [values[i] for i in missing], num_threads=self.BATCH_THREADS
+            )
+            for i, tokens in zip(missing, encoded):
+                counts[i] = len(tokens)
+                self.cache.put(keys[i], counts[i])
+        return counts
+
+    @classmethod
+    def num_tokens_of_messages(
+        self, messages: list[dict], model: str = DEFAULT_MODEL
+    ) -> list[int]:
+        encoding = self.get_encoding(model)
+        values = []
+        for message in messages:
+            values.extend(str(value) for value in message.values())
+        counts = iter(self.num_tokens_of_texts(values, encoding))
+        result = []
+        for message in messages:
+            num_tokens = 4  # <im_start>, role/name, \n, content, <im_end>, \n
+            for key in message:
+                num_tokens += next(counts)
+                if key == "name":
+                    num_tokens += -1
+            result.append(num_tokens)
+        return result
+
+    @classmethod
+    async def async_num_tokens_of_messages(
+        self, messages: list[dict], model: str = DEFAULT_MODEL
+    ) -> list[int]:
+        size = sum(
+            len(str(value)) for message in messages for value in message.values()
+        )
+        if size < self.BATCH_THRESHOLD:
+            return [self.num_tokens_of_message(message, model) for message in messages]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.num_tokens_of_messages, messages, model
+        )
+
+    @classmethod
+    async def async_num_tokens_from_messages(
+        self, messages: list[dict], model: str = DEFAULT_MODEL
+    ) -> int:
+        counts = await self.async_num_tokens_of_messages(messages, model)
+        return sum(counts) + 2  # 답변은 <im_start>assistant로 시작함
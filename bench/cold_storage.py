@@ -0,0 +1,51 @@
+import gc
+import random
+import tracemalloc
+from GPT.message import AssistanceMessage, MessageBox, UserMessage
+
+CHANNELS = 1000
+MESSAGES = 50
+
+WORDS = "안녕하세요 오늘 날씨가 좋네요 일정 회의 점심 내일 확인 부탁 the meeting at 3pm".split()
+
+
+def make_boxes(seed: int = 0) -> list[MessageBox]:
+    rand = random.Random(seed)
+    boxes = []
+    for _ in range(CHANNELS):
+        box = MessageBox()
+        for index in range(MESSAGES):
+            content = " ".join(rand.choice(WORDS) for _ in range(rand.randint(5, 80)))
+            if index % 2:
+                box.add_message(AssistanceMessage({"delta": {"content": content}}))
+            else:
+                box.add_message(UserMessage(content=content))
+        boxes.append(box)
+    return boxes
+
+
+def main():
+    gc.collect()
+    tracemalloc.start()
+    boxes = make_boxes()
+    hot = tracemalloc.get_traced_memory()[0]
+    for box in boxes:
+        box.compact()
+    gc.collect()
+    cold = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    for box in boxes:
+        box.inflate()
+    stats = MessageBox.cold_stats.stats()
+    print(f"{CHANNELS} channels x {MESSAGES} messages")
+    print(
+        f"hot {hot / 2**20:7.2f} MiB  cold {cold / 2**20:7.2f} MiB  x{hot / cold:.1f}"
+    )
+    print(
+        f"blob ratio x{stats['ratio']:.1f}  inflate avg {stats['avg_inflate_ms']:.3f} ms"
+        f"  max {stats['max_inflate_ms']:.3f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import random
+import tempfile
+import time
+from GPT.memory import RetrievalMemory
+from GPT.message import UserMessage
+
+SNIPPETS = 100_000
+WORDS = "안녕하세요 오늘 내일 회의 점심 일정 고양이 치과 예약 여행 숙소 비행기 meeting report".split()
+
+
+def main():
+    rand = random.Random(0)
+    messages = [
+        UserMessage(content=" ".join(rand.choice(WORDS) for _ in range(12)))
+        for _ in range(SNIPPETS)
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        memory = RetrievalMemory(directory=directory)
+        start = time.perf_counter()
+        for offset in range(0, SNIPPETS, 1000):
+            memory.remember(1, messages[offset : offset + 1000])
+        remember = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(100):
+            memory.recall(1, "내일 치과 예약")
+        recall = (time.perf_counter() - start) / 100
+        memory.close()
+    print(
+        f"{SNIPPETS} snippets  remember {remember:.2f} s  "
+        f"recall {recall * 1000:.2f} ms per query"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import gc
+import sys
+import time
+import tracemalloc
+from GPT.message import (
+    AssistanceMessage,
+    FunctionMessage,
+    MessageBox,
+    UserMessage,
+)
+
+MESSAGES = 100_000
+
+
+class LegacyMessage:
+    # dict 기반이던 이전 메시지 구조
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self.content = content
+        self.token = 0
+        self.token_model = ""
+        self.function_call = {}
+        self.finish_reason = "null"
+
+    def make_message(self) -> dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+
+def make_legacy(index: int) -> LegacyMessage:
+    role = ("user", "assistant", "function")[index % 3]
+    # 스트림에서 조립되거나 DB 에서 읽은 role 은 매번 새 문자열이었음
+    return LegacyMessage("".join(role), f"메시지 {index}")
+
+
+def make_message(index: int):
+    if index % 3 == 0:
+        return UserMessage(content=f"메시지 {index}")
+    if index % 3 == 1:
+        return AssistanceMessage({"delta": {"content": f"메시지 {index}"}})
+    return FunctionMessage(name="schedule_management", content=f"메시지 {index}")
+
+
+def fill(make, call_make_message: bool) -> MessageBox:
+    box = MessageBox()
+    for index in range(MESSAGES):
+        box.add_message(make(index), save=False)
+    if call_make_message:
+        for _ in range(3):
+            box.make_messages()
+    return box
+
+
+def measure(make, call_make_message: bool) -> tuple[int, float]:
+    gc.collect()
+    start = time.perf_counter()
+    fill(make, call_make_message)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    box = fill(make, call_make_message)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del box
+    return size, elapsed
+
+
+def main():
+    print(f"python {sys.version.split()[0]}  {MESSAGES} messages")
+    for call_make_message in (False, True):
+        old_size, old_time = measure(make_legacy, call_make_message)
+        new_size, new_time = measure(make_message, call_make_message)
+        label = "make_message x3" if call_make_message else "stored only"
+        print(
+            f"{label:16} legacy {old_size / 2**20:7.2f} MiB {old_time * 1000:7.1f} ms"
+            f"  slots {new_size / 2**20:7.2f} MiB {new_time * 1000:7.1f} ms"
+        )
+        # make_messages 를 거친 뒤에도 이전 구조보다 작아야 함
+        assert new_size < old_size, f"{label}: {new_size} >= {old_size}"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import json
+import random
+import time
+from GPT.chat import ChatStream
+from GPT.message import AssistanceMessage, MessageBox, UserMessage
+from GPT.serializer import orjson
+from GPT.setting import Setting
+
+MESSAGES = 200
+ROUNDS = 200
+
+WORDS = "안녕하세요 오늘 날씨가 좋네요 일정 회의 점심 내일 확인 부탁 the meeting at 3pm".split()
+
+
+def make_box(seed: int = 0) -> MessageBox:
+    rand = random.Random(seed)
+    box = MessageBox()
+    for index in range(MESSAGES):
+        content = " ".join(rand.choice(WORDS) for _ in range(rand.randint(5, 80)))
+        if index % 2:
+            box.add_message(AssistanceMessage({"delta": {"content": content}}))
+        else:
+            box.add_message(UserMessage(content=content))
+    return box
+
+
+def measure(encode) -> float:
+    box = make_box()
+    setting = Setting()
+    setting.system_text = "당신은 일정 관리를 도와주는 비서입니다."
+    chat_api = ChatStream(api_key="bench")
+    start = time.perf_counter()
+    for index in range(ROUNDS):
+        # 매 요청마다 질문과 답변이 하나씩 늘어남
+        box.add_message(UserMessage(content=f"{index}번째 질문"))
+        box.add_message(AssistanceMessage({"delta": {"content": f"{index}번째 답변"}}))
+        chat_api.data = chat_api.make_data(box, setting)
+        encode(chat_api)
+    return time.perf_counter() - start
+
+
+def encode_dict(chat_api: ChatStream) -> bytes:
+    # httpx 의 json= 와 같은 방식
+    return json.dumps(chat_api.data).encode("utf-8")
+
+
+def encode_fragments(chat_api: ChatStream) -> bytes:
+    return chat_api.make_body()
+
+
+def main():
+    print(f"{MESSAGES}+ messages x {ROUNDS} requests  orjson: {orjson is not None}")
+    dict_time = measure(encode_dict)
+    fragment_time = measure(encode_fragments)
+    print(
+        f"json dict {dict_time / ROUNDS * 1000:7.3f} ms/request"
+        f"  fragments {fragment_time / ROUNDS * 1000:7.3f} ms/request"
+        f"  x{dict_time / fragment_time:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
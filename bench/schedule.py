@@ -0,0 +1,50 @@
+import random
+import time
+import tracemalloc
+from GPT.schedule import CronExpression, Schedule
+
+SCHEDULES = 100_000
+CRONS = ["9 * * *", "*/2 * * *", "18 * * mon-fri", "12 1 * *", "* * * *"]
+
+
+def build(now: float) -> Schedule:
+    rand = random.Random(0)
+    schedule = Schedule()
+    for index in range(SCHEDULES):
+        cron = f"{rand.randrange(60)} {rand.choice(CRONS)}"
+        schedule.create_schedule(
+            f"알림 {index}", "내용", cron, channel_id=index % 1000, now=now
+        )
+    return schedule
+
+
+def main():
+    now = time.time()
+    start = time.perf_counter()
+    schedule = build(now)
+    create_time = time.perf_counter() - start
+    tracemalloc.start()
+    other = build(now)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del other
+
+    # 하루 동안 1분 간격으로 깨어난다고 가정
+    fired = 0
+    start = time.perf_counter()
+    for minute in range(1, 24 * 60 + 1):
+        fired += len(schedule.pop_due(now + minute * 60))
+    fire_time = time.perf_counter() - start
+    print(f"{SCHEDULES} schedules, {len(CronExpression.cache)} cron objects")
+    print(
+        f"create {create_time * 1000:7.1f} ms  memory {size / 2**20:6.1f} MiB"
+        f"  heap {len(schedule.heap)}"
+    )
+    print(
+        f"1 day {fired} fires  {fire_time * 1000:7.1f} ms"
+        f"  {fire_time / max(fired, 1) * 1e6:.1f} us/fire"
+    )
+
+
+if __name__ == "__main__":
+    main()
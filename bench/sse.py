@@ -0,0 +1,96 @@
+import json
+import random
+import time
+from GPT.sse import SSEDecoder
+
+REPLY = (
+    "안녕하세요! 오늘은 스트리밍 응답을 파싱하는 벤치마크입니다. Hello, world! 😀 " * 40
+)
+
+
+def record_stream(text: str, size: int = 3) -> bytes:
+    events = []
+    for i in range(0, len(text), size):
+        data = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "choices": [{"index": 0, "delta": {"content": text[i : i + size]}}],
+        }
+        events.append(f"data: {json.dumps(data, ensure_ascii=False)}\n\n")
+        if i % 300 == 0:
+            events.append(": keep-alive\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode("utf-8")
+
+
+def split_randomly(data: bytes, rand: random.Random, max_size: int) -> list[bytes]:
+    chunks = []
+    position = 0
+    while position < len(data):
+        size = rand.randint(1, max_size)
+        chunks.append(data[position : position + size])
+        position += size
+    return chunks
+
+
+def legacy_parse(chunks: list[bytes]) -> int:
+    count = 0
+    for chunk in chunks:
+        for data in chunk.decode("utf-8").split("\n\n"):
+            if data.startswith("data: "):
+                data = data[6:]
+                if data == "[DONE]":
+                    break
+                json.loads(data)
+                count += 1
+    return count
+
+
+def decoder_parse(chunks: list[bytes]) -> int:
+    count = 0
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        for data in decoder.feed(chunk):
+            json.loads(data)
+            count += 1
+    for data in decoder.flush():
+        json.loads(data)
+        count += 1
+    return count
+
+
+def run(parser, streams: list[list[bytes]]) -> tuple[float, int]:
+    failed = 0
+    start = time.perf_counter()
+    for chunks in streams:
+        try:
+            parser(chunks)
+        except ValueError:  # UnicodeDecodeError, JSONDecodeError
+            failed += 1
+    return time.perf_counter() - start, failed
+
+
+def report(name: str, parser, streams: list[list[bytes]], stream_size: int):
+    elapsed, failed = run(parser, streams)
+    if failed:
+        speed = "     n/a"
+    else:
+        speed = f"{stream_size * len(streams) / elapsed / 1e6:8.2f}"
+    print(f"{name:24} {speed} MB/s  failed {failed}/{len(streams)} streams")
+
+
+def main():
+    rand = random.Random(0)
+    stream = record_stream(REPLY)
+    # 이벤트 경계로만 나뉜 스트림은 기존 방식이 처리할 수 있는 최선의 경우
+    aligned = [[event + b"\n\n" for event in stream.split(b"\n\n") if event]] * 50
+    report("legacy (aligned)", legacy_parse, aligned, len(stream))
+    report("decoder (aligned)", decoder_parse, aligned, len(stream))
+    for max_size in (64, 512, 4096):
+        streams = [split_randomly(stream, rand, max_size) for _ in range(50)]
+        report(f"legacy (chunk<={max_size})", legacy_parse, streams, len(stream))
+        report(f"decoder (chunk<={max_size})", decoder_parse, streams, len(stream))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import time
+from GPT.message import AssistanceMessage, AssistanceStream
+
+TOKENS = 4096
+
+
+def make_deltas(count: int) -> list[dict]:
+    deltas = [{"delta": {"role": "assistant", "content": ""}, "finish_reason": None}]
+    for i in range(count):
+        deltas.append({"delta": {"content": f"토큰{i % 10} "}, "finish_reason": None})
+    deltas.append({"delta": {}, "finish_reason": "stop"})
+    return deltas
+
+
+def make_function_deltas(count: int) -> list[dict]:
+    deltas = [
+        {
+            "delta": {
+                "function_call": {"name": "schedule_management", "arguments": ""}
+            },
+            "finish_reason": None,
+        }
+    ]
+    for i in range(count):
+        deltas.append(
+            {"delta": {"function_call": {"arguments": "ab"}}, "finish_reason": None}
+        )
+    deltas.append({"delta": {}, "finish_reason": "function_call"})
+    return deltas
+
+
+def legacy(deltas: list[dict]) -> AssistanceMessage:
+    collected_messages = AssistanceMessage()
+    for data in deltas:
+        collected_messages += AssistanceMessage(data=data)
+    return collected_messages
+
+
+def accumulator(deltas: list[dict]) -> AssistanceMessage:
+    stream = AssistanceStream()
+    for data in deltas:
+        stream.add(data)
+    return stream.to_message()
+
+
+def measure(func, deltas: list[dict], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(deltas)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    for name, make in (
+        ("content", make_deltas),
+        ("function_call", make_function_deltas),
+    ):
+        for count in (512, 1024, TOKENS):
+            deltas = make(count)
+            assert str(legacy(deltas)) == str(accumulator(deltas))
+            old = measure(legacy, deltas)
+            new = measure(accumulator, deltas)
+            print(
+                f"{name:14} {count:5} deltas  legacy {old * 1000:9.2f} ms  "
+                f"accumulator {new * 1000:7.2f} ms  x{old / new:.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
 import discord
 from discord.ext import commands
 from discord_setting import bot, gpt_container, bot_prefix
+import datetime
 import logging
+import time
 import discord
 import discord.errors
+from GPT.schedule import ScheduleEntry
 from . import gpt_control
+from .edit import EditScheduler
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +20,30 @@ async def on_ready():
     logger.info("GPT bot start")
 
 
+async def post_reminder(entry: ScheduleEntry, fire_time: float):
+    text = f"⏰ {entry.name}\n{entry.description}"
+    if time.time() - fire_time > 60:
+        planned = datetime.datetime.fromtimestamp(fire_time).strftime("%m-%d %H:%M")
+        text += f"\n({planned} 에 보내지 못한 알림이에요)"
+    try:
+        channel = bot.get_channel(entry.channel_id) or await bot.fetch_channel(
+            entry.channel_id
+        )
+        await channel.send(text)
+    except (discord.NotFound, discord.Forbidden):
+        # 채널이 지워졌거나 권한이 없으면 다음에도 실패하므로 일정을 지움
+        logger.warning(f"delete unreachable {entry}")
+        try:
+            gpt_container.schedule.delete_schedule(entry.name, entry.channel_id)
+        except KeyError:
+            pass
+
+
+bot.reminder_dispatch = post_reminder
+# 로그인 전에 설정해야 discord.py 의 세션에 적용됨
+bot.http.http_trace = EditScheduler.default().make_trace_config()
+
+
 @bot.event
 async def on_message(message: discord.Message):
     if message.author.bot:
@@ -0,0 +1,256 @@
+from __future__ import annotations
+import asyncio
+import logging
+import re
+import time
+from typing import Mapping
+import aiohttp
+import discord
+
+logger = logging.getLogger(__name__)
+
+# PATCH /api/v10/channels/{channel_id}/messages/{message_id}
+EDIT_PATH = re.compile(r"/channels/(\d+)/messages/\d+$")
+
+
+class EditBucket:
+    # 디스코드의 채널별 메시지 수정 제한, 헤더를 받기 전에는 5초에 5번으로 가정
+    def __init__(self, limit: int = 5, window: float = 5.0):
+        self.limit = limit
+        self.remaining = limit
+        self.window = window
+        self.reset_at: float = 0.0
+
+    def __repr__(self) -> str:
+        return f"<EditBucket limit={self.limit} remaining={self.remaining} window={self.window}>"
+
+    def refill(self, now: float) -> None:
+        if now >= self.reset_at:
+            self.remaining = self.limit
+
+    def wait_time(self, now: float) -> float:
+        self.refill(now)
+        if self.remaining > 0:
+            return 0.0
+        return self.reset_at - now
+
+    def consume(self, now: float) -> None:
+        self.refill(now)
+        if now >= self.reset_at:
+            self.reset_at = now + self.window
+        self.remaining -= 1
+
+    def update(
+        self, limit: int, remaining: int, reset_after: float, now: float
+    ) -> None:
+        self.limit = max(limit, 1)
+        self.remaining = remaining
+        self.reset_at = now + reset_after
+        if remaining == self.limit - 1:
+            # 구간의 첫 요청이 받은 reset_after 가 구간의 길이
+            self.window = reset_after
+
+    def block(self, retry_after: float, now: float) -> None:
+        self.remaining = 0
+        self.reset_at = max(self.reset_at, now + retry_after)
+
+    def interval(self) -> float:
+        # 제한에 걸리지 않고 계속 보낼 수 있는 평균 간격
+        return self.window / self.limit
+
+
+class EditStream:
+    # 메시지 하나의 스트리밍 수정, 보내기 전에 들어온 내용은 마지막 것만 남김
+    def __init__(self, scheduler: EditScheduler, message: discord.Message):
+        self.scheduler = scheduler
+        self.message = message
+        self.channel_id: int = message.channel.id
+        self.content: str | None = None
+        self.sent: str | None = None
+        self.last_edit: float = 0.0
+        self.changed = asyncio.Event()
+        self.closing = asyncio.Event()
+        self.closed: bool = False
+        self.task: asyncio.Task | None = None
+
+    def update(self, content: str) -> None:
+        if self.closed:
+            return
+        if self.changed.is_set():
+            self.scheduler.coalesced += 1
+        self.content = content
+        self.changed.set()
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self) -> None:
+        while not self.closed:
+            await self.changed.wait()
+            delay = self.scheduler.get_delay(self)
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.closing.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+            if self.closed:
+                break
+            self.changed.clear()
+            try:
+                await self.send(self.content)
+            except discord.HTTPException:
+                # 중간 내용은 다음 수정이나 마지막 수정으로 다시 보내짐
+                logger.warning("failed to edit streaming message", exc_info=True)
+
+    async def send(self, content: str | None) -> None:
+        if content is None or content == self.sent:
+            return
+        self.last_edit = time.monotonic()
+        self.scheduler.consume(self.channel_id, self.last_edit)
+        self.sent = content
+        try:
+            await self.message.edit(content=content)
+        except discord.HTTPException:
+            self.sent = None
+            raise
+
+    async def finish(self, content: str | None = None, flush: bool = True) -> None:
+        # 마지막 내용은 간격을 기다리지 않고 바로 보냄
+        if content is not None:
+            self.content = content
+        elif not flush:
+            self.content = None
+        self.closed = True
+        self.closing.set()
+        self.changed.set()
+        if self.task is not None:
+            await self.task
+        try:
+            await self.send(self.content)
+        finally:
+            # 마지막 수정이 버킷을 다시 만들지 않도록 보낸 뒤에 정리
+            self.scheduler.remove(self)
+
+
+class EditScheduler:
+    _default: EditScheduler | None = None
+
+    def __init__(
+        self,
+        min_interval: float = 0.5,
+        max_interval: float = 10.0,
+        global_per_second: float = 25.0,
+        limit: int = 5,
+        window: float = 5.0,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # 봇 전체 제한(초당 50번)의 절반 정도만 스트리밍 수정에 사용
+        self.global_per_second = global_per_second
+        self.limit = limit
+        self.window = window
+        self.buckets: dict[int, EditBucket] = {}
+        self.streams: dict[int, set[EditStream]] = {}
+        self.edits: int = 0
+        self.coalesced: int = 0
+        self.rate_limited: int = 0
+
+    def __repr__(self) -> str:
+        return f"<EditScheduler {self.stats()}>"
+
+    @classmethod
+    def default(cls) -> EditScheduler:
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def open(self, message: discord.Message) -> EditStream:
+        stream = EditStream(self, message)
+        self.streams.setdefault(stream.channel_id, set()).add(stream)
+        return stream
+
+    def remove(self, stream: EditStream) -> None:
+        streams = self.streams.get(stream.channel_id)
+        if streams is None:
+            return
+        streams.discard(stream)
+        if not streams:
+            # 채널에 남은 스트림이 없으면 제한 상태도 더 필요 없음
+            del self.streams[stream.channel_id]
+            self.buckets.pop(stream.channel_id, None)
+
+    def get_bucket(self, channel_id: int) -> EditBucket:
+        if channel_id not in self.buckets:
+            self.buckets[channel_id] = EditBucket(self.limit, self.window)
+        return self.buckets[channel_id]
+
+    def active_streams(self) -> int:
+        return sum(len(streams) for streams in self.streams.values())
+
+    def get_interval(self, channel_id: int) -> float:
+        # 같은 채널의 스트림은 채널 제한을, 모든 스트림은 전체 제한을 나눠 씀
+        channel_streams = max(len(self.streams.get(channel_id, ())), 1)
+        interval = max(
+            self.min_interval,
+            self.get_bucket(channel_id).interval() * channel_streams,
+            self.active_streams() / self.global_per_second,
+        )
+        return min(interval, self.max_interval)
+
+    def get_delay(self, stream: EditStream, now: float | None = None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(
+            stream.last_edit + self.get_interval(stream.channel_id) - now,
+            self.get_bucket(stream.channel_id).wait_time(now),
+        )
+
+    def consume(self, channel_id: int, now: float) -> None:
+        self.edits += 1
+        self.get_bucket(channel_id).consume(now)
+
+    def block(self, channel_id: int, retry_after: float) -> None:
+        self.rate_limited += 1
+        self.get_bucket(channel_id).block(retry_after, time.monotonic())
+
+    def update_from_headers(
+        self, channel_id: int, status: int, headers: Mapping[str, str]
+    ) -> None:
+        if channel_id not in self.streams and channel_id not in self.buckets:
+            return
+        try:
+            if status == 429:
+                retry_after = float(headers.get("Retry-After", self.window))
+                self.block(channel_id, retry_after)
+                return
+            limit = headers.get("X-RateLimit-Limit")
+            remaining = headers.get("X-RateLimit-Remaining")
+            reset_after = headers.get("X-RateLimit-Reset-After")
+            if limit is None or remaining is None or reset_after is None:
+                return
+            self.get_bucket(channel_id).update(
+                int(limit), int(remaining), float(reset_after), time.monotonic()
+            )
+        except ValueError:
+            logger.warning(f"invalid discord rate limit header: {dict(headers)}")
+
+    def make_trace_config(self) -> aiohttp.TraceConfig:
+        # discord.py 가 보내는 메시지 수정 응답의 제한 헤더를 받아서 간격을 맞춤
+        async def on_request_end(session, context, params) -> None:
+            if params.method != "PATCH":
+                return
+            match = EDIT_PATH.search(params.url.path)
+            if match:
+                self.update_from_headers(
+                    int(match.group(1)), params.response.status, params.response.headers
+                )
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "streams": self.active_streams(),
+            "edits": self.edits,
+            "coalesced": self.coalesced,
+            "rate_limited": self.rate_limited,
+        }
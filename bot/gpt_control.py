@@ -1,9 +1,9 @@
 import logging
-import time
 import discord
 import os
 import json
 from GPT.message import AssistanceMessage
+from .edit import EditScheduler, EditStream
 from .utils import HandleErrors, data_to_json, UnValidCommandError, GPTHandler
 
 logger = logging.getLogger(__name__)
@@ -14,8 +14,8 @@ class ChatHandler(GPTHandler):
     def __init__(self, discord_message: discord.Message):
         super().__init__(discord_message)
         self.text: str = ""
-        self.now: int = 0
         self.msg: discord.Message
+        self.stream: EditStream
 
     @HandleErrors("GPT가 혀를 깨물었어요!")
     async def run(self):
@@ -23,10 +23,17 @@ class ChatHandler(GPTHandler):
         logger.info(
             f"name: {self.discord_message.author.nick} - request: {self.discord_message.content}"
         )
-        await self.get_from_gpt_and_send_by_word()
+        self.stream = EditScheduler.default().open(self.msg)
+        try:
+            await self.get_from_gpt_and_send_by_word()
+        finally:
+            # 마지막 내용은 기다리지 않고 바로 수정함
+            if 1 < len(self.text) < MAX_TEXT_LENGTH:
+                await self.stream.finish(self.text)
+            else:
+                # 긴 답변은 파일로 보내므로 남은 중간 내용은 버림
+                await self.stream.finish(flush=False)
 
-        if 1 < len(self.text) < MAX_TEXT_LENGTH:
-            await self.msg.edit(content=self.text)
         if MAX_TEXT_LENGTH <= len(self.text):
             await self.send_to_file()
             await self.msg.edit(content="")
@@ -36,18 +43,14 @@ class ChatHandler(GPTHandler):
             self.discord_message.content
         ):
             self.text += message
-            await self.send_after_timer()
-
-    async def send_after_timer(self):
-        if time.time() - self.now > 1:
-            await self.send_by_word()
+            self.send_by_word()
 
-    async def send_by_word(self):
-        self.now = time.time()
+    def send_by_word(self):
+        # 수정 간격은 EditScheduler 가 채널 제한과 동시 스트림 수에 맞춰 정함
         if 1 < len(self.text) < MAX_TEXT_LENGTH:
-            await self.msg.edit(content=self.text)
+            self.stream.update(self.text)
         elif MAX_TEXT_LENGTH <= len(self.text):
-            await self.msg.edit(content=self.text[:MAX_TEXT_LENGTH] + "...")
+            self.stream.update(self.text[:MAX_TEXT_LENGTH] + "...")
 
     async def send_to_file(self):
         file_name = await self.gpt.short_chat(
@@ -148,6 +151,7 @@ class HistoryHandler(GPTHandler):
 
     @HandleErrors("기록을 탐색하다 에러가 발생했어요!")
     async def run(self, *args: tuple[str]):
+        await self.gpt.load_history()
         if not args:
             await self.show_history_and_reply()
         elif args[0] == "clear":
@@ -1,13 +1,76 @@
 import os
+import asyncio
 import discord
 from discord.ext import commands
-from GPT import GPTBox
+from GPT import (
+    GPTBox,
+    HTTPClient,
+    RequestScheduler,
+    RetrievalMemory,
+    Schedule,
+    SchedulePool,
+    SQLiteStore,
+    Tokener,
+)
+from GPT.schedule import Dispatch
 from dotenv import load_dotenv
 
 load_dotenv()
 bot_prefix = "!"
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix=bot_prefix, intents=intents)
 
-gpt_container = GPTBox(os.environ["OPENAI_API_KEY"])
+HTTPClient.configure(
+    max_connections=int(os.environ.get("OPENAI_MAX_CONNECTIONS", 100)),
+    max_keepalive_connections=int(os.environ.get("OPENAI_MAX_KEEPALIVE", 20)),
+    keepalive_expiry=float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", 60)),
+)
+# Docker 이미지 빌드 시 BPE 파일을 미리 받아두면 오프라인에서도 동작함
+Tokener.set_cache_dir(os.environ.get("TIKTOKEN_CACHE_DIR", "tiktoken_cache"))
+preload_models = os.environ.get("TIKTOKEN_PRELOAD_MODELS", Tokener.DEFAULT_MODEL)
+scheduler = RequestScheduler(
+    requests_per_minute=int(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", 3500)),
+    tokens_per_minute=int(os.environ.get("OPENAI_TOKENS_PER_MINUTE", 90000)),
+)
+# 여러 키를 사용할 경우 OPENAI_API_KEYS="key1,key2:org-id" 형태로 설정
+api_keys = os.environ.get("OPENAI_API_KEYS") or os.environ["OPENAI_API_KEY"]
+# 채널 수나 메모리(MB)가 한도를 넘으면 오래 사용하지 않은 채널부터 정리
+memory_budget = os.environ.get("GPT_MEMORY_BUDGET_MB")
+# 설정하면 잘려나간 대화를 채널별로 색인해 두고 관련된 내용을 다시 넣어줌
+memory_dir = os.environ.get("GPT_MEMORY_DIR")
+gpt_container = GPTBox(
+    api_keys,
+    scheduler=scheduler,
+    max_channels=int(os.environ.get("GPT_MAX_CHANNELS", 1000)),
+    memory_budget=int(memory_budget) * 1024 * 1024 if memory_budget else None,
+    compact_seconds=float(os.environ.get("GPT_COMPACT_SECONDS", 300)),
+    memory=RetrievalMemory(directory=memory_dir) if memory_dir else None,
+)
+
+
+class GPTBot(commands.Bot):
+    # 알림 전송 함수, bot.command 에서 연결함
+    reminder_dispatch: Dispatch | None = None
+
+    async def setup_hook(self) -> None:
+        # on_ready 전에 인코딩을 불러와 첫 메시지가 BPE 로딩을 기다리지 않게 함
+        await asyncio.to_thread(Tokener.preload, preload_models.split(","))
+        # 파일을 쓰는 저장소는 봇이 시작될 때 만들어서 import 만으로 파일이 생기지 않게 함
+        gpt_container.store = SQLiteStore(
+            os.environ.get("GPT_HISTORY_DB", "history.db")
+        )
+        gpt_container.schedule_pool = SchedulePool(
+            os.environ.get("GPT_SCHEDULE_DIR", "schedule")
+        )
+        gpt_container.schedule = Schedule(
+            os.environ.get("GPT_REMINDER_DB", "reminder.db"),
+            dispatch=self.reminder_dispatch,
+        )
+        gpt_container.schedule.start()
+
+    async def close(self) -> None:
+        await gpt_container.close()
+        await super().close()
+
+
+bot = GPTBot(command_prefix=bot_prefix, intents=intents)
@@ -1,7 +1,15 @@
 from .chat import *
+from .client import *
 from .function import *
 from .gpt import *
 from .gptbox import *
+from .keypool import *
+from .memory import *
 from .message import *
+from .ratelimit import *
+from .schedule import *
+from .schedulepool import *
 from .setting import *
+from .sse import *
+from .store import *
 from .token import *
@@ -1,6 +1,10 @@
+import json
 import os
 from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, Mock, patch
+import httpx
 from GPT import chat
+from GPT.keypool import KeyPool
 from GPT.message import (
     MessageBox,
     UserMessage,
@@ -21,6 +25,61 @@ class ChatTests(IsolatedAsyncioTestCase):
         self.message_box = MessageBox()
         self.message_box.add_message(UserMessage(content="안녕?"))
 
+    def test_make_body(self):
+        self.message_box.add_message(
+            AssistanceMessage({"delta": {"content": '"따옴표"\n'}})
+        )
+        self.setting.system_text = "시스템"
+        chat_api = chat.ChatStreamFunction(api_key=self.api_key)
+        chat_api.function = [{"name": "test", "parameters": {}}]
+        chat_api.data = chat_api.make_data(self.message_box, self.setting)
+        body = chat_api.make_body()
+        self.assertEqual(json.loads(body), chat_api.data)
+        self.assertEqual(chat_api.data["messages"][0]["role"], "system")
+        prefix = chat_api.prefix
+        self.message_box.add_message(UserMessage(content="다음"))
+        chat_api.data = chat_api.make_data(self.message_box, self.setting)
+        self.assertEqual(json.loads(chat_api.make_body()), chat_api.data)
+        self.assertIs(chat_api.prefix, prefix)
+
+    async def test_estimate_from_window(self):
+        for i in range(5):
+            self.message_box.add_message(UserMessage(content=f"{i}번째 메시지"))
+        self.setting.set_setting("system_text", "너는 도우미야")
+        chat_api = chat.Chat(api_key=self.api_key)
+        chat_api.data = chat_api.make_data(self.message_box, self.setting)
+        # 창을 만들 때 센 토큰 수를 그대로 쓰고 다시 세지 않음
+        with patch.object(chat.Tokener, "async_num_tokens_of_messages") as mock_count:
+            token = await chat_api.estimate_tokens()
+        mock_count.assert_not_called()
+        self.assertEqual(token, self.message_box.get_token(self.setting))
+        self.assertEqual(
+            token, chat.Tokener.num_tokens_from_messages(chat_api.data["messages"])
+        )
+
+    async def test_pick_key_after_wait(self):
+        key_pool = KeyPool.from_string("key-a,key-b")
+        key_a, key_b = key_pool.keys
+        chat_api = chat.Chat(api_key=key_pool, scheduler=chat.RequestScheduler())
+
+        async def acquire(channel_id, tokens):
+            # 차례를 기다리는 동안 key-a 가 제한에 걸림
+            key_pool.report(key_a, 429, {"retry-after": "30"})
+
+        client = Mock()
+        client.post = AsyncMock(
+            return_value=httpx.Response(
+                200, json={"choices": [{"message": {"content": "안녕"}}]}
+            )
+        )
+        with patch.object(chat_api.scheduler, "acquire", new=acquire), patch.object(
+            chat.HTTPClient, "get_client", return_value=client
+        ):
+            response = await chat_api.run(messages=self.messages, setting=self.setting)
+        self.assertEqual(response, "안녕")
+        self.assertEqual(client.post.call_count, 1)
+        self.assertEqual(client.post.call_args.kwargs["headers"], key_b.make_header())
+
     async def test_run(self):
         chat_api = chat.Chat(api_key=self.api_key)
         response = await chat_api.run(messages=self.messages, setting=self.setting)
@@ -0,0 +1,28 @@
+from unittest import IsolatedAsyncioTestCase
+from GPT.client import HTTPClient
+
+
+class HTTPClientTests(IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        await HTTPClient.close()
+
+    async def test_shared_client(self):
+        client1 = HTTPClient.get_client()
+        client2 = HTTPClient.get_client()
+        self.assertIs(client1, client2)
+        self.assertFalse(client1.is_closed)
+
+    async def test_close(self):
+        client1 = HTTPClient.get_client()
+        await HTTPClient.close()
+        self.assertTrue(client1.is_closed)
+        client2 = HTTPClient.get_client()
+        self.assertIsNot(client1, client2)
+
+    async def test_configure(self):
+        HTTPClient.configure(max_connections=5, max_keepalive_connections=2)
+        try:
+            self.assertEqual(HTTPClient.limits.max_connections, 5)
+            self.assertEqual(HTTPClient.limits.max_keepalive_connections, 2)
+        finally:
+            HTTPClient.configure()
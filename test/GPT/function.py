@@ -1,5 +1,10 @@
+import asyncio
+import json
 import os
+import time
+from typing import Annotated, Literal
 from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
 from GPT import chat
 from GPT.message import (
     BaseMessage,
@@ -9,10 +14,20 @@ from GPT.message import (
     FunctionMessage,
     AssistanceMessage,
 )
-from GPT.function import FunctionManager, TestFunction
+from GPT.function import (
+    Function,
+    FunctionManager,
+    ParameterManager,
+    ParameterType,
+    FunctionRegistry,
+    ResultCache,
+    ScheduleFunction,
+    TestFunction,
+    define_function,
+)
+from GPT.schedulepool import SchedulePool
 from dotenv import load_dotenv
 
-
 load_dotenv()
 
 
@@ -36,3 +51,281 @@ class FunctionTests(IsolatedAsyncioTestCase):
             parameters_type = parameters.get("type")
             self.assertGreater(len(name), 0)
             self.assertGreater(len(parameters_type), 0)
+
+    async def test_shared_schema(self):
+        other = FunctionManager()
+        other.add_function(TestFunction)
+        other.add_function(ScheduleFunction)
+        self.assertIs(other.make_dict(), other.make_dict())
+        self.assertIs(other.make_dict()[0], self.function_manager.make_dict()[0])
+        self.assertEqual(json.loads(other.make_fragment()), other.make_dict())
+        self.assertIs(
+            other.function_list["get_current_weather"],
+            FunctionRegistry.get_function(TestFunction),
+        )
+        with self.assertRaises(ValueError):
+            TestFunction().parameters.add_parameter("test", "string")
+
+        schedule = other.function_list["schedule_management"]
+        self.assertIsNot(schedule, FunctionRegistry.get_function(ScheduleFunction))
+        other.close()
+        self.assertEqual(
+            await other.function_list["get_current_weather"].run("Seoul"),
+            {"whether": "sunny"},
+        )
+
+    def test_function_body(self):
+        stream_api = chat.ChatStreamFunction(api_key=self.api_key)
+        stream_api.function = self.function_manager
+        stream_api.data = stream_api.make_data(self.message_box, self.setting)
+        self.assertEqual(json.loads(stream_api.make_body()), stream_api.data)
+
+    async def test_schedule_limits(self):
+        schedule = ScheduleFunction()
+        await schedule.run("CREATE TABLE test (value INTEGER)")
+        await schedule.run(
+            "INSERT INTO test WITH RECURSIVE n(x) AS"
+            " (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 500) SELECT x FROM n"
+        )
+        self.assertEqual(await schedule.run("SELECT count(*) FROM test"), "[(500,)]")
+        result = await schedule.run("SELECT value FROM test")
+        self.assertIn(f"only the first {ScheduleFunction.MAX_ROWS} rows", result)
+
+        with patch.object(ScheduleFunction, "TIME_LIMIT", 0.1):
+            start = time.monotonic()
+            with self.assertRaises(TimeoutError):
+                await schedule.run(
+                    "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n)"
+                    " SELECT count(*) FROM n"
+                )
+            self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(await schedule.run("SELECT count(*) FROM test"), "[(500,)]")
+        schedule.close()
+
+    async def test_truncate_result(self):
+        result = self.function_manager.truncate("a" * 5000)
+        self.assertTrue(result.startswith("a" * FunctionManager.MAX_RESULT_CHARS))
+        self.assertTrue(result.endswith("truncated 1000 characters"))
+
+    async def test_run_tool_calls(self):
+        class SlowFunction(Function):
+            name = "slow_function"
+            description = ""
+            max_concurrency = 2
+            timeout = 0.3
+
+            @classmethod
+            def set_parameter(cls, parameters: ParameterManager):
+                parameters.add_parameter("seconds", ParameterType.number, required=True)
+
+            async def run(self, seconds: float):
+                await asyncio.sleep(seconds)
+                return seconds
+
+        self.function_manager.add_function(SlowFunction)
+
+        def make_call(index: int, name: str, arguments: str) -> dict:
+            return {
+                "id": f"call_{index}",
+                "type": "function",
+                "function": {"name": name, "arguments": arguments},
+            }
+
+        message = AssistanceMessage()
+        message.tool_calls = [
+            make_call(0, "slow_function", '{"seconds": 0.1}'),
+            make_call(1, "slow_function", '{"seconds": 0.1}'),
+            make_call(2, "get_current_weather", '{"location": "Seoul"}'),
+            make_call(3, "slow_function", '{"seconds": 1}'),
+            make_call(4, "slow_function", "{"),
+            make_call(5, "unknown", "{}"),
+        ]
+        start = time.monotonic()
+        results = await self.function_manager.run_tool_calls(message)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(
+            [result.tool_call_id for result in results][:3],
+            ["call_0", "call_1", "call_2"],
+        )
+        self.assertEqual(results[0].content, "0.1")
+        self.assertIn("sunny", results[2].content)
+        self.assertIn("took longer than 0.3 seconds", results[3].content)
+        self.assertIn("Expecting", results[4].content)
+        self.assertIn("unknown is not found", results[5].content)
+        self.assertEqual(
+            results[0].make_message(),
+            {"role": "tool", "content": "0.1", "tool_call_id": "call_0"},
+        )
+
+        message.tool_calls = [
+            make_call(index, "slow_function", '{"seconds": 0.1}') for index in range(4)
+        ]
+        start = time.monotonic()
+        await self.function_manager.run_tool_calls(message)
+        # max_concurrency 가 2 이므로 두 번에 나눠서 실행됨
+        self.assertGreater(time.monotonic() - start, 0.2)
+
+    async def test_result_cache(self):
+        calls = []
+
+        class CountFunction(Function):
+            name = "count_function"
+            description = ""
+            cache_ttl = 0.2
+
+            @classmethod
+            def set_parameter(cls, parameters: ParameterManager):
+                parameters.add_parameter("a", ParameterType.string, required=True)
+                parameters.add_parameter("b", ParameterType.string)
+
+            async def run(self, a: str, b: str = ""):
+                calls.append((a, b))
+                await asyncio.sleep(0.05)
+                if a == "error":
+                    raise ValueError("failed")
+                return a + b
+
+        self.function_manager.add_function(CountFunction)
+        run = self.function_manager.type_check_and_run
+        with patch.object(FunctionManager, "cache", ResultCache(max_size=2)):
+            cache = FunctionManager.cache
+            # 동시에 들어온 같은 호출은 한 번만 실행됨
+            results = await asyncio.gather(
+                *(run("count_function", {"a": "x", "b": "y"}) for _ in range(3))
+            )
+            self.assertEqual(results, ["xy"] * 3)
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(cache.deduplicated, 2)
+
+            # 키 순서가 달라도 같은 호출로 봄
+            self.assertEqual(await run("count_function", {"b": "y", "a": "x"}), "xy")
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(cache.hits, 1)
+
+            # 실패한 결과는 저장하지 않음
+            for _ in range(2):
+                result = await run("count_function", {"a": "error"})
+                self.assertIsInstance(result, ValueError)
+            self.assertEqual(len(calls), 3)
+
+            await asyncio.sleep(0.25)
+            await run("count_function", {"a": "x", "b": "y"})
+            self.assertEqual(len(calls), 4)
+
+            await run("get_current_weather", {"location": "Seoul"})
+            await run("get_current_weather", {"location": " seoul "})
+            await run("count_function", {"a": "z"})
+            self.assertEqual(cache.hits, 2)
+            self.assertEqual(len(cache), 2)
+            self.assertEqual(cache.stats()["misses"], len(calls) + 1)
+
+    async def test_channel_cache_key(self):
+        pool = SchedulePool(None)
+        arguments = {"query": "SELECT 1"}
+        first = ScheduleFunction(1, pool)
+        # 같은 채널의 새 인스턴스는 같은 키, 다른 채널과는 섞이지 않음
+        self.assertEqual(
+            first.make_cache_key(arguments),
+            ScheduleFunction(1, pool).make_cache_key(arguments),
+        )
+        self.assertNotEqual(
+            first.make_cache_key(arguments),
+            ScheduleFunction(2, pool).make_cache_key(arguments),
+        )
+        pool.close()
+
+    async def test_validate_arguments(self):
+        parameters = ParameterManager()
+        parameters.add_parameter("name", ParameterType.string, required=True)
+        parameters.add_parameter("count", ParameterType.integer)
+        parameters.add_parameter("ratio", ParameterType.number)
+        parameters.add_parameter("enabled", ParameterType.boolean)
+        parameters.add_parameter("unit", ParameterType.string, enum=["c", "f"])
+        parameters.freeze()
+        self.assertEqual(
+            parameters.type_check(
+                {
+                    "name": "a",
+                    "count": " 3 ",
+                    "ratio": "0.5",
+                    "enabled": "true",
+                    "unit": None,
+                }
+            ),
+            {"name": "a", "count": 3, "ratio": 0.5, "enabled": True},
+        )
+        self.assertEqual(parameters.type_check({"name": 1, "count": 2.0})["count"], 2)
+        with self.assertRaises(ValueError) as context:
+            parameters.type_check(
+                {"count": "three", "enabled": 1, "unit": "k", "colour": "red"}
+            )
+        self.assertEqual(
+            str(context.exception),
+            "count must be integer, got 'three'; enabled must be boolean, got 1; "
+            "unit must be one of ['c', 'f']; unknown argument 'colour'; "
+            "name is required; expected: name, count, ratio, enabled, unit",
+        )
+        with self.assertRaises(ValueError):
+            parameters.type_check({"name": "a", "count": 1.5})
+        with self.assertRaises(ValueError):
+            parameters.type_check({"name": "a", "ratio": "nan"})
+
+        result = await self.function_manager.type_check_and_run(
+            "get_current_weather", {"location": "Seoul", "unit": "kelvin"}
+        )
+        self.assertIsInstance(result, ValueError)
+        self.assertIn("unit must be one of", str(result))
+
+    async def test_define_function(self):
+        @define_function("Add two numbers", cache_ttl=30.0)
+        async def add_numbers(
+            a: Annotated[int, "first number"],
+            b: float = 0.0,
+            mode: Literal["sum", "diff"] | None = None,
+        ):
+            return a + b if mode != "diff" else a - b
+
+        self.assertTrue(issubclass(add_numbers, Function))
+        self.assertEqual(add_numbers.cache_ttl, 30.0)
+        schema = FunctionRegistry.get_function(add_numbers).make_dict()
+        self.assertEqual(
+            schema,
+            {
+                "name": "add_numbers",
+                "description": "Add two numbers",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "a": {"type": "integer", "description": "first number"},
+                        "b": {"type": "number", "description": ""},
+                        "mode": {
+                            "type": "string",
+                            "description": "",
+                            "enum": ["sum", "diff"],
+                        },
+                    },
+                    "required": ["a"],
+                },
+            },
+        )
+        self.function_manager.add_function(add_numbers)
+        self.assertEqual(
+            await self.function_manager.type_check_and_run(
+                "add_numbers", {"a": "2", "b": "1.5", "mode": "diff"}
+            ),
+            0.5,
+        )
+        with self.assertRaises(TypeError):
+
+            @define_function()
+            async def no_hint(a):
+                return a
+
+    def test_tools_body(self):
+        self.setting.set_setting("model", "gpt-4o")
+        stream_api = chat.ChatStreamFunction(api_key=self.api_key)
+        stream_api.function = self.function_manager
+        stream_api.data = stream_api.make_data(self.message_box, self.setting)
+        self.assertNotIn("functions", stream_api.data)
+        self.assertEqual(stream_api.data["tools"][0]["type"], "function")
+        self.assertEqual(json.loads(stream_api.make_body()), stream_api.data)
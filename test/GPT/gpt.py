@@ -1,7 +1,14 @@
 import os
 from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
 from GPT import gpt
-from GPT.message import BaseMessage, AssistanceMessage
+from GPT.message import (
+    BaseMessage,
+    AssistanceMessage,
+    SystemMessage,
+    UserMessage,
+)
+from GPT.setting import Setting
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -22,3 +29,90 @@ class GptTests(IsolatedAsyncioTestCase):
         chat = gpt.GPT(api_key=self.api_key)
         result = await chat.short_chat("안녕?", "당신은 친절한 AI 입니다.")
         self.assertGreater(len(result), 0)
+
+    async def test_parallel_tool_calls(self):
+        chat = gpt.GPT(api_key=self.api_key)
+        chat.setting.set_setting("model", "gpt-4o")
+        requests = []
+
+        async def run(chat_api, messages, function, setting):
+            chat_api.function = function
+            requests.append(chat_api.make_data(messages, setting))
+            if len(requests) == 1:
+                for index, city in enumerate(["Seoul", "Busan"]):
+                    yield {
+                        "delta": {
+                            "tool_calls": [
+                                {
+                                    "index": index,
+                                    "id": f"call_{index}",
+                                    "function": {
+                                        "name": "get_current_weather",
+                                        "arguments": "",
+                                    },
+                                }
+                            ]
+                        }
+                    }
+                    yield {
+                        "delta": {
+                            "tool_calls": [
+                                {
+                                    "index": index,
+                                    "function": {
+                                        "arguments": f'{{"location":"{city}"}}'
+                                    },
+                                }
+                            ]
+                        }
+                    }
+                yield {"delta": {}, "finish_reason": "tool_calls"}
+            else:
+                yield {"delta": {"content": "둘 다 맑아요."}, "finish_reason": "stop"}
+
+        with patch.object(gpt.ChatStreamFunction, "run", new=run):
+            text = "".join(
+                [
+                    content
+                    async for content in chat.get_stream_chat_with_function("날씨?")
+                ]
+            )
+        self.assertEqual(len(requests), 2)
+        self.assertIn("tools", requests[0])
+        self.assertTrue(text.endswith("둘 다 맑아요."))
+        roles = [message.role for message in chat.message_box]
+        self.assertEqual(roles, ["user", "assistant", "tool", "tool", "assistant"])
+        self.assertEqual(len(chat.message_box[1].tool_calls), 2)
+        self.assertEqual(
+            [message["role"] for message in requests[1]["messages"]][-2:],
+            ["tool", "tool"],
+        )
+        self.assertEqual(chat.message_box[3].tool_call_id, "call_1")
+
+    async def test_summarize_history(self):
+        chat = gpt.GPT(api_key=self.api_key)
+        chat.setting.set_setting("history_mode", Setting.SUMMARY)
+        chat.setting.set_setting("max_token", "400")
+        for i in range(20):
+            chat.message_box.add_message(UserMessage(content=f"{i}번째 메시지 입니다."))
+        with patch.object(chat, "short_chat", return_value="요약") as mock_chat:
+            chat.start_summary()
+            await chat.summary_task
+        mock_chat.assert_not_called()
+
+        for i in range(20, 40):
+            chat.message_box.add_message(UserMessage(content=f"{i}번째 메시지 입니다."))
+        chat.message_box.make_messages(setting=chat.setting)
+        recent = chat.message_box[-1]
+        with patch.object(chat, "short_chat", return_value="요약") as mock_chat:
+            chat.start_summary()
+            await chat.summary_task
+        mock_chat.assert_called_once()
+        summary = chat.message_box[0]
+        self.assertIsInstance(summary, SystemMessage)
+        self.assertEqual(summary.content, "이전 대화 요약:\n요약")
+        self.assertIs(chat.message_box[-1], recent)
+        token = chat.message_box.get_token(chat.setting)
+        self.assertLess(token, 400 * chat.message_box.SUMMARY_HIGH_WATER)
+        chat.message_box.count_tokens("gpt-4")
+        self.assertEqual(chat.message_box.get_token(chat.setting), token)
@@ -1,6 +1,8 @@
 import os
 from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
 from GPT import gptbox
+from GPT import message
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -20,3 +22,102 @@ class GptboxTests(IsolatedAsyncioTestCase):
             temp_gpt = gpt_container.get_gpt(i)
             gpt_list.add(temp_gpt)
         self.assertEqual(len(gpt_list), 10)
+
+    async def test_max_channels(self):
+        gpt_container = gptbox.GPTBox(self.api_key, max_channels=3)
+        gpt_container.get_gpt(0)
+        gpt_container.get_gpt(1)
+        gpt_container.get_gpt(0)
+        gpt_container.get_gpt(2)
+        gpt_container.get_gpt(3)
+        self.assertEqual(list(gpt_container.gpt_container), [0, 2, 3])
+        await gpt_container.close()
+
+    async def test_skip_active(self):
+        gpt_container = gptbox.GPTBox(self.api_key, max_channels=1)
+        gpt_container.get_gpt(0).active = 1
+        gpt_container.get_gpt(1)
+        self.assertEqual(list(gpt_container.gpt_container), [0, 1])
+        gpt_container.get_gpt(0).active = 0
+        gpt_container.sweep()
+        self.assertEqual(list(gpt_container.gpt_container), [0])
+        await gpt_container.close()
+
+    async def test_sweep_expired(self):
+        gpt_container = gptbox.GPTBox(self.api_key)
+        old_gpt = gpt_container.get_gpt(0)
+        gpt_container.get_gpt(1)
+        schedule = old_gpt.function_manager.function_list["schedule_management"]
+        await schedule.run("SELECT 1")
+        self.assertEqual(len(schedule.pool.connections), 1)
+        old_gpt.lastRequestTime -= old_gpt.setting.keep_min * 60 + 1
+        gpt_container.sweep()
+        self.assertEqual(list(gpt_container.gpt_container), [1])
+        self.assertEqual(len(schedule.pool.connections), 0)
+        await gpt_container.close()
+
+    async def test_memory_budget(self):
+        gpt_container = gptbox.GPTBox(self.api_key, memory_budget=50000)
+        for i in range(3):
+            gpt = gpt_container.get_gpt(i)
+            for _ in range(100):
+                gpt.message_box.add_message(message.UserMessage(content="a" * 200))
+        self.assertGreater(gpt_container.memory_size(), 50000)
+        gpt_container.sweep()
+        self.assertLessEqual(gpt_container.memory_size(), 50000)
+        self.assertEqual(list(gpt_container.gpt_container), [2])
+        await gpt_container.close()
+
+    async def test_sweep_compact(self):
+        gpt_container = gptbox.GPTBox(self.api_key, compact_seconds=60)
+        gpt = gpt_container.get_gpt(0)
+        gpt.message_box.add_message(message.UserMessage(content="안녕?"))
+        gpt_container.sweep()
+        self.assertIsNone(gpt.message_box.cold)
+        gpt.lastRequestTime -= 61
+        gpt_container.sweep()
+        self.assertIsNotNone(gpt.message_box.cold)
+        self.assertEqual(gpt.message_box[0].content, "안녕?")
+        await gpt_container.close()
+
+    async def test_keep_setting(self):
+        gpt_container = gptbox.GPTBox(self.api_key, max_channels=1)
+        gpt = gpt_container.get_gpt(0)
+        gpt.setting.set_setting("system_text", "너는 해적이야")
+        gpt.setting.set_setting("max_token", "1000")
+        gpt_container.get_gpt(1)
+        self.assertNotIn(0, gpt_container.gpt_container)
+        self.assertEqual(list(gpt_container.settings), [0])
+        gpt = gpt_container.get_gpt(0)
+        self.assertEqual(gpt.setting.system_text, "너는 해적이야")
+        self.assertEqual(gpt.setting.max_token, 1000)
+        # 기본 설정인 채널은 남기지 않음
+        self.assertEqual(list(gpt_container.settings), [])
+        await gpt_container.close()
+
+    async def test_settings_limit(self):
+        gpt_container = gptbox.GPTBox(self.api_key, max_channels=2)
+        for channel_id in range(5):
+            gpt = gpt_container.get_gpt(channel_id)
+            gpt.setting.set_setting("max_token", "1000")
+        # 정리된 채널의 설정도 최근 max_channels 개까지만 남김
+        self.assertEqual(list(gpt_container.settings), [1, 2])
+        await gpt_container.close()
+
+    async def test_running_memory_size(self):
+        gpt_container = gptbox.GPTBox(self.api_key, memory_budget=10**9)
+        for i in range(5):
+            gpt_container.get_gpt(i)
+        self.assertEqual(gpt_container.total_size, gpt_container.memory_size())
+        with patch.object(gptbox.GPTBox, "memory_size") as mock_size:
+            gpt_container.get_gpt(5)
+            gpt_container.get_gpt(0)
+        mock_size.assert_not_called()
+        gpt_container.get_gpt(0).message_box.add_message(
+            message.UserMessage(content="a" * 200)
+        )
+        gpt_container.get_gpt(0)
+        self.assertEqual(gpt_container.total_size, gpt_container.memory_size())
+        gpt_container.remove_gpt(0)
+        self.assertEqual(gpt_container.total_size, gpt_container.memory_size())
+        await gpt_container.close()
@@ -0,0 +1,63 @@
+from unittest import TestCase
+from GPT.keypool import APIKey, KeyPool
+
+
+class KeyPoolTests(TestCase):
+    def setUp(self):
+        self.key_pool = KeyPool.from_string("key-a,key-b:org-b")
+
+    def test_from_string(self):
+        self.assertEqual(len(self.key_pool), 2)
+        key_b = self.key_pool.keys[1]
+        self.assertEqual(key_b.key, "key-b")
+        self.assertEqual(key_b.organization, "org-b")
+        self.assertEqual(key_b.make_header()["OpenAI-Organization"], "org-b")
+        with self.assertRaises(ValueError):
+            KeyPool([])
+
+    def test_round_robin(self):
+        used = {self.key_pool.acquire().key for _ in range(2)}
+        self.assertEqual(used, {"key-a", "key-b"})
+
+    def test_bench(self):
+        key_a, key_b = self.key_pool.keys
+        self.key_pool.report(key_a, 429, {"retry-after": "30"})
+        for _ in range(5):
+            self.assertIs(self.key_pool.acquire(), key_b)
+        self.key_pool.report(key_b, 401, {})
+        self.assertFalse(self.key_pool.has_available())
+        self.assertIs(self.key_pool.acquire(), key_a)
+
+    def test_prefer_remaining_quota(self):
+        key_a, key_b = self.key_pool.keys
+        self.key_pool.report(
+            key_a,
+            200,
+            {
+                "x-ratelimit-limit-tokens": "1000",
+                "x-ratelimit-remaining-tokens": "100",
+                "x-ratelimit-reset-tokens": "30s",
+            },
+        )
+        self.key_pool.report(
+            key_b,
+            200,
+            {
+                "x-ratelimit-limit-tokens": "1000",
+                "x-ratelimit-remaining-tokens": "900",
+                "x-ratelimit-reset-tokens": "30s",
+            },
+        )
+        for _ in range(3):
+            self.assertIs(self.key_pool.acquire(), key_b)
+        headers = self.key_pool.rate_limit_headers()
+        self.assertEqual(float(headers["x-ratelimit-limit-tokens"]), 2000)
+        self.assertEqual(float(headers["x-ratelimit-remaining-tokens"]), 1000)
+
+    def test_error_rate(self):
+        key = APIKey("key")
+        self.assertEqual(key.error_rate(), 0)
+        key_pool = KeyPool([key])
+        key_pool.report(key, 200, {})
+        key_pool.report(key, 500, {})
+        self.assertEqual(key.error_rate(), 0.5)
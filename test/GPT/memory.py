@@ -0,0 +1,132 @@
+import asyncio
+import os
+import tempfile
+from unittest import TestCase, IsolatedAsyncioTestCase
+import numpy as np
+from GPT import gpt
+from GPT import memory
+from GPT import message
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class HashingEmbedderTests(TestCase):
+    def test_embed(self):
+        embedder = memory.HashingEmbedder(dimension=256)
+        vectors = embedder.embed(
+            ["내일 오후 3시에 회의가 있어", "회의는 내일 오후", ""]
+        )
+        self.assertEqual(vectors.shape, (3, 256))
+        self.assertAlmostEqual(float(np.linalg.norm(vectors[0])), 1.0, places=5)
+        self.assertEqual(float(np.linalg.norm(vectors[2])), 0.0)
+        self.assertGreater(float(vectors[0] @ vectors[1]), 0.3)
+
+
+class RetrievalMemoryTests(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.messages = [
+            message.UserMessage(content="내 고양이 이름은 나비야"),
+            message.AssistanceMessage(
+                {"delta": {"content": "나비는 귀여운 이름이네요!"}}
+            ),
+            message.UserMessage(content="다음 주 화요일에 치과 예약이 있어"),
+            message.FunctionMessage(name="test", content="치과"),
+        ]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_recall(self):
+        retrieval = memory.RetrievalMemory(top_k=1)
+        self.assertEqual(retrieval.recall(1, "치과"), [])
+        retrieval.remember(1, self.messages)
+        self.assertEqual(len(retrieval.indexes[1].texts), 3)
+        self.assertEqual(
+            retrieval.recall(1, "치과 예약 언제였지?"),
+            ["user: 다음 주 화요일에 치과 예약이 있어"],
+        )
+        self.assertEqual(retrieval.recall(2, "치과 예약 언제였지?"), [])
+
+    def test_persist_and_grow(self):
+        retrieval = memory.RetrievalMemory(directory=self.temp_dir.name, top_k=1)
+        for i in range(100):
+            retrieval.remember(1, [message.UserMessage(content=f"메모 {i} 번")])
+        retrieval.remember(1, self.messages)
+        self.assertIsInstance(retrieval.indexes[1].vectors, np.memmap)
+        retrieval.close()
+
+        retrieval = memory.RetrievalMemory(directory=self.temp_dir.name, top_k=1)
+        self.assertEqual(
+            retrieval.recall(1, "고양이 이름"), ["user: 내 고양이 이름은 나비야"]
+        )
+        self.assertEqual(len(retrieval.indexes[1].texts), 103)
+        retrieval.forget(1)
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+        self.assertEqual(retrieval.recall(1, "고양이 이름"), [])
+
+    def test_skip_remembered(self):
+        retrieval = memory.RetrievalMemory(directory=self.temp_dir.name)
+        retrieval.remember(1, self.messages)
+        retrieval.close()
+        # 재시작 후 다시 불러온 메시지가 잘려도 같은 문장은 한 번만 저장됨
+        retrieval = memory.RetrievalMemory(directory=self.temp_dir.name)
+        retrieval.remember(1, self.messages + self.messages[:1])
+        self.assertEqual(len(retrieval.indexes[1].texts), 3)
+        retrieval.remember(1, [message.UserMessage(content="새로운 메모")] * 2)
+        self.assertEqual(len(retrieval.indexes[1].texts), 4)
+        retrieval.close()
+
+    def test_evict_in_memory(self):
+        retrieval = memory.RetrievalMemory(max_open=2)
+        for channel_id in range(3):
+            retrieval.remember(channel_id, self.messages)
+        # 파일이 없어도 max_open 을 넘으면 오래된 채널의 색인을 버림
+        self.assertEqual(list(retrieval.indexes), [1, 2])
+        self.assertEqual(retrieval.recall(0, "치과"), [])
+        self.assertEqual(retrieval.memory_size(2), retrieval.indexes[2].vectors.nbytes)
+        retrieval.release(2)
+        self.assertEqual(list(retrieval.indexes), [1])
+        self.assertEqual(retrieval.memory_size(2), 0)
+
+    def test_release_keeps_files(self):
+        retrieval = memory.RetrievalMemory(directory=self.temp_dir.name)
+        retrieval.remember(1, self.messages)
+        self.assertEqual(retrieval.memory_size(1), 0)
+        retrieval.release(1)
+        self.assertEqual(retrieval.indexes, {})
+        self.assertEqual(len(retrieval.get_index(1).texts), 3)
+        retrieval.close()
+
+
+class GPTMemoryTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.api_key = os.environ["OPENAI_API_KEY"]
+
+    async def test_inject_recalled(self):
+        chat = gpt.GPT(api_key=self.api_key, memory=memory.RetrievalMemory())
+        chat.setting.set_setting("max_token", "200")
+        chat.message_box.add_message(
+            message.UserMessage(content="내 고양이 이름은 나비야")
+        )
+        for i in range(30):
+            chat.message_box.add_message(message.UserMessage(content=f"{i}번째 잡담"))
+        await chat.make_messages()
+        await asyncio.gather(*chat.memory_tasks)
+
+        memory_message = await chat.recall("고양이 이름이 뭐였지?")
+        self.assertIn("나비", memory_message.content)
+        messages = await chat.make_messages(memory_message)
+        self.assertIs(messages[0], memory_message)
+        token = chat.message_box.get_token(chat.setting) + memory_message.token
+        self.assertLessEqual(token, 200)
+
+    async def test_close_releases_index(self):
+        retrieval = memory.RetrievalMemory()
+        chat = gpt.GPT(api_key=self.api_key, channel_id=1, memory=retrieval)
+        size = chat.memory_size()
+        retrieval.remember(1, [message.UserMessage(content="내 고양이 이름은 나비야")])
+        self.assertEqual(chat.memory_size(), size + retrieval.indexes[1].vectors.nbytes)
+        chat.close()
+        self.assertEqual(retrieval.indexes, {})
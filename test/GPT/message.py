@@ -1,5 +1,8 @@
+import json
 import os
+import sys
 from unittest import TestCase, IsolatedAsyncioTestCase
+from unittest.mock import patch
 from GPT import chat
 from GPT import setting
 from GPT import gpt
@@ -25,18 +28,16 @@ class MessageTests(IsolatedAsyncioTestCase):
 
         self.asi_content1 = "안녕? "
         self.asi_content2 = "아이 졸려"
-        self.asi_msg1 = message.AssistanceMessage(
-            data={
-                "delta": {"role": "user", "content": self.asi_content1},
-                "finish_reason": "null",
-            }
-        )
-        self.asi_msg2 = message.AssistanceMessage(
-            data={
-                "delta": {"role": "user", "content": self.asi_content2},
-                "finish_reason": "stop",
-            }
-        )
+        self.asi_msg_data1 = {
+            "delta": {"role": "user", "content": self.asi_content1},
+            "finish_reason": "null",
+        }
+        self.asi_msg_data2 = {
+            "delta": {"role": "user", "content": self.asi_content2},
+            "finish_reason": "stop",
+        }
+        self.asi_msg1 = message.AssistanceMessage(data=self.asi_msg_data1)
+        self.asi_msg2 = message.AssistanceMessage(data=self.asi_msg_data2)
 
     def setUp(self):
         self.api_key = os.environ["OPENAI_API_KEY"]
@@ -106,3 +107,169 @@ class MessageTests(IsolatedAsyncioTestCase):
         for i in range(200):
             self.msg_box.add_message(self.usr_msg1)
         self.assertEqual(self.msg_box.get_token(setting=self.setting), 2219)
+
+    async def test_assistance_stream(self):
+        stream = message.AssistanceStream()
+        stream.add(
+            {"delta": {"role": "assistant", "content": ""}, "finish_reason": None}
+        )
+        self.assertEqual(stream.add(self.asi_msg_data1), self.asi_content1)
+        stream.add(self.asi_msg_data2)
+        result = stream.to_message()
+        self.assertIs(result, stream.to_message())
+        self.assertEqual(result.content, self.asi_content1 + self.asi_content2)
+        self.assertEqual(result.finish_reason, "stop")
+        self.assertEqual(result.function_call, {})
+
+    async def test_assistance_stream_function_call(self):
+        stream = message.AssistanceStream()
+        stream.add({"delta": {"function_call": {"name": "test", "arguments": ""}}})
+        stream.add({"delta": {"function_call": {"arguments": '{"a":'}}})
+        stream.add({"delta": {"function_call": {"arguments": " 1}"}}})
+        stream.add({"delta": {}, "finish_reason": "function_call"})
+        result = stream.to_message()
+        self.assertEqual(
+            result.function_call, {"name": "test", "arguments": '{"a": 1}'}
+        )
+        self.assertEqual(result.finish_reason, message.AssistanceMessage.FUNCTION_CALL)
+
+    async def test_token_cache(self):
+        def fake_count(message, model=None):
+            return len(message["content"])
+
+        with patch.object(
+            message.Tokener, "num_tokens_of_message", side_effect=fake_count
+        ) as mock_count:
+            for i in range(100):
+                self.msg_box.add_message(message.UserMessage(content="a" * 10))
+            self.setting.max_token = 502
+            self.assertEqual(len(self.msg_box.make_messages(setting=self.setting)), 50)
+            self.assertEqual(mock_count.call_count, 100)
+            self.assertEqual(self.msg_box.get_token(self.setting), 502)
+            self.msg_box.add_message(message.UserMessage(content="a" * 20))
+            self.assertEqual(len(self.msg_box.make_messages(setting=self.setting)), 49)
+            self.assertEqual(mock_count.call_count, 101)
+            self.msg_box.clear()
+            self.assertEqual(self.msg_box.get_token(self.setting), 2)
+
+    async def test_content_resets_token(self):
+        user_message = message.UserMessage(content="a" * 10)
+        self.msg_box.add_message(user_message)
+        self.msg_box.get_token(self.setting)
+        self.assertNotEqual(user_message.token_model, "")
+        # 복사한 메시지의 내용을 바꾸면 이전 토큰 수를 쓰지 않음
+        added = user_message + message.UserMessage(content="b" * 10)
+        self.assertEqual((added.token, added.token_model), (0, ""))
+        self.assertNotEqual(user_message.token_model, "")
+
+    async def test_compact_message(self):
+        msg1 = message.AssistanceMessage()
+        msg2 = message.AssistanceMessage(data=self.asi_msg_data1)
+        self.assertFalse(hasattr(msg1, "__dict__"))
+        self.assertIs(msg1.function_call, msg2.function_call)
+        self.assertIs(msg1.role, sys.intern("".join(["assis", "tant"])))
+
+    async def test_make_message_cache(self):
+        msg = message.AssistanceMessage(data=self.asi_msg_data1)
+        data = msg.make_message()
+        # dict 는 캐시하지 않고 직렬화한 조각만 캐시함
+        self.assertIsNot(msg.make_message(), data)
+        self.assertEqual(msg.make_message(), data)
+        self.assertIsNone(msg.fragment)
+        msg.content = "test"
+        self.assertEqual(msg.make_message()["content"], "test")
+        msg.function_call = {"name": "test", "arguments": ""}
+        self.assertEqual(msg.make_message()["function_call"]["name"], "test")
+        function_msg = message.FunctionMessage(name="a", content="b")
+        function_msg.make_message()
+        function_msg.name = "c"
+        self.assertEqual(function_msg.make_message()["name"], "c")
+        added = msg + message.AssistanceMessage(data=self.asi_msg_data2)
+        self.assertEqual(added.content, "test" + self.asi_content2)
+        self.assertEqual(msg.make_message()["content"], "test")
+
+    async def test_make_fragment(self):
+        msg = message.AssistanceMessage(data=self.asi_msg_data1)
+        fragment = msg.make_fragment()
+        self.assertIs(msg.make_fragment(), fragment)
+        self.assertEqual(json.loads(fragment), msg.make_message())
+        msg.content = "테스트"
+        self.assertEqual(json.loads(msg.make_fragment())["content"], "테스트")
+        msg.function_call = {"name": "test", "arguments": ""}
+        self.assertEqual(
+            json.loads(msg.make_fragment())["function_call"]["name"], "test"
+        )
+        function_msg = message.FunctionMessage(name="a", content="b")
+        function_msg.make_fragment()
+        function_msg.name = "c"
+        self.assertEqual(json.loads(function_msg.make_fragment())["name"], "c")
+
+    async def test_tool_calls(self):
+        stream = message.AssistanceStream()
+        msg = message.AssistanceMessage()
+        chunks = [
+            {"index": 0, "id": "call_0", "function": {"name": "a", "arguments": ""}},
+            {
+                "index": 1,
+                "id": "call_1",
+                "function": {"name": "b", "arguments": '{"x"'},
+            },
+            {"index": 0, "function": {"arguments": "{}"}},
+            {"index": 1, "function": {"arguments": ": 1}"}},
+        ]
+        for chunk in chunks:
+            data = {"delta": {"tool_calls": [chunk]}}
+            stream.add(data)
+            msg += message.AssistanceMessage(data=data)
+        expected = [
+            {
+                "id": "call_0",
+                "type": "function",
+                "function": {"name": "a", "arguments": "{}"},
+            },
+            {
+                "id": "call_1",
+                "type": "function",
+                "function": {"name": "b", "arguments": '{"x": 1}'},
+            },
+        ]
+        self.assertEqual(stream.to_message().make_message()["tool_calls"], expected)
+        self.assertEqual(msg.make_message()["tool_calls"], expected)
+
+        # 호출 메시지가 잘려나가면 남은 결과도 같이 버림
+        self.msg_box.add_message(stream.to_message())
+        self.msg_box.add_message(message.ToolMessage("a", "[]", "call_0"))
+        self.msg_box.add_message(message.ToolMessage("b", "[]", "call_1"))
+        self.msg_box.add_message(message.UserMessage(content="안녕?"))
+        self.msg_box.compact()
+        self.assertEqual(self.msg_box[0].tool_calls, tuple(expected))
+        self.assertEqual(self.msg_box[2].tool_call_id, "call_1")
+        self.msg_box.pop_message()
+        messages = self.msg_box.make_messages(setting=self.setting)
+        self.assertEqual([msg["role"] for msg in messages], ["user"])
+
+    async def test_cold_storage(self):
+        function_call = message.AssistanceMessage()
+        function_call.function_call = {"name": "test", "arguments": "{}"}
+        function_call.finish_reason = message.AssistanceMessage.FUNCTION_CALL
+        for i in range(50):
+            self.msg_box.add_message(message.UserMessage(content=f"{i} 안녕? " * 5))
+        self.msg_box.add_message(function_call)
+        self.msg_box.add_message(message.FunctionMessage(name="test", content="[]"))
+        before = self.msg_box.make_messages(setting=self.setting)
+        token = self.msg_box.get_token(self.setting)
+        memory_size = self.msg_box.memory_size
+        inflations = message.MessageBox.cold_stats.inflations
+
+        self.msg_box.compact()
+        self.assertEqual(len(self.msg_box.messaes), 0)
+        self.assertEqual(len(self.msg_box), 52)
+        self.assertLess(self.msg_box.memory_size * 4, memory_size)
+
+        with patch.object(message.Tokener, "num_tokens_of_message") as mock_count:
+            self.assertEqual(self.msg_box.get_token(self.setting), token)
+            mock_count.assert_not_called()
+        self.assertEqual(self.msg_box.make_messages(setting=self.setting), before)
+        self.assertEqual(self.msg_box.memory_size, memory_size)
+        self.assertEqual(message.MessageBox.cold_stats.inflations, inflations + 1)
+        self.assertGreater(message.MessageBox.cold_stats.stats()["ratio"], 1)
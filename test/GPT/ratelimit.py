@@ -0,0 +1,71 @@
+import asyncio
+from unittest import TestCase, IsolatedAsyncioTestCase
+from GPT.ratelimit import TokenBucket, RequestScheduler, parse_reset
+
+
+class TokenBucketTests(TestCase):
+    def test_wait_and_consume(self):
+        bucket = TokenBucket(60)
+        now = bucket.updated
+        self.assertEqual(bucket.wait_time(60, now), 0)
+        bucket.consume(60)
+        self.assertAlmostEqual(bucket.wait_time(1, now), 1.0)
+        self.assertAlmostEqual(bucket.wait_time(1, now + 1), 0.0)
+
+    def test_over_capacity(self):
+        bucket = TokenBucket(10)
+        self.assertEqual(bucket.wait_time(100, bucket.updated), 0)
+
+    def test_parse_reset(self):
+        self.assertAlmostEqual(parse_reset("1s"), 1)
+        self.assertAlmostEqual(parse_reset("6m0s"), 360)
+        self.assertAlmostEqual(parse_reset("20ms"), 0.02)
+        self.assertAlmostEqual(parse_reset(""), 0)
+
+
+class RequestSchedulerTests(IsolatedAsyncioTestCase):
+    async def test_fair_queue(self):
+        scheduler = RequestScheduler()
+        order = []
+
+        async def request(channel_id, name):
+            await scheduler.acquire(channel_id, 10)
+            order.append(name)
+
+        await asyncio.gather(
+            request(1, "a1"), request(1, "a2"), request(1, "a3"), request(2, "b1")
+        )
+        self.assertEqual(order, ["a1", "b1", "a2", "a3"])
+
+    async def test_token_limit(self):
+        scheduler = RequestScheduler(tokens_per_minute=600)
+        await scheduler.acquire(1, 600)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.acquire(2, 600), timeout=0.1)
+        await asyncio.wait_for(scheduler.acquire(2, 1), timeout=1)
+        self.assertFalse(scheduler.queues)
+
+    async def test_update_from_headers(self):
+        scheduler = RequestScheduler()
+        scheduler.update_from_headers(
+            {
+                "x-ratelimit-limit-requests": "60",
+                "x-ratelimit-remaining-requests": "10",
+                "x-ratelimit-limit-tokens": "1000",
+                "x-ratelimit-remaining-tokens": "0",
+            }
+        )
+        self.assertEqual(scheduler.requests.capacity, 60)
+        self.assertLessEqual(scheduler.requests.tokens, 10.1)
+        self.assertEqual(scheduler.tokens.capacity, 1000)
+        self.assertGreater(scheduler.tokens.wait_time(100), 0)
+
+    async def test_retry_delay(self):
+        scheduler = RequestScheduler(max_retries=2, base_delay=0.1)
+        self.assertIsNone(scheduler.retry_delay(200, {}, 0))
+        self.assertIsNone(scheduler.retry_delay(400, {}, 0))
+        delay = scheduler.retry_delay(429, {"retry-after": "2"}, 0)
+        self.assertGreaterEqual(delay, 2)
+        self.assertGreater(scheduler.blocked_until, 0)
+        self.assertIsNotNone(scheduler.retry_delay(503, {}, 1))
+        self.assertIsNone(scheduler.retry_delay(429, {}, 2))
@@ -0,0 +1,156 @@
+import asyncio
+import datetime
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import TestCase, IsolatedAsyncioTestCase
+from GPT.function import ReminderFunction
+from GPT.schedule import CronExpression, Schedule
+
+
+def make_time(*args) -> float:
+    return datetime.datetime(*args).timestamp()
+
+
+class CronExpressionTests(TestCase):
+    def test_next_time(self):
+        after = make_time(2024, 1, 1, 10, 30)  # 월요일
+        cases = {
+            "0 9 * * mon-fri": make_time(2024, 1, 2, 9, 0),
+            "*/15 * * * *": make_time(2024, 1, 1, 10, 45),
+            "0 0 29 2 *": make_time(2024, 2, 29, 0, 0),
+            "0 0 1 * 1": make_time(2024, 1, 8, 0, 0),
+            "0 12 * * 7": make_time(2024, 1, 7, 12, 0),
+            "5 10-18/4 * * *": make_time(2024, 1, 1, 14, 5),
+            "@monthly": make_time(2024, 2, 1, 0, 0),
+        }
+        for text, expected in cases.items():
+            self.assertEqual(CronExpression(text).next_time(after), expected, text)
+
+    def test_invalid(self):
+        for text in ["61 * * * *", "* * *", "* * 31 2 *", "*/0 * * * *"]:
+            with self.assertRaises(ValueError, msg=text):
+                CronExpression(text).next_time(time.time())
+
+    def test_parse_cache(self):
+        self.assertIs(
+            CronExpression.parse("0 9 * * *"), CronExpression.parse("0 9 * * *")
+        )
+
+
+class ScheduleTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "reminder.db")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    async def test_pop_due(self):
+        schedule = Schedule()
+        now = make_time(2024, 1, 1, 10, 30)
+        schedule.create_schedule("a", "매시 정각", "0 * * * *", channel_id=1, now=now)
+        schedule.create_schedule("b", "매일 9시", "0 9 * * *", channel_id=1, now=now)
+        schedule.create_schedule("a", "다른 채널", "0 * * * *", channel_id=2, now=now)
+        with self.assertRaises(ValueError):
+            schedule.create_schedule("a", "중복", "0 * * * *", channel_id=1, now=now)
+        schedule.delete_schedule("a", channel_id=2)
+        schedule.update_schedule("b", "매일 11시", "0 11 * * *", channel_id=1, now=now)
+
+        due = schedule.pop_due(make_time(2024, 1, 1, 11, 0))
+        self.assertEqual(
+            sorted(entry.description for entry, _ in due), ["매시 정각", "매일 11시"]
+        )
+        self.assertEqual(schedule.pop_due(make_time(2024, 1, 1, 11, 59)), [])
+        due = schedule.pop_due(make_time(2024, 1, 1, 15, 0))
+        self.assertEqual([entry.name for entry, _ in due], ["a"])
+        self.assertEqual(
+            schedule.read_schedule("a", channel_id=1)["next_time"], "2024-01-01 16:00"
+        )
+        self.assertEqual(list(schedule.list_schedule(1)), ["a", "b"])
+        self.assertEqual(len(schedule), 2)
+
+    async def test_persist_and_catch_up(self):
+        schedule = Schedule(self.path)
+        schedule.create_schedule("recent", "놓친 알림", "0 * * * *", channel_id=1)
+        schedule.create_schedule("old", "오래된 알림", "0 * * * *", channel_id=1)
+        await schedule.close()
+        con = sqlite3.connect(self.path)
+        with con:
+            con.execute("UPDATE schedules SET next_time = ?", (time.time() - 100,))
+            con.execute(
+                "UPDATE schedules SET next_time = ? WHERE name = 'old'",
+                (time.time() - 10000,),
+            )
+        con.close()
+
+        schedule = Schedule(self.path)
+        self.assertEqual(len(schedule), 2)
+        due = schedule.pop_due(time.time())
+        self.assertEqual([entry.name for entry, _ in due], ["recent"])
+        self.assertGreater(schedule.get_entry("old", 1).next_time, time.time())
+        await schedule.close()
+
+    async def test_run_loop(self):
+        fired = []
+
+        async def dispatch(entry, fire_time):
+            fired.append(entry.name)
+
+        schedule = Schedule(dispatch=dispatch)
+        schedule.start()
+        entry = schedule.create_schedule("soon", "곧", "0 0 1 1 *", channel_id=1)
+        # 다음 분까지 기다리지 않도록 실행 시각을 직접 앞당김
+        entry.version += 1
+        entry.next_time = time.time() + 0.05
+        schedule.push(entry)
+        await asyncio.sleep(0.3)
+        self.assertEqual(fired, ["soon"])
+        self.assertGreater(entry.next_time, time.time())
+        await schedule.close()
+
+    async def test_reminder_function(self):
+        schedule = Schedule()
+        reminder = ReminderFunction(1, schedule)
+        result = await reminder.run("create", "회의", "회의 시작", "0 9 * * mon")
+        self.assertEqual(result["회의"]["cron"], "0 9 * * mon")
+        self.assertIn("회의", await reminder.run("list"))
+        self.assertEqual(await ReminderFunction(2, schedule).run("list"), {})
+        await reminder.run("delete", "회의")
+        self.assertEqual(len(schedule), 0)
+
+    async def test_channel_limit(self):
+        schedule = Schedule(self.path, max_per_channel=2)
+        schedule.create_schedule("a", "알림", "* * * * *", channel_id=1)
+        schedule.create_schedule("b", "알림", "* * * * *", channel_id=1)
+        with self.assertRaises(ValueError):
+            schedule.create_schedule("c", "알림", "* * * * *", channel_id=1)
+        # 수정은 개수를 늘리지 않고, 다른 채널은 따로 셈
+        schedule.update_schedule("a", "수정", "0 9 * * *", channel_id=1)
+        schedule.create_schedule("a", "알림", "* * * * *", channel_id=2)
+        await schedule.close()
+
+        schedule = Schedule(self.path, max_per_channel=2)
+        with self.assertRaises(ValueError):
+            schedule.create_schedule("c", "알림", "* * * * *", channel_id=1)
+        schedule.delete_schedule("a", channel_id=1)
+        schedule.create_schedule("c", "알림", "* * * * *", channel_id=1)
+        self.assertEqual(list(schedule.list_schedule(1)), ["b", "c"])
+        self.assertEqual(list(schedule.list_schedule(2)), ["a"])
+        await schedule.close()
+
+    async def test_write_in_thread(self):
+        schedule = Schedule(self.path)
+        schedule.create_schedule("a", "알림", "0 9 * * *", channel_id=1)
+        schedule.delete_schedule("a", channel_id=1)
+        schedule.create_schedule("b", "알림", "0 9 * * *", channel_id=1)
+        # 기록은 이벤트 루프가 아닌 스레드에서 순서대로 실행됨
+        self.assertEqual(len(schedule.pending), 3)
+        await schedule.writer
+        self.assertEqual(len(schedule.pending), 0)
+        con = sqlite3.connect(self.path)
+        rows = con.execute("SELECT name FROM schedules").fetchall()
+        con.close()
+        self.assertEqual(rows, [("b",)])
+        await schedule.close()
@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from unittest import IsolatedAsyncioTestCase
+from GPT import schedulepool
+from GPT.function import ScheduleFunction
+
+
+class SchedulePoolTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.pool = schedulepool.SchedulePool(self.temp_dir.name, max_open=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.temp_dir.cleanup()
+
+    async def test_durable(self):
+        schedule = ScheduleFunction(1, self.pool)
+        await schedule.run("CREATE TABLE schedule (name TEXT)")
+        await schedule.run("INSERT INTO schedule VALUES ('회의')")
+        self.pool.close()
+        pool = schedulepool.SchedulePool(self.temp_dir.name)
+        schedule = ScheduleFunction(1, pool)
+        self.assertEqual(await schedule.run("SELECT name FROM schedule"), "[('회의',)]")
+        other = ScheduleFunction(2, pool)
+        with self.assertRaises(sqlite3.OperationalError):
+            await other.run("SELECT name FROM schedule")
+        pool.close()
+
+    async def test_cross_channel_attach(self):
+        schedule = ScheduleFunction(1, self.pool)
+        await schedule.run("CREATE TABLE schedule (name TEXT)")
+        await schedule.run("INSERT INTO schedule VALUES ('비밀')")
+        other = ScheduleFunction(2, self.pool)
+        path = os.path.join(self.temp_dir.name, "1.db")
+        with self.assertRaises(sqlite3.DatabaseError):
+            await other.run(f"ATTACH '{path}' AS o")
+        with self.assertRaises(sqlite3.OperationalError):
+            await other.run("SELECT * FROM o.schedule")
+        copy = os.path.join(self.temp_dir.name, "copy.db")
+        with self.assertRaises(sqlite3.DatabaseError):
+            await other.run(f"VACUUM INTO '{copy}'")
+        self.assertFalse(os.path.exists(copy))
+
+    async def test_lru(self):
+        for channel_id in range(5):
+            await ScheduleFunction(channel_id, self.pool).run("SELECT 1")
+        self.assertEqual(list(self.pool.connections), [3, 4])
+        await ScheduleFunction(0, self.pool).run("SELECT 1")
+        self.assertEqual(list(self.pool.connections), [4, 0])
+        with self.pool.connection(4) as con:
+            await ScheduleFunction(1, self.pool).run("SELECT 1")
+            await ScheduleFunction(2, self.pool).run("SELECT 1")
+            self.assertIn(4, self.pool.connections)
+            self.assertEqual(con.execute("SELECT 1").fetchone(), (1,))
+
+    async def test_release_drops_lock(self):
+        for channel_id in range(3):
+            schedule = ScheduleFunction(channel_id, self.pool)
+            await schedule.run("SELECT 1")
+            schedule.close()
+        self.assertEqual(self.pool.locks, {})
+        self.assertEqual(self.pool.busy, set())
+
+        # 잠금이 지워지는 동안 기다리던 쿼리도 순서대로 실행됨
+        results = []
+
+        def run_query(index: int):
+            with self.pool.connection(1) as con:
+                results.append(con.execute("SELECT ?", (index,)).fetchone()[0])
+
+        threads = [threading.Thread(target=run_query, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        self.pool.release(1)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), list(range(20)))
+
+    def test_reject_none_channel(self):
+        with self.assertRaises(ValueError):
+            with self.pool.connection(None):
+                pass
+        memory_pool = schedulepool.SchedulePool(directory=None)
+        with memory_pool.connection(None) as con:
+            self.assertEqual(con.execute("SELECT 1").fetchone(), (1,))
+        memory_pool.close()
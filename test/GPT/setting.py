@@ -21,6 +21,7 @@ class SettingTests(TestCase):
         self.assertEqual(self.setting.temperature, 1.0)
         self.assertEqual(self.setting.top_p, 1.0)
         self.assertEqual(self.setting.keep_min, 10)
+        self.assertEqual(self.setting.history_mode, setting.Setting.DROP)
 
     def test_set_value(self):
         self.setting.set_setting("model", "abcd")
@@ -0,0 +1,79 @@
+import json
+import random
+from unittest import TestCase, IsolatedAsyncioTestCase
+from GPT import chat
+from GPT.sse import SSEDecoder
+
+
+def make_stream(contents: list[str]) -> bytes:
+    events = [": keep-alive\n\n"]
+    for content in contents:
+        data = {"choices": [{"index": 0, "delta": {"content": content}}]}
+        events.append(f"data: {json.dumps(data, ensure_ascii=False)}\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode("utf-8")
+
+
+def split_randomly(data: bytes, seed: int) -> list[bytes]:
+    rand = random.Random(seed)
+    chunks = []
+    while data:
+        size = rand.randint(1, 16)
+        chunks.append(data[:size])
+        data = data[size:]
+    return chunks
+
+
+class FakeResponse:
+    def __init__(self, chunks: list[bytes]):
+        self.chunks = chunks
+
+    async def aiter_bytes(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class SSEDecoderTests(TestCase):
+    contents = ["안녕", "하세요", "! ", "오늘 날씨는 ", "맑아요 ☀️"]
+
+    def test_random_chunks(self):
+        stream = make_stream(self.contents)
+        for seed in range(50):
+            decoder = SSEDecoder()
+            events = []
+            for chunk in split_randomly(stream, seed):
+                events.extend(decoder.feed(chunk))
+            events.extend(decoder.flush())
+            result = [json.loads(e)["choices"][0]["delta"]["content"] for e in events]
+            self.assertEqual(result, self.contents)
+            self.assertTrue(decoder.done)
+
+    def test_crlf_and_comment(self):
+        decoder = SSEDecoder()
+        events = decoder.feed(
+            b": ping\r\n\r\nevent: message\r\ndata: a\r\ndata: b\r\n\r\n"
+        )
+        self.assertEqual(events, ["a\nb"])
+
+    def test_done_stops_decoding(self):
+        decoder = SSEDecoder()
+        events = decoder.feed(b"data: 1\n\ndata: [DONE]\n\ndata: 2\n\n")
+        self.assertEqual(events, ["1"])
+        self.assertTrue(decoder.done)
+        self.assertEqual(decoder.feed(b"data: 3\n\n"), [])
+
+    def test_flush_without_blank_line(self):
+        decoder = SSEDecoder()
+        self.assertEqual(decoder.feed(b"data: 1"), [])
+        self.assertEqual(decoder.flush(), ["1"])
+
+
+class ChatStreamDecodeTests(IsolatedAsyncioTestCase):
+    async def test_process_stream_request(self):
+        contents = ["안녕", "하세요"]
+        stream_api = chat.ChatStream(api_key="")
+        response = FakeResponse(split_randomly(make_stream(contents), 0))
+        result = []
+        async for data in stream_api.process_stream_request(resp=response):
+            result.append(data["delta"]["content"])
+        self.assertEqual(result, contents)
@@ -0,0 +1,180 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+from GPT import gptbox
+from GPT import message
+from GPT import store
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class SQLiteStoreTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "history.db")
+        self.store = store.SQLiteStore(self.path, batch_size=3, flush_seconds=60)
+
+    async def asyncTearDown(self):
+        await self.store.close()
+        self.temp_dir.cleanup()
+
+    async def test_round_trip(self):
+        function_call = message.AssistanceMessage()
+        function_call.content = "schedule_management\n"
+        function_call.function_call = {"name": "schedule_management", "arguments": "{}"}
+        messages = [
+            message.UserMessage(content="안녕?"),
+            function_call,
+            message.FunctionMessage(name="schedule_management", content="[]"),
+            message.AssistanceMessage({"delta": {"content": "일정이 없어요."}}),
+        ]
+        for msg in messages:
+            self.store.append(1, msg)
+        loaded, last_time = self.store.load(1, 10)
+        self.assertEqual(
+            [msg.make_message() for msg in loaded],
+            [msg.make_message() for msg in messages],
+        )
+        self.assertEqual(
+            loaded[1].finish_reason, message.AssistanceMessage.FUNCTION_CALL
+        )
+        self.assertGreater(last_time, 0)
+        self.assertEqual(self.store.load(2, 10), ([], 0.0))
+
+    async def test_tool_round_trip(self):
+        tool_call = message.AssistanceMessage()
+        tool_call.content = "get_current_weather\n"
+        tool_call.tool_calls = [
+            {
+                "id": "call_0",
+                "type": "function",
+                "function": {"name": "get_current_weather", "arguments": "{}"},
+            }
+        ]
+        messages = [
+            tool_call,
+            message.ToolMessage("get_current_weather", "맑음", tool_call_id="call_0"),
+        ]
+        for msg in messages:
+            self.store.append(1, msg)
+        loaded, _ = self.store.load(1, 10)
+        self.assertEqual(
+            [msg.make_message() for msg in loaded],
+            [msg.make_message() for msg in messages],
+        )
+        self.assertEqual(loaded[0].finish_reason, message.AssistanceMessage.TOOL_CALLS)
+
+    async def test_add_tool_call_column(self):
+        path = os.path.join(self.temp_dir.name, "old.db")
+        con = sqlite3.connect(path)
+        con.execute(
+            "CREATE TABLE messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, channel_id INTEGER NOT NULL,"
+            " role TEXT NOT NULL, content TEXT NOT NULL, name TEXT,"
+            " function_call TEXT, created REAL NOT NULL)"
+        )
+        con.execute(
+            "INSERT INTO messages (channel_id, role, content, created)"
+            " VALUES (1, 'user', '안녕?', 1.0)"
+        )
+        con.commit()
+        con.close()
+        old_store = store.SQLiteStore(path)
+        loaded, last_time = old_store.load(1, 10)
+        self.assertEqual(loaded[0].content, "안녕?")
+        self.assertEqual(last_time, 1.0)
+        await old_store.close()
+
+    async def test_write_behind(self):
+        self.store.append(1, message.UserMessage(content="a"))
+        self.store.append(1, message.UserMessage(content="b"))
+        self.assertEqual(len(self.store.pending), 2)
+        self.store.append(1, message.UserMessage(content="c"))
+        await self.store.task
+        self.assertEqual(len(self.store.pending), 0)
+        count = self.store.con.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        self.assertEqual(count, 3)
+
+    async def test_recent_window_and_clear(self):
+        for i in range(10):
+            self.store.append(1, message.UserMessage(content=str(i)))
+        self.store.clear(2)
+        loaded, _ = self.store.load(1, 3)
+        self.assertEqual([msg.content for msg in loaded], ["7", "8", "9"])
+        self.store.clear(1)
+        self.assertEqual(self.store.load(1, 3), ([], 0.0))
+
+    async def test_prune_old_messages(self):
+        conversation_store = store.SQLiteStore(
+            os.path.join(self.temp_dir.name, "prune.db"), keep=5
+        )
+        for i in range(12):
+            conversation_store.append(1, message.UserMessage(content=str(i)))
+            conversation_store.append(2, message.UserMessage(content=str(i)))
+        conversation_store.flush()
+        # 채널마다 최근 keep 개만 남음
+        rows = conversation_store.con.execute(
+            "SELECT channel_id, COUNT(*) FROM messages GROUP BY channel_id"
+        ).fetchall()
+        self.assertEqual(rows, [(1, 5), (2, 5)])
+        loaded, _ = conversation_store.load(1, 100)
+        self.assertEqual([msg.content for msg in loaded], ["7", "8", "9", "10", "11"])
+        await conversation_store.close()
+
+
+class RehydrateTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.api_key = os.environ["OPENAI_API_KEY"]
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "history.db")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    async def test_evict_and_restart(self):
+        gpt_container = gptbox.GPTBox(
+            self.api_key, max_channels=1, store=store.SQLiteStore(self.path)
+        )
+        gpt = gpt_container.get_gpt(0)
+        await gpt.load_history()
+        gpt.message_box.add_message(message.UserMessage(content="안녕?"))
+        gpt_container.get_gpt(1)
+        self.assertEqual(len(gpt.message_box), 0)
+        gpt = gpt_container.get_gpt(0)
+        await gpt.load_history()
+        self.assertEqual(gpt.message_box[0].content, "안녕?")
+        await gpt_container.close()
+
+        gpt_container = gptbox.GPTBox(self.api_key, store=store.SQLiteStore(self.path))
+        gpt = gpt_container.get_gpt(0)
+        await gpt.load_history()
+        self.assertEqual(len(gpt.message_box), 1)
+        gpt.clear_history()
+        await gpt_container.close()
+
+        gpt_container = gptbox.GPTBox(self.api_key, store=store.SQLiteStore(self.path))
+        gpt = gpt_container.get_gpt(0)
+        await gpt.load_history()
+        self.assertEqual(len(gpt.message_box), 0)
+        await gpt_container.close()
+
+    async def test_lazy_load(self):
+        conversation_store = store.SQLiteStore(self.path)
+        for i in range(3):
+            conversation_store.append(0, message.UserMessage(content=str(i)))
+        gpt_container = gptbox.GPTBox(self.api_key, store=conversation_store)
+        with patch.object(
+            conversation_store, "load", wraps=conversation_store.load
+        ) as mock_load:
+            gpt = gpt_container.get_gpt(0)
+            # 채널을 만들 때는 저장소를 읽지 않음
+            mock_load.assert_not_called()
+            await asyncio.gather(*(gpt.load_history() for _ in range(3)))
+            await gpt.load_history()
+        mock_load.assert_called_once()
+        self.assertEqual([msg.content for msg in gpt.message_box], ["0", "1", "2"])
+        await gpt_container.close()
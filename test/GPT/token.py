@@ -1,5 +1,8 @@
 import os
+import threading
+import time
 from unittest import TestCase, IsolatedAsyncioTestCase
+from unittest.mock import Mock, patch
 from GPT import chat
 from GPT import setting
 from GPT import gpt
@@ -10,7 +13,10 @@ from GPT import message
 class TokenTests(TestCase):
     data1 = {"delta": {"role": "user", "content": "안녕? "}, "finish_reason": "null"}
     data2 = {"delta": {"role": "user", "content": "아이 졸려"}, "finish_reason": "stop"}
-    data3 = {"delta": {"role": "user", "content": "안녕? 아이 졸려"}, "finish_reason": "stop"}
+    data3 = {
+        "delta": {"role": "user", "content": "안녕? 아이 졸려"},
+        "finish_reason": "stop",
+    }
 
     def setUp(self):
         self.setting = setting.Setting()
@@ -34,3 +40,108 @@ class TokenTests(TestCase):
             self.message, self.setting.model
         )
         self.assertEqual(token_num, 47)
+
+
+class EncodingRegistryTests(TestCase):
+    def setUp(self):
+        self.encodings = token.Tokener.encodings
+        token.Tokener.encodings = {}
+
+    def tearDown(self):
+        token.Tokener.encodings = self.encodings
+
+    def test_load_once_per_model(self):
+        def slow_load(model):
+            time.sleep(0.01)
+            return Mock(name=model)
+
+        with patch.object(
+            token.Tokener, "load_encoding", side_effect=slow_load
+        ) as mock_load:
+            results = []
+            threads = [
+                threading.Thread(
+                    target=lambda model: results.append(
+                        token.Tokener.get_encoding(model)
+                    ),
+                    args=(f"model-{i % 2}",),
+                )
+                for i in range(10)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            token.Tokener.preload(["model-0", "model-1"])
+        self.assertEqual(mock_load.call_count, 2)
+        self.assertEqual(len(set(map(id, results))), 2)
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        self.cache = token.TokenCache(max_size=2)
+
+    def test_lru(self):
+        key1 = self.cache.make_key("cl100k_base", "a")
+        key2 = self.cache.make_key("cl100k_base", "b")
+        key3 = self.cache.make_key("p50k_base", "a")
+        self.assertNotEqual(key1, key3)
+        self.cache.put(key1, 1)
+        self.cache.put(key2, 2)
+        self.assertEqual(self.cache.get(key1), 1)
+        self.cache.put(key3, 3)
+        self.assertIsNone(self.cache.get(key2))
+        self.assertEqual(self.cache.get(key3), 3)
+        self.assertEqual(len(self.cache), 2)
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+
+    def test_shared_count(self):
+        encoding = Mock()
+        encoding.name = "cl100k_base"
+        encoding.encode_ordinary.side_effect = lambda value: value.split()
+        with patch.object(token.Tokener, "cache", self.cache):
+            for _ in range(3):
+                count = token.Tokener.num_tokens_of_text("a b c", encoding)
+                self.assertEqual(count, 3)
+        self.assertEqual(encoding.encode_ordinary.call_count, 1)
+        self.assertEqual(self.cache.hits, 2)
+
+
+class BatchTokenTests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.encoding = Mock()
+        self.encoding.name = "test"
+        self.encoding.encode_ordinary.side_effect = lambda value: value.split()
+        self.encoding.encode_ordinary_batch.side_effect = lambda values, num_threads: [
+            value.split() for value in values
+        ]
+        self.messages = [
+            {"role": "user", "content": "a b c"},
+            {"role": "function", "content": "d e", "name": "f"},
+        ]
+
+    async def test_batch_same_as_single(self):
+        with patch.object(token.Tokener, "get_encoding", return_value=self.encoding):
+            with patch.object(token.Tokener, "cache", token.TokenCache()):
+                single = [
+                    token.Tokener.num_tokens_of_message(message)
+                    for message in self.messages
+                ]
+            with patch.object(token.Tokener, "cache", token.TokenCache()):
+                batch = token.Tokener.num_tokens_of_messages(self.messages)
+        self.assertEqual(single, [8, 7])
+        self.assertEqual(single, batch)
+
+    async def test_offload_large_messages(self):
+        messages = [{"role": "user", "content": "a " * token.Tokener.BATCH_THRESHOLD}]
+        with patch.object(token.Tokener, "get_encoding", return_value=self.encoding):
+            with patch.object(token.Tokener, "cache", token.TokenCache()):
+                num_tokens = await token.Tokener.async_num_tokens_from_messages(
+                    messages
+                )
+        self.assertEqual(num_tokens, 4 + 1 + token.Tokener.BATCH_THRESHOLD + 2)
+        self.encoding.encode_ordinary_batch.assert_called_once()
+        self.encoding.encode_ordinary.assert_not_called()
@@ -1,2 +1,3 @@
+from .edit import *
 from .gpt_control import *
 from .utils import *
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, Mock
+from bot.edit import EditScheduler
+
+
+class EditSchedulerTests(IsolatedAsyncioTestCase):
+    def make_message(self, channel_id: int = 1) -> Mock:
+        message = Mock()
+        message.channel.id = channel_id
+        message.edit = AsyncMock()
+        return message
+
+    async def test_coalesce_edits(self):
+        scheduler = EditScheduler(min_interval=0.1, window=0.1)
+        message = self.make_message()
+        stream = scheduler.open(message)
+        text = ""
+        for index in range(50):
+            text += f"{index} "
+            stream.update(text)
+            await asyncio.sleep(0.01)
+        start = time.monotonic()
+        await stream.finish(text + "끝")
+        self.assertLess(time.monotonic() - start, 0.05)
+        # 중간 내용은 건너뛰고 마지막 내용은 바로 보냄
+        self.assertLessEqual(message.edit.await_count, 8)
+        self.assertGreater(scheduler.coalesced, 40)
+        self.assertEqual(message.edit.call_args.kwargs["content"], text + "끝")
+        self.assertEqual(scheduler.stats()["streams"], 0)
+
+        await stream.finish()
+        stream.update("after")
+        self.assertEqual(message.edit.call_args.kwargs["content"], text + "끝")
+
+    async def test_adaptive_interval(self):
+        scheduler = EditScheduler(min_interval=0.5, global_per_second=4.0)
+        streams = [scheduler.open(self.make_message(1)) for _ in range(3)]
+        # 5초에 5번인 채널 제한을 세 스트림이 나눠 씀
+        self.assertAlmostEqual(scheduler.get_interval(1), 3.0)
+        for channel_id in range(2, 10):
+            scheduler.open(self.make_message(channel_id))
+        self.assertAlmostEqual(scheduler.get_interval(2), 11 / 4.0)
+
+        scheduler.update_from_headers(
+            1,
+            200,
+            {
+                "X-RateLimit-Limit": "10",
+                "X-RateLimit-Remaining": "9",
+                "X-RateLimit-Reset-After": "2.0",
+            },
+        )
+        self.assertAlmostEqual(scheduler.get_bucket(1).interval(), 0.2)
+        # 전체 스트림 수에 맞춘 간격이 더 길어서 그 간격을 사용
+        self.assertAlmostEqual(scheduler.get_interval(1), 11 / 4.0)
+        scheduler.update_from_headers(
+            1,
+            200,
+            {
+                "X-RateLimit-Limit": "10",
+                "X-RateLimit-Remaining": "0",
+                "X-RateLimit-Reset-After": "1.5",
+            },
+        )
+        self.assertGreater(scheduler.get_delay(streams[0]), 1.4)
+        scheduler.update_from_headers(2, 429, {"Retry-After": "4"})
+        self.assertGreater(scheduler.get_bucket(2).wait_time(time.monotonic()), 3.9)
+        self.assertEqual(scheduler.rate_limited, 1)
+        # 스트림이 없는 채널의 응답은 무시
+        scheduler.update_from_headers(100, 429, {"Retry-After": "4"})
+        self.assertNotIn(100, scheduler.buckets)
+
+    async def test_long_reply_without_flush(self):
+        scheduler = EditScheduler(min_interval=10.0)
+        message = self.make_message()
+        stream = scheduler.open(message)
+        stream.update("first")
+        await asyncio.sleep(0)
+        stream.update("second")
+        await stream.finish(flush=False)
+        self.assertEqual(message.edit.await_count, 1)
+        self.assertEqual(message.edit.call_args.kwargs["content"], "first")
+
+    async def test_finish_drops_bucket(self):
+        scheduler = EditScheduler(min_interval=0.1)
+        first = scheduler.open(self.make_message(1))
+        second = scheduler.open(self.make_message(1))
+        first.update("first")
+        await first.finish("done")
+        # 같은 채널에 다른 스트림이 남아 있으면 버킷을 유지
+        self.assertIn(1, scheduler.buckets)
+        await second.finish("done")
+        self.assertEqual(scheduler.buckets, {})
+        self.assertEqual(scheduler.streams, {})
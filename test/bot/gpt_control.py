@@ -44,13 +44,13 @@ class GptControlTests(IsolatedAsyncioTestCase):
         self.msg.add_files.assert_called()
 
     async def test_config(self):
-        setting_text = '```{\n  "model": "gpt-3.5-turbo-0613",\n  "system_text": "",\n  "max_token": 3000,\n  "temperature": 1.0,\n  "top_p": 1.0,\n  "keep_min": 10\n}```'
+        setting_text = '```{\n  "model": "gpt-3.5-turbo-0613",\n  "system_text": "",\n  "max_token": 3000,\n  "temperature": 1.0,\n  "top_p": 1.0,\n  "keep_min": 10,\n  "history_mode": "drop"\n}```'
         handler = gpt_control.ConfigHandler(self.discord_message)
         await handler.run()
         self.assertEqual(self.discord_message.reply.call_args.args[0], setting_text)
 
     async def test_get_config(self):
-        setting_list = '```{\n  "model": "gpt-3.5-turbo-0613",\n  "system_text": "",\n  "max_token": 3000,\n  "temperature": 1.0,\n  "top_p": 1.0,\n  "keep_min": 10\n}```'
+        setting_list = '```{\n  "model": "gpt-3.5-turbo-0613",\n  "system_text": "",\n  "max_token": 3000,\n  "temperature": 1.0,\n  "top_p": 1.0,\n  "keep_min": 10,\n  "history_mode": "drop"\n}```'
         setting_list = {
             "model": '```"gpt-3.5-turbo-0613"```',
             "system_text": '```""```',
@@ -58,6 +58,7 @@ class GptControlTests(IsolatedAsyncioTestCase):
             "temperature": "```1.0```",
             "top_p": "```1.0```",
             "keep_min": "```10```",
+            "history_mode": '```"drop"```',
         }
         handler = gpt_control.ConfigHandler(self.discord_message)
         for key, value in setting_list.items():